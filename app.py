@@ -9,9 +9,12 @@ import os
 from models import db, User, Item, Notification, ImageEmbedding, Match
 from modules.auth import auth_bp
 from modules.reporting import reporting_bp
-from modules.matching_simple import matching_engine
+from modules.match_store import is_match_for_user
 from modules.admin import admin_bp
 from modules.messaging import messaging_bp
+from modules.jobs import start_job_workers
+from modules.pipeline import warm_up_visual_engine
+from modules.matching_simple import matching_engine
 from config import Config # Import your config file
 
 # Initialize Flask app
@@ -19,6 +22,8 @@ app = Flask(__name__)
 
 # ✅ CORRECT: Load configuration from config.py (PostgreSQL)
 app.config.from_object(Config)
+# Fail at startup if TEXT_INDEX_BACKEND scores a different measure than TEXT_MATCHING_ENGINE
+matching_engine.check_index_backend(app.config.get('TEXT_INDEX_BACKEND'))
 
 # Ensure upload folder exists
 # (You can also move this logic to config.py if you want, but it's fine here)
@@ -393,19 +398,8 @@ def debug_notifications():
 def view_item(item_id):
     item = Item.query.get_or_404(item_id)
     
-    is_potential_match = False
-    user_items = Item.query.filter_by(owner_id=current_user.user_id).all()
-
-    for user_item in user_items:
-        # Check if types are opposite (Lost vs Found)
-        if user_item.item_type != item.item_type:
-            # Calculate image similarity
-            similarity_score = matching_engine.calculate_similarity(user_item, item)
-            
-            # Check against threshold
-            if similarity_score >= matching_engine.similarity_threshold:
-                is_potential_match = True
-                break
+    # Scored by the matching pipeline when either item was reported
+    is_potential_match = is_match_for_user(item, current_user.user_id)
     
     return render_template('item_details.html', item=item, is_potential_match=is_potential_match)
 
@@ -521,6 +515,14 @@ if __name__ == '__main__':
             db.session.commit()
             print("📍 Default locations seeded!")
         
+    # Background matching jobs. With debug=True the reloader runs this file twice: a
+    # watcher parent and the child that serves requests (WERKZEUG_RUN_MAIN set).
+    # Only the serving process starts workers and loads the model.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_job_workers(app)
+        warm_up_visual_engine(app)
+    
+    with app.app_context():
         print("=" * 50)
         print("🎓 Campus Lost & Found Application - UNIFIED VERSION")
         print("✅ Database initialized successfully!")
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from app import app
+from models import db, Item, ImageEmbedding
+from modules.ai_processing import ImageRecognitionEngine, image_engine, HISTOGRAM_MODEL
+from modules.embedding_codec import decode_embedding, encode_embedding
+from modules.visual_index import PartitionedIndex
+from modules.image_hash import compute_phash, hash_to_hex
+
+DEFAULT_CHECKPOINT = os.path.join('instance', 'backfill_checkpoint.json')
+
+# ===== WORKER PROCESS =====
+_worker_engine = None
+
+def _init_worker(inference_backend, backbone, threads):
+    """Build one engine per process and split the CPU between processes"""
+    global _worker_engine
+    import torch
+    torch.set_num_threads(threads)
+    _worker_engine = ImageRecognitionEngine(inference_backend=inference_backend, backbone=backbone)
+    _worker_engine.warm_up()
+
+def _embed_chunk(chunk, batch_size):
+    """Embed [(item_id, path), ...] and return [(item_id, features or None), ...]"""
+    paths = [path for _, path in chunk]
+    features = _worker_engine.extract_features_batch(paths, batch_size=batch_size, num_workers=2)
+    return [(item_id, vector) for (item_id, _), vector in zip(chunk, features)]
+
+# ===== CHECKPOINT =====
+def load_checkpoint(path, model_tag):
+    if os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('model') == model_tag:
+            return checkpoint
+        print(f"ℹ️ Checkpoint is for model '{checkpoint.get('model')}', starting over")
+    return {'model': model_tag, 'completed_through': 0, 'failed': [], 'embedded': 0}
+
+def save_checkpoint(path, checkpoint):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+# ===== MAIN PROCESS =====
+def find_work(model_tag, upload_dir, after_id, force, skip_ids):
+    """Items with an image whose embedding is missing or from another model, in id order"""
+    rows = db.session.query(
+        Item.item_id, Item.item_image_path, ImageEmbedding.image_embedding_data
+    ).outerjoin(ImageEmbedding, ImageEmbedding.item_id == Item.item_id).filter(
+        Item.item_image_path.isnot(None),
+        Item.item_id > after_id
+    ).order_by(Item.item_id).yield_per(1000)
+
+    work, missing_files = [], 0
+    for item_id, image_path, data in rows:
+        if item_id in skip_ids:
+            continue
+        if data and not force and decode_embedding(data)[1].model == model_tag:
+            continue
+        path = os.path.join(upload_dir, image_path)
+        if not os.path.exists(path):
+            missing_files += 1
+            continue
+        work.append((item_id, path))
+    return work, missing_files
+
+def write_results(results, store=None):
+    """Single writer: upsert one chunk of embeddings in one transaction (and into the shared store)"""
+    found = [(item_id, vector) for item_id, vector in results if vector is not None]
+    existing = {
+        row.item_id: row for row in
+        ImageEmbedding.query.filter(ImageEmbedding.item_id.in_([item_id for item_id, _ in found]))
+    } if found else {}
+    for item_id, vector in found:
+        data = image_engine.encode_features(vector)
+        if item_id in existing:
+            existing[item_id].image_embedding_data = data
+        else:
+            db.session.add(ImageEmbedding(item_id=item_id, image_embedding_data=data))
+    db.session.commit()
+    
+    if store is not None and found:
+        # Running workers read the shared store, so update it in place rather than deleting it
+        partitions = dict(
+            (item_id, (item_type, item_status)) for item_id, item_type, item_status in
+            db.session.query(Item.item_id, Item.item_type, Item.item_status).filter(
+                Item.item_id.in_([item_id for item_id, _ in found]))
+        )
+        store.upsert_many([
+            (item_id, image_engine._query_vector(vector), partitions[item_id])
+            for item_id, vector in found if item_id in partitions
+        ])
+    return len(found), [item_id for item_id, vector in results if vector is None]
+
+def backfill_histograms(upload_dir):
+    """Colour histograms for the prefilter; cheap (no model), so done in this process"""
+    rows = db.session.query(Item.item_id, Item.item_image_path).outerjoin(
+        ImageEmbedding, ImageEmbedding.item_id == Item.item_id
+    ).filter(
+        Item.item_image_path.isnot(None),
+        ImageEmbedding.image_embedding_histogram.is_(None)
+    ).order_by(Item.item_id).all()
+    print(f"🎨 {len(rows)} items need a colour histogram")
+
+    done = 0
+    for start in range(0, len(rows), 200):
+        chunk = rows[start:start + 200]
+        existing = {
+            row.item_id: row for row in
+            ImageEmbedding.query.filter(ImageEmbedding.item_id.in_([item_id for item_id, _ in chunk]))
+        }
+        for item_id, image_path in chunk:
+            path = os.path.join(upload_dir, image_path)
+            if not os.path.exists(path):
+                continue
+            histogram = image_engine.extract_histogram(path)
+            if histogram is None:
+                continue
+            data = encode_embedding(histogram, np.float16, 0, HISTOGRAM_MODEL)
+            if item_id in existing:
+                existing[item_id].image_embedding_histogram = data
+            else:
+                db.session.add(ImageEmbedding(item_id=item_id, image_embedding_histogram=data))
+            done += 1
+        db.session.commit()
+    print(f"✅ Stored {done} histograms")
+
+def backfill_image_hashes(upload_dir):
+    """Perceptual hashes for the duplicate check on items reported before it existed"""
+    items = Item.query.filter(Item.item_image_path.isnot(None), Item.item_image_hash.is_(None)).order_by(Item.item_id).all()
+    print(f"#️⃣ {len(items)} items need an image hash")
+    done = 0
+    for item in items:
+        path = os.path.join(upload_dir, item.item_image_path)
+        if not os.path.exists(path):
+            continue
+        image_hash = compute_phash(path)
+        if image_hash is not None:
+            item.item_image_hash = hash_to_hex(image_hash)
+            done += 1
+    db.session.commit()
+    print(f"✅ Stored {done} image hashes")
+
+def backfill(args):
+    with app.app_context():
+        backend = app.config.get('AI_INFERENCE_BACKEND', 'eager')
+        model_tag = image_engine.model_tag
+        checkpoint = {'model': model_tag, 'completed_through': 0, 'failed': [], 'embedded': 0}
+        if not args.restart:
+            checkpoint = load_checkpoint(args.checkpoint, model_tag)
+        skip_ids = set() if args.retry_failed else set(checkpoint['failed'])
+        if args.retry_failed:
+            checkpoint['failed'] = []
+
+        upload_dir = app.config.get('UPLOAD_FOLDER', 'static/uploads')
+        if args.histograms:
+            backfill_histograms(upload_dir)
+        if args.image_hashes:
+            backfill_image_hashes(upload_dir)
+        work, missing_files = find_work(model_tag, upload_dir, checkpoint['completed_through'], args.force, skip_ids)
+        print(f"🔍 {len(work)} images to embed with '{model_tag}' ({missing_files} image files missing on disk)")
+        if not work:
+            return
+
+        store = None
+        if app.config.get('VISUAL_INDEX_BACKEND') == 'mmap':
+            store = image_engine._create_index()
+            if not store.load():
+                store = None  # built from the table on next start
+        
+        chunks = [work[i:i + args.chunk_size] for i in range(0, len(work), args.chunk_size)]
+        workers = args.workers or max(1, (os.cpu_count() or 2) // 2)
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+        done_chunks = set()
+        next_chunk = 0  # lowest chunk not yet completed, for the checkpoint watermark
+        embedded = failed = 0
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(backend, model_tag, threads)) as pool:
+            pending = {}
+            submitted = 0
+            while submitted < len(chunks) or pending:
+                # Keep a bounded number of chunks in flight
+                while submitted < len(chunks) and len(pending) < workers * 2:
+                    pending[pool.submit(_embed_chunk, chunks[submitted], args.batch_size)] = submitted
+                    submitted += 1
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk_number = pending.pop(future)
+                    chunk_embedded, chunk_failed = write_results(future.result(), store)
+                    embedded += chunk_embedded
+                    failed += len(chunk_failed)
+                    checkpoint['failed'].extend(chunk_failed)
+                    checkpoint['embedded'] += chunk_embedded
+                    done_chunks.add(chunk_number)
+
+                # Everything up to the first unfinished chunk is safely written
+                while next_chunk in done_chunks:
+                    checkpoint['completed_through'] = chunks[next_chunk][-1][0]
+                    next_chunk += 1
+                save_checkpoint(args.checkpoint, checkpoint)
+
+                elapsed = time.perf_counter() - start
+                processed = embedded + failed
+                print(f"   {processed}/{len(work)} images, {processed / elapsed:.1f} images/sec, {failed} failed")
+
+        elapsed = time.perf_counter() - start
+        print(f"✅ Embedded {embedded} images in {elapsed:.1f}s ({(embedded + failed) / elapsed:.1f} images/sec), {failed} failed")
+
+        # A persisted visual index may hold the old vectors; it is rebuilt on next load
+        index_path = app.config.get('VISUAL_INDEX_PATH')
+        if embedded and index_path:
+            PartitionedIndex.delete_saved(index_path)
+
+        if next_chunk == len(chunks):
+            # Finished cleanly: only the failures need remembering
+            checkpoint['completed_through'] = 0
+            save_checkpoint(args.checkpoint, checkpoint)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='(Re)compute image embeddings for items that are missing them or have a stale model')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: half the CPUs)')
+    parser.add_argument('--batch-size', type=int, default=16, help='Images per forward pass')
+    parser.add_argument('--chunk-size', type=int, default=64, help='Images per task / commit')
+    parser.add_argument('--force', action='store_true', help='Re-embed every image, even up-to-date ones')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint')
+    parser.add_argument('--retry-failed', action='store_true', help='Retry images that failed in earlier runs')
+    parser.add_argument('--histograms', action='store_true', help='Also compute missing colour histograms for the prefilter')
+    parser.add_argument('--image-hashes', action='store_true', help='Also compute missing perceptual hashes for duplicate detection')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    backfill(parser.parse_args())
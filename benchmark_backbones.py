@@ -0,0 +1,138 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import time
+from itertools import combinations
+import numpy as np
+from modules.ai_processing import ImageRecognitionEngine, BACKBONES
+
+# Uploads known to show the same object (lost report / found report)
+KNOWN_PAIRS = [
+    ('7_denim', '8_denim1'),
+    ('3_chain', '4_chain1'),
+    ('12_wbag', '13_wbag1'),
+    ('5_smartwatch', '6_swatch'),
+    ('20_marvin', '21_marvin'),
+    ('26_iphone17b', '27_iphone17a'),
+]
+
+def find_images(image_dir):
+    """Map file stem -> path for every image in the directory"""
+    paths = {}
+    for path in sorted(glob.glob(os.path.join(image_dir, '*'))):
+        if path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')):
+            paths[os.path.splitext(os.path.basename(path))[0]] = path
+    return paths
+
+def run_backbone(backbone, inference_backend, paths, repeats):
+    """Runs in a fresh process so peak RSS belongs to this backbone alone"""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    engine = ImageRecognitionEngine(inference_backend=inference_backend, backbone=backbone)
+    start = time.perf_counter()
+    if not engine.warm_up():
+        return None
+    load_s = time.perf_counter() - start
+
+    # Untimed pass: warms caches and gives us the features
+    features = [engine.extract_features(path) for path in paths]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for path in paths:
+            engine.extract_features(path)
+    ms_per_image = (time.perf_counter() - start) / (repeats * len(paths)) * 1000
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    return {
+        'load_s': load_s,
+        'ms_per_image': ms_per_image,
+        'peak_rss_mb': peak_rss_mb,
+        'model_rss_mb': peak_rss_mb - rss_before / 1024,
+        'backend': engine.inference_backend,
+        'features': features,
+    }
+
+def evaluate(stems, features, positives, threshold):
+    """Precision/recall at a cosine threshold, recall@1 and the best-F1 threshold"""
+    vectors = np.stack(features).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarity = vectors @ vectors.T
+    index = {stem: i for i, stem in enumerate(stems)}
+
+    scores, labels = [], []
+    for a, b in combinations(range(len(stems)), 2):
+        scores.append(similarity[a, b])
+        labels.append(frozenset((stems[a], stems[b])) in positives)
+    scores, labels = np.array(scores), np.array(labels)
+
+    def precision_recall(t):
+        predicted = scores >= t
+        true_positives = int(np.sum(predicted & labels))
+        precision = true_positives / max(int(np.sum(predicted)), 1)
+        recall = true_positives / max(int(np.sum(labels)), 1)
+        return precision, recall
+
+    precision, recall = precision_recall(threshold)
+
+    best_f1, best_threshold = 0.0, threshold
+    for t in np.unique(scores[labels]):
+        p, r = precision_recall(t)
+        f1 = 2 * p * r / (p + r) if p + r else 0.0
+        if f1 > best_f1:
+            best_f1, best_threshold = f1, float(t)
+
+    # For each image in a known pair: is its partner the nearest other image?
+    hits = total = 0
+    for pair in positives:
+        for stem in pair:
+            (partner,) = pair - {stem}
+            row = similarity[index[stem]].copy()
+            row[index[stem]] = -np.inf
+            hits += int(np.argmax(row) == index[partner])
+            total += 1
+
+    return precision, recall, hits / max(total, 1), best_threshold, best_f1
+
+def benchmark_backbones(args):
+    images = find_images(args.image_dir)
+    positives = {frozenset(pair) for pair in KNOWN_PAIRS if all(stem in images for stem in pair)}
+    if not positives:
+        print(f"❌ None of the known pairs were found in {args.image_dir}")
+        return
+    stems = list(images)
+    paths = [images[stem] for stem in stems]
+
+    print(f"🧪 {len(paths)} images, {len(positives)} known pairs, {len(stems) * (len(stems) - 1) // 2 - len(positives)} negative pairs")
+    print(f"   threshold {args.threshold:.2f}, {args.repeats} timed passes, {args.inference_backend} backend")
+    print(f"{'backbone':<20} | {'dim':>5} | {'load s':>6} | {'ms/image':>8} | {'peak RSS MB':>11} | "
+          f"{'precision':>9} | {'recall':>6} | {'recall@1':>8} | {'best F1 @ thr':>14}")
+    print("-" * 110)
+
+    # spawn: each backbone starts from an empty interpreter for a fair RSS reading
+    context = multiprocessing.get_context('spawn')
+    for backbone in args.backbones:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_backbone, (backbone, args.inference_backend, paths, args.repeats))
+        if result is None:
+            print(f"{backbone:<20} | model failed to load")
+            continue
+        if any(vector is None for vector in result['features']):
+            print(f"{backbone:<20} | some images could not be embedded")
+            continue
+
+        precision, recall, recall_at_1, best_threshold, best_f1 = evaluate(stems, result['features'], positives, args.threshold)
+        print(f"{backbone:<20} | {BACKBONES[backbone][2]:>5} | {result['load_s']:>6.2f} | {result['ms_per_image']:>8.1f} | "
+              f"{result['peak_rss_mb']:>11.0f} | {precision:>9.2f} | {recall:>6.2f} | {recall_at_1:>8.2f} | "
+              f"{best_f1:>6.2f} @ {best_threshold:.2f}")
+        if result['backend'] != args.inference_backend:
+            print(f"   ↳ {args.inference_backend} unavailable for {backbone}, measured with {result['backend']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare image backbones on speed, memory and match quality')
+    parser.add_argument('--image-dir', default='static/uploads')
+    parser.add_argument('--backbones', nargs='+', default=list(BACKBONES), choices=list(BACKBONES))
+    parser.add_argument('--inference-backend', default='eager')
+    parser.add_argument('--threshold', type=float, default=0.60, help='Cosine threshold used by find_similar_items')
+    parser.add_argument('--repeats', type=int, default=3)
+    benchmark_backbones(parser.parse_args())
@@ -0,0 +1,86 @@
+import argparse
+import glob
+import io
+import os
+import time
+import numpy as np
+from PIL import Image
+from modules.ai_processing import ImageRecognitionEngine
+
+def synthetic_jpeg(width=4032, height=3024, quality=90):
+    """A 12 MP phone-sized JPEG with enough texture to be realistic to decode"""
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, size=(height // 16, width // 16, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def load_images(image_dir, min_megapixels):
+    images = []
+    for path in sorted(glob.glob(os.path.join(image_dir, '*'))):
+        if not path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')):
+            continue
+        with Image.open(path) as image:
+            megapixels = image.size[0] * image.size[1] / 1e6
+        if megapixels >= min_megapixels:
+            with open(path, 'rb') as f:
+                images.append((os.path.basename(path), f.read()))
+    return images
+
+def time_decode(engine, data, repeats):
+    """ms per decode+transform, and the largest decoded image in MB"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        tensor = engine._prepare_tensor(io.BytesIO(data))
+    ms = (time.perf_counter() - start) / repeats * 1000
+    image = engine._load_image(io.BytesIO(data))
+    decoded_mb = image.size[0] * image.size[1] * len(image.getbands()) / 1e6
+    return ms, decoded_mb, tensor
+
+def benchmark_decode(args):
+    images = load_images(args.image_dir, args.min_megapixels)
+    if args.synthetic or not images:
+        if not images:
+            print(f"ℹ️ No uploads of at least {args.min_megapixels} MP in {args.image_dir}, using a synthetic 12 MP JPEG")
+        images.append(('synthetic_12mp.jpg', synthetic_jpeg()))
+
+    full = ImageRecognitionEngine(fast_decode=False)
+    fast = ImageRecognitionEngine(fast_decode=True)
+    if not (full.warm_up() and fast.warm_up()):
+        print("❌ Image model could not be loaded")
+        return
+
+    print(f"🧪 {len(images)} images, {args.repeats} decodes each")
+    print(f"{'image':<24} | {'size':>11} | {'full ms':>8} | {'fast ms':>8} | {'speedup':>7} | "
+          f"{'full MB':>8} | {'fast MB':>8} | {'tensor diff':>11}" + (f" | {'cosine':>7}" if args.embed else ''))
+    print("-" * (104 + (10 if args.embed else 0)))
+
+    totals = np.zeros(4)
+    for name, data in images:
+        with Image.open(io.BytesIO(data)) as image:
+            size = f"{image.size[0]}x{image.size[1]}"
+        full_ms, full_mb, full_tensor = time_decode(full, data, args.repeats)
+        fast_ms, fast_mb, fast_tensor = time_decode(fast, data, args.repeats)
+        diff = float((full_tensor - fast_tensor).abs().mean())
+        line = (f"{name[:24]:<24} | {size:>11} | {full_ms:>8.1f} | {fast_ms:>8.1f} | {full_ms / fast_ms:>6.1f}x | "
+                f"{full_mb:>8.1f} | {fast_mb:>8.1f} | {diff:>11.4f}")
+        if args.embed:
+            a = full.extract_features(io.BytesIO(data))
+            b = fast.extract_features(io.BytesIO(data))
+            line += f" | {float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))):>7.4f}"
+        print(line)
+        totals += (full_ms, fast_ms, full_mb, fast_mb)
+
+    print("-" * (104 + (10 if args.embed else 0)))
+    print(f"✅ Mean decode+transform {totals[0] / len(images):.1f} ms -> {totals[1] / len(images):.1f} ms, "
+          f"decoded pixels {totals[2] / len(images):.1f} MB -> {totals[3] / len(images):.1f} MB per image")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare full decoding with draft/reduce decoding before Resize(256)')
+    parser.add_argument('--image-dir', default='static/uploads')
+    parser.add_argument('--min-megapixels', type=float, default=2.0, help='Only benchmark uploads at least this large')
+    parser.add_argument('--synthetic', action='store_true', help='Also include a synthetic 12 MP JPEG')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--embed', action='store_true', help='Also report cosine between full and fast-decode embeddings')
+    benchmark_decode(parser.parse_args())
@@ -0,0 +1,52 @@
+import glob
+import os
+import sys
+import time
+import numpy as np
+from modules.ai_processing import ImageRecognitionEngine, INFERENCE_BACKENDS
+
+def cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+def benchmark_inference(image_dir='static/uploads', repeats=3, backends=INFERENCE_BACKENDS):
+    paths = sorted(
+        path for path in glob.glob(os.path.join(image_dir, '*'))
+        if path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'))
+    )
+    if not paths:
+        print(f"❌ No images found in {image_dir}")
+        return
+    
+    print(f"🧪 {len(paths)} images from {image_dir}, {repeats} timed passes per backend")
+    print(f"{'backend':<14} | {'load s':>7} | {'ms/image':>9} | {'mean cos':>9} | {'min cos':>8}")
+    print("-" * 60)
+    
+    baseline = None
+    for backend in backends:
+        engine = ImageRecognitionEngine(inference_backend=backend)
+        start = time.perf_counter()
+        if not engine.warm_up():
+            print(f"{backend:<14} | model failed to load")
+            continue
+        load_s = time.perf_counter() - start
+        
+        if engine.inference_backend != backend:
+            print(f"{backend:<14} | unavailable, fell back to {engine.inference_backend}")
+            continue
+        
+        # Untimed pass: lets compile/torchscript specialise and fills caches
+        features = [engine.extract_features(path) for path in paths]
+        
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for path in paths:
+                engine.extract_features(path)
+        ms_per_image = (time.perf_counter() - start) / (repeats * len(paths)) * 1000
+        
+        if baseline is None:
+            baseline = features
+        drift = [cosine(a, b) for a, b in zip(features, baseline) if a is not None and b is not None]
+        print(f"{backend:<14} | {load_s:>7.2f} | {ms_per_image:>9.1f} | {np.mean(drift):>9.5f} | {np.min(drift):>8.5f}")
+
+if __name__ == '__main__':
+    benchmark_inference(*sys.argv[1:2])
@@ -0,0 +1,68 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from modules.ai_processing import ImageRecognitionEngine
+
+def simulate_rush(engine, paths, concurrency, requests):
+    """Fire `requests` uploads from `concurrency` threads; return per-request latencies and wall time"""
+    def one_request(i):
+        start = time.perf_counter()
+        with open(paths[i % len(paths)], 'rb') as f:
+            engine.extract_features(f)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one_request, range(requests)))
+    return np.array(latencies), time.perf_counter() - start
+
+def benchmark_scheduler(args):
+    paths = sorted(
+        path for path in glob.glob(os.path.join(args.image_dir, '*'))
+        if path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'))
+    )
+    if not paths:
+        print(f"❌ No images found in {args.image_dir}")
+        return
+
+    print(f"🧪 {args.requests} uploads per run from {len(paths)} images")
+    print(f"{'mode':<28} | {'clients':>7} | {'images/s':>8} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'mean batch':>10}")
+    print("-" * 92)
+
+    modes = [
+        ('direct (batch of one)', ImageRecognitionEngine(batch_scheduler=False)),
+        (f'scheduler ({args.max_batch_size} / {args.max_wait_ms} ms)', ImageRecognitionEngine(batch_scheduler=True)),
+    ]
+    for label, engine in modes:
+        if not engine.warm_up():
+            print("❌ Image model could not be loaded")
+            return
+        if engine.batch_scheduler:
+            engine._scheduler_options = {
+                'max_batch_size': args.max_batch_size,
+                'max_wait_ms': args.max_wait_ms,
+                'threads': args.threads,
+            }
+        simulate_rush(engine, paths, 1, min(len(paths), 4))  # warm-up
+
+        for concurrency in args.concurrency:
+            if engine._scheduler is not None:
+                engine._scheduler.batches = engine._scheduler.images = 0
+            latencies, wall = simulate_rush(engine, paths, concurrency, args.requests)
+            stats = engine.scheduler_stats()
+            mean_batch = f"{stats['mean_batch_size']:.1f}" if stats else '1.0'
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            print(f"{label:<28} | {concurrency:>7} | {args.requests / wall:>8.1f} | {p50:>7.0f} | {p95:>7.0f} | {p99:>7.0f} | {mean_batch:>10}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput and tail latency of concurrent uploads with and without micro-batching')
+    parser.add_argument('--image-dir', default='static/uploads')
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=0, help='torch threads for the scheduler (0 = torch default)')
+    benchmark_scheduler(parser.parse_args())
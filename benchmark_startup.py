@@ -0,0 +1,45 @@
+import os
+import statistics
+import subprocess
+import sys
+
+# Each scenario runs in a fresh interpreter so nothing is cached between runs
+SCENARIOS = [
+    ('import app (AI disabled)', {'AI_ENABLED': 'false'}, "import app"),
+    ('import app (AI enabled, lazy)', {'AI_ENABLED': 'true'}, "import app"),
+    ('import app + warm-up (old eager cost)', {'AI_ENABLED': 'true', 'AI_WARMUP_ON_STARTUP': 'true'},
+     "import app; from modules.pipeline import warm_up_visual_engine; warm_up_visual_engine(app.app, background=False)"),
+]
+
+TIMER = """
+import time
+_start = time.perf_counter()
+{code}
+print(time.perf_counter() - _start)
+"""
+
+def measure(env_overrides, code, runs):
+    env = dict(os.environ, **env_overrides)
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', TIMER.format(code=code)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()
+        timings.append(float(output[-1]))
+    return timings
+
+def benchmark_startup(runs=5):
+    print(f"⏱️ Cold start timings over {runs} runs each")
+    print(f"{'scenario':<42} | {'median s':>9} | {'min s':>7}")
+    print("-" * 64)
+    for label, env_overrides, code in SCENARIOS:
+        try:
+            timings = measure(env_overrides, code, runs)
+        except subprocess.CalledProcessError as e:
+            print(f"{label:<42} | failed: {e.stderr.strip().splitlines()[-1] if e.stderr else e}")
+            continue
+        print(f"{label:<42} | {statistics.median(timings):>9.3f} | {min(timings):>7.3f}")
+
+if __name__ == '__main__':
+    benchmark_startup(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
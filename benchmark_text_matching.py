@@ -0,0 +1,93 @@
+import argparse
+import gc
+import time
+import numpy as np
+from modules.text_index import TokenIndex, MinHashIndex, TfidfIndex, item_tokens, jaccard
+
+PARTITION = ('found', 'pending')
+
+CATEGORIES = ['electronics', 'clothing', 'books', 'keys', 'bags', 'wallet', 'jewelry', 'id card', 'bottle', 'other']
+LOCATIONS = ['library', 'cafeteria', 'gym', 'main hall', 'parking lot', 'science building', 'dorm a', 'dorm b',
+             'student center', 'lecture hall 2', 'bus stop', 'sports field']
+
+
+def synthetic_items(count, vocab_size, seed=0):
+    """Short lost/found style reports: long-tailed word frequencies plus a category and location"""
+    rng = np.random.default_rng(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    weights = 1.0 / (np.arange(vocab_size) + 50.0)
+    lengths = rng.integers(4, 16, size=count)
+    words = rng.choice(vocab_size, size=int(lengths.sum()), p=weights / weights.sum())
+    categories = rng.integers(0, len(CATEGORIES), size=count)
+    locations = rng.integers(0, len(LOCATIONS), size=count)
+    rows = []
+    start = 0
+    for i in range(count):
+        text = ' '.join(vocab[w] for w in words[start:start + lengths[i]])
+        start += lengths[i]
+        rows.append(item_tokens(text[:40], text[40:], CATEGORIES[categories[i]], LOCATIONS[locations[i]]))
+    return rows
+
+
+def brute_force(query, token_sets, threshold):
+    """What SimpleMatchingEngine did before indexing: score every item"""
+    return {item_id for item_id, tokens in enumerate(token_sets, start=1) if jaccard(query, tokens) >= threshold}
+
+
+def timed(index, queries, threshold):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append({item_id for item_id, _ in index.search(query, partitions=[PARTITION], threshold=threshold)})
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def benchmark(args):
+    print(f"{'items':>9} | {'engine':<28} | {'build s':>8} | {'ms/query':>9} | {'recall':>7} | {'matches/q':>9}")
+    print("-" * 86)
+    for count in args.counts:
+        token_sets = synthetic_items(count, args.vocab)
+        rng = np.random.default_rng(1)
+        # Queries are perturbed copies of stored reports so every query has true matches
+        queries = []
+        for row in rng.choice(count, size=args.queries, replace=False):
+            tokens = list(token_sets[row])
+            keep = tokens[:max(1, int(len(tokens) * rng.uniform(0.5, 1.0)))]
+            queries.append(frozenset(keep + [f"extra{rng.integers(1000)}"]))
+
+        start = time.perf_counter()
+        truth = [brute_force(query, token_sets, args.threshold) for query in queries]
+        brute_ms = (time.perf_counter() - start) / len(queries) * 1000
+        per_query = np.mean([len(expected) for expected in truth])
+        print(f"{count:>9} | {'brute force':<28} | {'-':>8} | {brute_ms:>9.2f} | {1.0:>7.3f} | {per_query:>9.1f}")
+
+        engines = [('token index', TokenIndex(), args.threshold)]
+        engines += [(f"minhash perm={num_perm}", MinHashIndex(threshold=args.threshold, num_perm=num_perm), args.threshold)
+                    for num_perm in args.num_perm]
+        # Cosine scores, so "recall" here is the share of Jaccard matches TF-IDF also returns
+        engines.append((f"tfidf cos>={args.tfidf_threshold}", TfidfIndex(), args.tfidf_threshold))
+        for label, index, threshold in engines:
+            rows = ((item_id, PARTITION, tokens) for item_id, tokens in enumerate(token_sets, start=1))
+            start = time.perf_counter()
+            index.build(rows)
+            build_s = time.perf_counter() - start
+            found, ms = timed(index, queries, threshold)
+            recall = sum(len(f & t) for f, t in zip(found, truth)) / max(sum(len(t) for t in truth), 1)
+            if isinstance(index, MinHashIndex):
+                label = f"{label} b={index.bands} r={index.rows}"
+            print(f"{count:>9} | {label:<28} | {build_s:>8.2f} | {ms:>9.2f} | {recall:>7.3f} | {per_query:>9.1f}")
+            del index
+            gc.collect()
+        engines = None
+        gc.collect()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recall and latency of the MinHash LSH text index against brute-force Jaccard')
+    parser.add_argument('--counts', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--threshold', type=float, default=0.3)
+    parser.add_argument('--vocab', type=int, default=20000)
+    parser.add_argument('--num-perm', type=int, nargs='+', default=[128, 256])
+    parser.add_argument('--tfidf-threshold', type=float, default=0.35)
+    benchmark(parser.parse_args())
@@ -0,0 +1,86 @@
+import argparse
+import time
+import numpy as np
+from modules.visual_index import EmbeddingIndex, IVFIndex
+from modules.embedding_codec import decode_embedding
+
+
+def synthetic_embeddings(count, dim, clusters, seed=0):
+    """Clustered non-negative vectors, roughly shaped like pooled ResNet features"""
+    rng = np.random.default_rng(seed)
+    centers = rng.gamma(0.5, 1.0, size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    noise = rng.gamma(0.5, 0.35, size=(count, dim)).astype(np.float32)
+    return centers[labels] + noise
+
+
+def load_db_embeddings():
+    from app import app
+    from models import ImageEmbedding
+    with app.app_context():
+        rows = ImageEmbedding.query.with_entities(ImageEmbedding.item_id, ImageEmbedding.image_embedding_data).filter(
+            ImageEmbedding.image_embedding_data.isnot(None)
+        ).all()
+    item_ids = [item_id for item_id, _ in rows]
+    vectors = np.vstack([decode_embedding(data)[0] for _, data in rows])
+    return item_ids, vectors
+
+
+def timed_search(index, queries, k):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append([item_id for item_id, _ in index.search(query, k=k)])
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(queries) * 1000
+
+
+def benchmark(args):
+    if args.from_db:
+        item_ids, vectors = load_db_embeddings()
+    else:
+        vectors = synthetic_embeddings(args.count, args.dim, args.clusters)
+        item_ids = list(range(1, len(vectors) + 1))
+
+    rng = np.random.default_rng(1)
+    query_rows = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[query_rows] + rng.normal(0, 0.05, size=(len(query_rows), vectors.shape[1])).astype(np.float32)
+
+    print(f"📊 {len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    exact = EmbeddingIndex()
+    exact.build(item_ids, vectors)
+    truth, exact_ms = timed_search(exact, queries, args.k)
+    print(f"{'backend':<26} | {'build s':>8} | {'ms/query':>9} | {'recall@' + str(args.k):>9}")
+    print("-" * 62)
+    print(f"{'exact':<26} | {'-':>8} | {exact_ms:>9.3f} | {1.0:>9.3f}")
+
+    ivf = IVFIndex(nlist=args.nlist)
+    start = time.perf_counter()
+    ivf.build(item_ids, vectors)
+    build_s = time.perf_counter() - start
+    if not ivf.trained:
+        print(f"⚠️ Not enough vectors to train {args.nlist} lists; IVF falls back to exact search")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        approx, ivf_ms = timed_search(ivf, queries, args.k)
+        recall = np.mean([
+            len(set(found) & set(expected)) / max(len(expected), 1)
+            for found, expected in zip(approx, truth)
+        ])
+        label = f"ivf nlist={args.nlist} nprobe={nprobe}"
+        print(f"{label:<26} | {build_s:>8.2f} | {ivf_ms:>9.3f} | {recall:>9.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recall@k and latency of the IVF visual index against exact search')
+    parser.add_argument('--count', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=2048)
+    parser.add_argument('--clusters', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--nlist', type=int, default=256)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--from-db', action='store_true', help='Use the stored embeddings instead of synthetic data')
+    benchmark(parser.parse_args())
@@ -0,0 +1,113 @@
+import argparse
+import numpy as np
+from app import app
+from models import db, ImageEmbedding
+from modules.embedding_codec import decode_embedding, encode_embedding, PCAProjection, HEADER
+from modules.visual_index import EmbeddingIndex, PartitionedIndex
+
+def load_full_vectors():
+    """
+    All stored vectors that are still full-dimensional (raw float32 or float16),
+    plus {projection_id: count} for rows already stored in a projected space
+    """
+    item_ids, vectors, models, stored_bytes = [], [], [], 0
+    projected = {}
+    rows = db.session.query(ImageEmbedding.item_id, ImageEmbedding.image_embedding_data).yield_per(1000)
+    for item_id, data in rows:
+        if not data: continue
+        stored_bytes += len(data)
+        vector, meta = decode_embedding(data)
+        if meta.projection_id:
+            projected[meta.projection_id] = projected.get(meta.projection_id, 0) + 1
+            continue
+        item_ids.append(item_id)
+        vectors.append(vector)
+        models.append(meta.model)
+    return item_ids, vectors, models, stored_bytes, projected
+
+def measure_recall(item_ids, vectors, projection, k=5, queries=200):
+    """recall@k of search over stored compact vectors against full float32 search"""
+    exact = EmbeddingIndex()
+    exact.build(item_ids, vectors)
+    compact = EmbeddingIndex()
+    compact.build(item_ids, projection.transform(vectors).astype(np.float16).astype(np.float32))
+    
+    rng = np.random.default_rng(0)
+    query_rows = rng.choice(len(item_ids), size=min(queries, len(item_ids)), replace=False)
+    recalls = []
+    for row in query_rows:
+        exclude = (item_ids[row],)
+        expected = {item_id for item_id, _ in exact.search(vectors[row], k=k, exclude_ids=exclude)}
+        found = {item_id for item_id, _ in compact.search(projection.transform(vectors[row]), k=k, exclude_ids=exclude)}
+        if expected:
+            recalls.append(len(expected & found) / len(expected))
+    return float(np.mean(recalls)) if recalls else 1.0
+
+def compact_embeddings(dims, apply, k):
+    with app.app_context():
+        item_ids, vectors, models, stored_bytes, projected = load_full_vectors()
+        if projected:
+            # Their full vectors are gone, so they can't be re-encoded under a new fit,
+            # and replacing the projection file would drop them from the visual index
+            summary = ', '.join(f"{count} under {projection_id:#010x}" for projection_id, count in projected.items())
+            print(f"⚠️ Some embeddings are already compacted ({summary}); a new projection would orphan them.")
+            if apply:
+                print("❌ Refusing to refit. Re-embed those items at full size first (EMBEDDING_FORMAT=float32).")
+                return
+        if len(vectors) < dims:
+            print(f"❌ Need at least {dims} full-size embeddings to fit a {dims}-d projection (found {len(vectors)})")
+            return
+        
+        dims_in = {vector.shape[0] for vector in vectors}
+        if len(dims_in) > 1:
+            print(f"❌ Stored vectors have mixed dimensions {sorted(dims_in)}; re-embed with one model first")
+            return
+        vectors = np.vstack(vectors)
+        
+        print(f"📐 Fitting {dims}-d PCA on {len(vectors)} embeddings of {vectors.shape[1]} dims...")
+        projection = PCAProjection.fit(vectors, dims)
+        recall = measure_recall(item_ids, vectors, projection, k=k)
+        compact_bytes = len(vectors) * (HEADER.size + dims * 2)
+        
+        print(f"📊 recall@{k} vs full float32 search: {recall:.3f}")
+        print(f"💾 Storage: {stored_bytes / 1024:.0f} KB -> {compact_bytes / 1024:.0f} KB "
+              f"({stored_bytes / max(compact_bytes, 1):.1f}x smaller)")
+        
+        if not apply:
+            print("ℹ️ Dry run: projection and stored vectors unchanged. Re-run with --apply to rewrite them.")
+            return
+        
+        # Only now replace the active projection: stored rows are rewritten to match it below
+        pca_path = app.config.get('EMBEDDING_PCA_PATH')
+        projection.save(pca_path)
+        print(f"✅ Projection {projection.projection_id:#010x} saved to {pca_path}")
+        
+        rewritten = 0
+        for start in range(0, len(item_ids), 500):
+            batch_ids = item_ids[start:start + 500]
+            batch_rows = {row.item_id: row for row in ImageEmbedding.query.filter(ImageEmbedding.item_id.in_(batch_ids))}
+            compact_vectors = projection.transform(vectors[start:start + 500])
+            for offset, item_id in enumerate(batch_ids):
+                row = batch_rows.get(item_id)
+                if row is None: continue
+                row.image_embedding_data = encode_embedding(
+                    compact_vectors[offset], np.float16, projection.projection_id, models[start + offset]
+                )
+                rewritten += 1
+            db.session.commit()
+        
+        # A persisted index was built in the old vector space
+        index_path = app.config.get('VISUAL_INDEX_PATH')
+        if index_path:
+            PartitionedIndex.delete_saved(index_path)
+        
+        print(f"✅ Rewrote {rewritten} embeddings.")
+        print("🚀 Set EMBEDDING_FORMAT=pca_float16 and restart the app and workers to use them.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit a PCA projection and store embeddings as compact float16 vectors')
+    parser.add_argument('--dims', type=int, default=app.config.get('EMBEDDING_PCA_DIMS', 256))
+    parser.add_argument('--k', type=int, default=5, help='k used for the recall measurement')
+    parser.add_argument('--apply', action='store_true', help='Rewrite stored embeddings (default is a dry run)')
+    args = parser.parse_args()
+    compact_embeddings(args.dims, args.apply, args.k)
@@ -16,4 +16,90 @@ class Config:
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     
     # Disable Visual features for now
-    AI_ENABLED = True
\ No newline at end of file
+    AI_ENABLED = os.environ.get('AI_ENABLED', 'true').lower() == 'true'
+    # Load the image model at startup (in a background thread) instead of on the first upload
+    AI_WARMUP_ON_STARTUP = os.environ.get('AI_WARMUP_ON_STARTUP', 'false').lower() == 'true'
+    # CPU inference backend: 'eager', 'channels_last', 'int8', 'torchscript' or 'compile'
+    # (see benchmark_inference.py for latency and embedding drift against eager)
+    AI_INFERENCE_BACKEND = os.environ.get('AI_INFERENCE_BACKEND', 'eager')
+    # Image backbone: 'resnet50', 'resnet18', 'mobilenet_v3_large' or 'efficientnet_b0'
+    # (see benchmark_backbones.py; run backfill_embeddings.py after switching)
+    AI_BACKBONE = os.environ.get('AI_BACKBONE', 'resnet50')
+    # Downscale large JPEGs while decoding instead of decoding every pixel first
+    AI_FAST_DECODE = os.environ.get('AI_FAST_DECODE', 'true').lower() == 'true'
+    # Opt-in: micro-batch concurrent uploads into one forward pass on a single inference thread
+    AI_BATCH_SCHEDULER = os.environ.get('AI_BATCH_SCHEDULER', 'false').lower() == 'true'
+    AI_BATCH_MAX_SIZE = int(os.environ.get('AI_BATCH_MAX_SIZE', 16))       # images per forward pass
+    AI_BATCH_MAX_WAIT_MS = int(os.environ.get('AI_BATCH_MAX_WAIT_MS', 5))  # how long to wait for more requests
+    AI_INFERENCE_THREADS = int(os.environ.get('AI_INFERENCE_THREADS', 0))  # torch threads (0 = torch default)
+    
+    # Visual similarity index: 'exact' (brute force), 'ivf' (approximate) or 'mmap'
+    # (exact, stored under VISUAL_STORE_PATH and shared by all worker processes via the page cache)
+    VISUAL_INDEX_BACKEND = os.environ.get('VISUAL_INDEX_BACKEND', 'exact')
+    VISUAL_INDEX_NLIST = int(os.environ.get('VISUAL_INDEX_NLIST', 256))    # IVF buckets
+    VISUAL_INDEX_NPROBE = int(os.environ.get('VISUAL_INDEX_NPROBE', 8))    # buckets scanned per query (recall vs latency)
+    VISUAL_INDEX_PATH = os.path.join('instance', 'visual_index.npz')
+    VISUAL_STORE_PATH = os.path.join('instance', 'embedding_store')
+    # Colour-histogram prefilter: take the top N histogram candidates and rerank them with embeddings
+    VISUAL_PREFILTER = os.environ.get('VISUAL_PREFILTER', 'true').lower() == 'true'
+    VISUAL_PREFILTER_CANDIDATES = int(os.environ.get('VISUAL_PREFILTER_CANDIDATES', 300))
+    # Histogram-only matching threshold, used when the image model can't be loaded
+    VISUAL_HISTOGRAM_THRESHOLD = float(os.environ.get('VISUAL_HISTOGRAM_THRESHOLD', 0.90))
+    # Perceptual-hash duplicate check on upload: max differing bits (of 64) to flag a duplicate report
+    DUPLICATE_HASH_DISTANCE = int(os.environ.get('DUPLICATE_HASH_DISTANCE', 6))
+    
+    # Text match candidates for the 'simple' engine: 'token' (inverted index, exact) or 'minhash' (LSH
+    # banding tuned to the 0.3 Jaccard threshold; near-constant lookups, see benchmark_text_matching.py).
+    # Both score Jaccard; TF-IDF cosine is picked with TEXT_MATCHING_ENGINE=tfidf, and 'tfidf' here is rejected.
+    TEXT_INDEX_BACKEND = os.environ.get('TEXT_INDEX_BACKEND', 'token')
+    TEXT_MINHASH_PERMUTATIONS = int(os.environ.get('TEXT_MINHASH_PERMUTATIONS', 256))
+    # Text scoring: 'simple' (word-set Jaccard over TEXT_INDEX_BACKEND candidates), 'minhash' (Jaccard,
+    # always LSH) or 'tfidf' (cosine over sparse TF-IDF vectors). Read from the environment at import.
+    TEXT_MATCHING_ENGINE = os.environ.get('TEXT_MATCHING_ENGINE', 'simple')
+    # Re-weight the TF-IDF matrices once this fraction of items changed since the last weighting
+    TEXT_TFIDF_REFRESH_RATIO = float(os.environ.get('TEXT_TFIDF_REFRESH_RATIO', 0.2))
+    
+    # Weight of the text score in the fused match score stored on Match rows (the rest is visual)
+    MATCH_TEXT_WEIGHT = float(os.environ.get('MATCH_TEXT_WEIGHT', 0.5))
+    
+    # Candidate pruning rules (comma-separated, empty = off). They run as one indexed query per
+    # report, and the text and visual searches only score the items that pass:
+    # 'date_window' (found no earlier than the loss date minus MATCH_DATE_WINDOW_DAYS),
+    # 'category' (same or adjacent category; MATCH_CATCH_ALL_CATEGORIES match anything),
+    # 'location' (same or adjacent location). The rematch batch applies the same rules.
+    MATCH_PRUNING_RULES = os.environ.get('MATCH_PRUNING_RULES', 'date_window')
+    MATCH_DATE_WINDOW_DAYS = float(os.environ.get('MATCH_DATE_WINDOW_DAYS', 2))
+    MATCH_CATCH_ALL_CATEGORIES = os.environ.get('MATCH_CATCH_ALL_CATEGORIES', 'Others')
+    # Adjacency lists, e.g. 'Phones=Electronics,Accessories; Bags=Accessories' (read both ways)
+    MATCH_ADJACENT_CATEGORIES = os.environ.get('MATCH_ADJACENT_CATEGORIES', '')
+    MATCH_ADJACENT_LOCATIONS = os.environ.get('MATCH_ADJACENT_LOCATIONS', '')
+    # Count per-rule removals for /admin/ai-stats
+    MATCH_PRUNING_STATS = os.environ.get('MATCH_PRUNING_STATS', 'false').lower() == 'true'
+    
+    # Embedding storage: 'float32' (full), 'float16' (half size) or 'pca_float16'
+    # (PCA-reduced, ~16x smaller; fit the projection with compact_embeddings.py first)
+    EMBEDDING_FORMAT = os.environ.get('EMBEDDING_FORMAT', 'float32')
+    EMBEDDING_PCA_PATH = os.path.join('instance', 'embedding_pca.npz')
+    EMBEDDING_PCA_DIMS = 256
+    # Features cached by image content hash (stored in EMBEDDING_FORMAT); the job workers
+    # drop entries unused for EMBEDDING_CACHE_MAX_AGE_DAYS and the least recently used
+    # beyond EMBEDDING_CACHE_MAX_ENTRIES
+    EMBEDDING_CACHE_MAX_AGE_DAYS = int(os.environ.get('EMBEDDING_CACHE_MAX_AGE_DAYS', 30))
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 50000))
+    
+    # Background processing: report_item queues a job instead of matching inline.
+    # Jobs are run by the in-process pool (JOB_WORKERS threads, started by `python app.py`)
+    # or by a standalone `python run_worker.py`. Each pool checks in regularly; when none
+    # has within JOB_WORKER_TIMEOUT_SECONDS (e.g. gunicorn or flask run without
+    # run_worker.py) reports are matched inline instead of being queued.
+    BACKGROUND_PROCESSING = os.environ.get('BACKGROUND_PROCESSING', 'true').lower() == 'true'
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = 1.0     # seconds between polls when the queue is empty
+    JOB_MAX_ATTEMPTS = 3
+    JOB_LEASE_SECONDS = 600     # running jobs without a worker heartbeat for this long are re-queued (or failed)
+    JOB_STALL_WARNING_SECONDS = 120
+    JOB_WORKER_TIMEOUT_SECONDS = 90
+    
+    # Item/embedding change feed that keeps every process's in-memory indexes current.
+    # Entries older than this are pruned by the job workers; a process idle for longer reloads its indexes.
+    INDEX_CHANGE_RETENTION_HOURS = int(os.environ.get('INDEX_CHANGE_RETENTION_HOURS', 24))
@@ -2,8 +2,12 @@ import os
 import numpy as np
 from app import app
 from models import db, ImageEmbedding, Item
+from modules.embedding_codec import decode_embedding
 
 def calculate_similarity(v1, v2):
+    # Vectors stored in different formats (e.g. raw vs PCA) aren't comparable
+    if v1.shape != v2.shape:
+        return 0
     norm1 = np.linalg.norm(v1)
     norm2 = np.linalg.norm(v2)
     if norm1 == 0 or norm2 == 0:
@@ -18,7 +22,9 @@ def analyze_embeddings():
         # Mapping item_id to features
         item_data = {}
         for e in embeddings:
-            features = np.frombuffer(e.image_embedding_data, dtype=np.float32)
+            if not e.image_embedding_data:
+                continue
+            features, meta = decode_embedding(e.image_embedding_data)
             item = Item.query.get(e.item_id)
             if item:
                 item_data[e.item_id] = {
@@ -0,0 +1,36 @@
+"""Add unique index on match notifications
+
+Revision ID: 0b93c7e5d2f8
+Revises: 6d0f2b8e4a17
+Create Date: 2026-10-17 00:52:10.116348
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b93c7e5d2f8'
+down_revision = '6d0f2b8e4a17'
+branch_labels = None
+depends_on = None
+
+MATCH_NOTIFICATION_WHERE = "notification_type IN ('potential_match', 'visual_match')"
+
+
+def upgrade():
+    # Keep the oldest of any repeated match notification so the index can be built
+    op.execute(
+        "DELETE FROM notifications WHERE " + MATCH_NOTIFICATION_WHERE + " AND notification_id NOT IN ("
+        "SELECT keep_id FROM (SELECT MIN(notification_id) AS keep_id FROM notifications WHERE "
+        + MATCH_NOTIFICATION_WHERE + " GROUP BY user_id, item_id, notification_type) AS keep)"
+    )
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('uq_notification_match', ['user_id', 'item_id', 'notification_type'], unique=True,
+                              postgresql_where=sa.text(MATCH_NOTIFICATION_WHERE),
+                              sqlite_where=sa.text(MATCH_NOTIFICATION_WHERE))
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('uq_notification_match')
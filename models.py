@@ -44,6 +44,7 @@ class Item(db.Model):
     item_location = db.Column(db.String(200), nullable=False)
     item_date_lost_found = db.Column(db.DateTime, nullable=False)
     item_image_path = db.Column(db.String(300))
+    item_image_hash = db.Column(db.String(16))  # 64-bit perceptual hash (hex) for duplicate detection
     item_status = db.Column(db.String(20), default='pending')  # 'pending', 'claimed', 'resolved'
     item_created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -55,13 +56,41 @@ class Item(db.Model):
     notifications = db.relationship('Notification', backref='item', lazy=True)
     flags = db.relationship('Flag', backref='item', lazy=True)
 
+    # Candidate pruning: each report's allowed candidates come from one query per partition
+    # filtered by date window, category or location (modules/candidate_rules.py)
+    __table_args__ = (
+        db.Index('ix_items_type_status_date', 'item_type', 'item_status', 'item_date_lost_found'),
+        db.Index('ix_items_type_status_category', 'item_type', 'item_status', 'item_category'),
+        db.Index('ix_items_type_status_location', 'item_type', 'item_status', 'item_location'),
+    )
+
 class ImageEmbedding(db.Model):
     __tablename__ = 'image_embeddings'
     
     image_embedding_id = db.Column(db.Integer, primary_key=True)
-    image_embedding_data = db.Column(db.LargeBinary, nullable=False)
+    image_embedding_data = db.Column(db.LargeBinary, nullable=True)  # None when only the histogram could be computed
+    image_embedding_histogram = db.Column(db.LargeBinary, nullable=True)  # colour histogram for the prefilter
     item_id = db.Column(db.Integer, db.ForeignKey('items.item_id'), unique=True, nullable=False)
 
+class EmbeddingCacheEntry(db.Model):
+    __tablename__ = 'embedding_cache'
+    
+    cache_id = db.Column(db.Integer, primary_key=True)
+    cache_content_hash = db.Column(db.String(64), nullable=False)  # sha256 of the uploaded image bytes
+    cache_model = db.Column(db.String(32), nullable=False)  # model tag the features came from
+    cache_backend = db.Column(db.String(16), nullable=False)  # inference backend (int8 features differ from fp32)
+    cache_embedding_data = db.Column(db.LargeBinary, nullable=False)  # features in the EMBEDDING_FORMAT encoding
+    cache_hit_count = db.Column(db.Integer, default=0)
+    cache_created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    cache_last_hit_at = db.Column(db.DateTime, nullable=True)  # entries unused for long are pruned by the job workers
+    
+    __table_args__ = (db.UniqueConstraint('cache_content_hash', 'cache_model', 'cache_backend',
+                                          name='uq_embedding_cache_hash_model_backend'),)
+
+# Notification kinds a user gets at most once per (user, item): see modules/notification_writer.py
+MATCH_NOTIFICATION_TYPES = ('potential_match', 'visual_match')
+MATCH_NOTIFICATION_WHERE = "notification_type IN ('potential_match', 'visual_match')"
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
     
@@ -75,6 +104,13 @@ class Notification(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
     item_id = db.Column(db.Integer, db.ForeignKey('items.item_id'), nullable=True) # Changed default nullable=False to True to avoid issues if generic notification
     notification_sender_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=True) # Optional link to sender
+
+    # Match notifications are unique per recipient, item and type; messages can repeat
+    __table_args__ = (
+        db.Index('uq_notification_match', 'user_id', 'item_id', 'notification_type', unique=True,
+                 postgresql_where=db.text(MATCH_NOTIFICATION_WHERE),
+                 sqlite_where=db.text(MATCH_NOTIFICATION_WHERE)),
+    )
     
     # Relationship
     sender = db.relationship('User', foreign_keys=[notification_sender_id], backref='triggered_notifications')
@@ -84,14 +120,20 @@ class Match(db.Model):
     
     match_id = db.Column(db.Integer, primary_key=True)
     lost_item_id = db.Column(db.Integer, db.ForeignKey('items.item_id'), nullable=False)
-    found_item_id = db.Column(db.Integer, db.ForeignKey('items.item_id'), nullable=False)
-    match_similarity_score = db.Column(db.Float, nullable=False)
+    found_item_id = db.Column(db.Integer, db.ForeignKey('items.item_id'), nullable=False, index=True)
+    match_similarity_score = db.Column(db.Float, nullable=False)  # fused text + visual score
+    match_text_score = db.Column(db.Float, nullable=True)
+    match_visual_score = db.Column(db.Float, nullable=True)  # None when either item has no embedding
     match_status = db.Column(db.String(20), default='pending')  # 'pending', 'confirmed', 'rejected'
     match_created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    match_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     lost_item = db.relationship('Item', foreign_keys=[lost_item_id])
     found_item = db.relationship('Item', foreign_keys=[found_item_id])
+    
+    # One row per pair; the unique index also serves lookups by lost_item_id
+    __table_args__ = (db.UniqueConstraint('lost_item_id', 'found_item_id', name='uq_match_pair'),)
 
 class Message(db.Model):
     __tablename__ = 'messages'
@@ -142,6 +184,45 @@ class CampusLocation(db.Model):
     location_description = db.Column(db.Text, nullable=True)
     location_is_active = db.Column(db.Boolean, default=True)
 
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    job_id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # 'process_item', ...
+    job_status = db.Column(db.String(20), default='queued', index=True)  # 'queued', 'running', 'done', 'failed'
+    job_stage = db.Column(db.String(50), nullable=True)  # Progress marker set by the handler
+    job_payload = db.Column(db.Text, nullable=True)  # JSON
+    job_result = db.Column(db.Text, nullable=True)  # JSON
+    job_error = db.Column(db.Text, nullable=True)
+    job_attempts = db.Column(db.Integer, default=0)
+    job_created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    job_started_at = db.Column(db.DateTime, nullable=True)
+    job_heartbeat_at = db.Column(db.DateTime, nullable=True)  # Refreshed while a live worker runs the job
+    job_finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Optional link to the item being processed
+    item_id = db.Column(db.Integer, db.ForeignKey('items.item_id'), nullable=True, index=True)
+    
+    # Relationship
+    item = db.relationship('Item', backref='jobs')
+
+class JobWorker(db.Model):
+    __tablename__ = 'job_workers'
+    
+    # One row per running worker pool; web processes only queue jobs while one is alive
+    worker_id = db.Column(db.String(128), primary_key=True)  # host:pid:pool
+    worker_started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    worker_heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class IndexChange(db.Model):
+    __tablename__ = 'index_changes'
+    
+    # Append-only feed of items whose indexed data changed; every process replays it
+    change_id = db.Column(db.Integer, primary_key=True)
+    change_item_id = db.Column(db.Integer, nullable=False)  # no FK: deleted items are recorded too
+    change_kind = db.Column(db.String(30), nullable=False)  # 'item_insert', 'item_update', 'item_delete', 'embedding_*'
+    change_created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
 class Dispute(db.Model):
     __tablename__ = 'disputes'
     
@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from models import db, User, Item, Notification, Match, Message, Flag, Category, CampusLocation
+from models import db, User, Item, Notification, Match, Message, Flag, Category, CampusLocation, Job
 from datetime import datetime, timedelta
 from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+from modules.match_store import matches_for_item, delete_matches_for_item
 import os
 from fpdf import FPDF
 from flask import make_response
@@ -84,9 +86,9 @@ def admin_analytics():
     
     trends.reverse() # Oldest first for charts
     
-    # Calculate some Visual stats
+    # Calculate some Visual stats from the stored match scores
     total_matches = Match.query.count()
-    resolved_matches = Match.query.join(Item, Match.match_item_id == Item.item_id)\
+    resolved_matches = Match.query.join(Item, Match.lost_item_id == Item.item_id)\
                                  .filter(Item.item_status == 'resolved').count()
     
     accuracy = 0
@@ -196,12 +198,13 @@ def manage_notifications():
 @login_required
 @admin_required
 def manage_matches():
-    """Manage Matches - Shows all match notifications"""
-    match_notifications = Notification.query.filter(
-        Notification.notification_type.in_(['potential_match', 'visual_match'])
-    ).order_by(Notification.notification_created_at.desc()).all()
+    """Manage Matches - Shows the scored lost/found pairs, best first"""
+    matches = Match.query.options(
+        joinedload(Match.lost_item).joinedload(Item.owner),
+        joinedload(Match.found_item).joinedload(Item.owner)
+    ).order_by(Match.match_similarity_score.desc(), Match.match_created_at.desc()).limit(500).all()
     
-    return render_template('admin/matches.html', matches=match_notifications)
+    return render_template('admin/matches.html', matches=matches)
 
 @admin_bp.route('/admin/messages')
 @login_required
@@ -260,8 +263,11 @@ def delete_item(item_id):
         if hasattr(item, 'embedding') and item.embedding:
             db.session.delete(item.embedding)
         
-        # Delete related notifications
+        # Delete related notifications, matches, flags and queued jobs
         Notification.query.filter_by(item_id=item_id).delete()
+        delete_matches_for_item(item_id)
+        Flag.query.filter_by(item_id=item_id).delete()
+        Job.query.filter_by(item_id=item_id).delete()
         
         # Delete image file associated with item
         if item.item_image_path:
@@ -328,6 +334,22 @@ def system_stats():
                          categories=categories,
                          resolution_rate=resolution_rate)
 
+@admin_bp.route('/admin/ai-stats')
+@login_required
+@admin_required
+def ai_stats():
+    """Visual engine counters (JSON) for monitoring"""
+    from modules.ai_processing import image_engine
+    from modules.index_sync import change_feed
+    from modules.candidate_rules import pruning_stats
+    return jsonify({
+        'embedding_cache': image_engine.cache_stats(),
+        'inference_scheduler': image_engine.scheduler_stats(),
+        'visual_search': image_engine.search_stats(),
+        'index_sync': change_feed.stats(),
+        'candidate_pruning': pruning_stats.stats()
+    })
+
 @admin_bp.route('/admin/user/<int:user_id>')
 @login_required
 @admin_required
@@ -367,9 +389,7 @@ def view_item(item_id):
     item_notifications = Notification.query.filter_by(item_id=item_id)\
         .order_by(Notification.notification_created_at.desc()).all()
     
-    matches_as_lost = Match.query.filter_by(lost_item_id=item_id).all()
-    matches_as_found = Match.query.filter_by(found_item_id=item_id).all()
-    all_matches = matches_as_lost + matches_as_found
+    all_matches = matches_for_item(item_id, status=None)
     
     return render_template('admin/item_details.html',
                          item=item,
@@ -1,34 +1,224 @@
-import torch
-import torchvision.transforms as transforms
-from torchvision import models
 from PIL import Image
 import numpy as np
 import io
 import os
-from sklearn.metrics.pairwise import cosine_similarity
-from models import db, ImageEmbedding, Item
+import hashlib
+import zlib
+import threading
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from flask import current_app, has_app_context
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
+from models import db, ImageEmbedding, Item, EmbeddingCacheEntry
+from modules.visual_index import create_index, PartitionedIndex, EmbeddingIndex
+from modules.embedding_codec import encode_embedding, decode_embedding, PCAProjection
+from modules.inference_scheduler import InferenceScheduler
+from modules.embedding_store import MemmapIndex
+from modules.index_sync import index_listener, sync_indexes
+
+# torch/torchvision are only imported when the model is first needed,
+# so importing this module (and the app) stays cheap
+TORCH_AVAILABLE = find_spec('torch') is not None and find_spec('torchvision') is not None
+# OpenCV colour histograms (ai_processing_light) drive the prefilter and the no-model fallback
+HISTOGRAM_AVAILABLE = find_spec('cv2') is not None
+
+# CPU inference backends selectable with AI_INFERENCE_BACKEND
+INFERENCE_BACKENDS = ('eager', 'channels_last', 'int8', 'torchscript', 'compile')
+
+# torchvision backbones: name -> (weights enum, classification head to strip, feature dim)
+BACKBONES = {
+    'resnet18': ('ResNet18_Weights', 'fc', 512),
+    'resnet50': ('ResNet50_Weights', 'fc', 2048),
+    'mobilenet_v3_large': ('MobileNet_V3_Large_Weights', 'classifier', 960),
+    'efficientnet_b0': ('EfficientNet_B0_Weights', 'classifier', 1280),
+}
+# Backbones with int8 weights in torchvision.models.quantization
+QUANTIZED_WEIGHTS = {
+    'resnet18': 'ResNet18_QuantizedWeights',
+    'resnet50': 'ResNet50_QuantizedWeights',
+    'mobilenet_v3_large': 'MobileNet_V3_Large_QuantizedWeights',
+}
+DEFAULT_BACKBONE = 'resnet50'
+
+# Model tag stored in the header of prefilter histograms
+HISTOGRAM_MODEL = 'histogram'
+
+# Short side the transform resizes to; decoding never goes below it
+DECODE_SIZE = 256
+
+# The visual index keeps one partition per (item_type, item_status)
+ITEM_TYPES = ('lost', 'found')
+ITEM_STATUSES = ('pending', 'claimed', 'resolved')
+OPPOSITE_TYPE = {'lost': 'found', 'found': 'lost'}
+PARTITIONS = [(item_type, item_status) for item_type in ITEM_TYPES for item_status in ITEM_STATUSES]
 
 class ImageRecognitionEngine:
-    def __init__(self):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = self._load_model()
-        self.transform = self._get_transform()
-        print(f"📷 Image Recognition Engine initialized on {self.device}")
+    def __init__(self, inference_backend=None, backbone=None, fast_decode=None, batch_scheduler=None):
+        self.device = None
+        self.backbone = backbone  # None = read AI_BACKBONE from config
+        self.fast_decode = fast_decode  # None = read AI_FAST_DECODE from config
+        self.batch_scheduler = batch_scheduler  # None = read AI_BATCH_SCHEDULER from config
+        self._scheduler = None
+        self._scheduler_options = {}
+        self._scheduler_lock = threading.Lock()
+        self.transform = None
+        self.inference_backend = inference_backend  # None = read from config on load
+        self._channels_last = False
+        self._model = None
+        self._model_loaded = False
+        self._model_lock = threading.Lock()
+        self.index = None
+        self.histogram_index = None
+        self._unembedded_ids = set()  # histogram but no usable embedding: not covered by the prefilter count
+        self._index_lock = threading.Lock()
+        # How visual searches were answered in this process
+        self.search_counts = {'full_scan': 0, 'prefiltered': 0, 'histogram_only': 0}
+        self._projection = None
+        self._projection_loaded = False
+        # Content-hash cache counters for this process (totals live in embedding_cache)
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    @property
+    def model_tag(self):
+        """Identifies the network that produced a vector; stored in every embedding header"""
+        backbone = self.backbone or self._setting('AI_BACKBONE', DEFAULT_BACKBONE)
+        return backbone if backbone in BACKBONES else DEFAULT_BACKBONE
+    
+    @property
+    def feature_dim(self):
+        """Length of the raw feature vector produced by the configured backbone"""
+        return BACKBONES[self.model_tag][2]
+    
+    @property
+    def model(self):
+        """The feature extractor, built on first access"""
+        if not self._model_loaded:
+            self.warm_up()
+        return self._model
+    
+    def warm_up(self):
+        """Import torch and build the model now instead of on the first image. Returns True if usable."""
+        if self._model_loaded:
+            return self._model is not None
+        with self._model_lock:
+            if not self._model_loaded:
+                if self.fast_decode is None:
+                    self.fast_decode = self._setting('AI_FAST_DECODE', True)
+                try:
+                    import torch
+                    self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+                    if self.inference_backend is None:
+                        self.inference_backend = self._setting('AI_INFERENCE_BACKEND', 'eager')
+                    if self.batch_scheduler is None:
+                        self.batch_scheduler = self._setting('AI_BATCH_SCHEDULER', False)
+                    if self.batch_scheduler:
+                        self._scheduler_options = {
+                            'max_batch_size': self._setting('AI_BATCH_MAX_SIZE', 16),
+                            'max_wait_ms': self._setting('AI_BATCH_MAX_WAIT_MS', 5),
+                            'threads': self._setting('AI_INFERENCE_THREADS', 0),
+                        }
+                    if self.backbone is None:
+                        configured = self._setting('AI_BACKBONE', DEFAULT_BACKBONE)
+                        if configured not in BACKBONES:
+                            print(f"⚠️ Unknown backbone '{configured}', using {DEFAULT_BACKBONE}")
+                        self.backbone = self.model_tag
+                    self.transform = self._get_transform()
+                    self._model = self._load_model()
+                    print(f"📷 Image Recognition Engine initialized on {self.device} ({self.backbone}, {self.inference_backend})")
+                except ImportError as e:
+                    print(f"⚠️ Visual module not available: {e}")
+                    self._model = None
+                self._model_loaded = True
+        return self._model is not None
         
+    def _setting(self, name, default):
+        """Read a config value when running inside the app, else use the default"""
+        if has_app_context():
+            return current_app.config.get(name, default)
+        return default
+    
     def _load_model(self):
-        """Load pre-trained ResNet model"""
+        """Load the pre-trained backbone and apply the selected inference backend"""
+        import torch
+        from torchvision import models
         try:
-            model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
-            # Remove classification layer
-            model = torch.nn.Sequential(*(list(model.children())[:-1]))
+            if self.inference_backend == 'int8':
+                quantized = self._load_quantized_model()
+                if quantized is not None:
+                    return quantized
+                self.inference_backend = 'eager'
+            
+            weights_name, head, _ = BACKBONES[self.backbone]
+            weights = getattr(models, weights_name).DEFAULT
+            model = getattr(models, self.backbone)(weights=weights)
+            # Remove classification layer; the pooled features come straight out
+            setattr(model, head, torch.nn.Identity())
             model.eval()
             model.to(self.device)
+            return self._apply_backend(model)
+        except Exception as e:
+            print(f"⚠️ Error loading {self.backbone} model: {e}")
+            return None
+    
+    def _load_quantized_model(self):
+        """
+        int8 backbone from torchvision's quantized weights (fbgemm/qnnpack, CPU only).
+        Dynamic quantization would be a no-op here: with the head removed the
+        backbones have (almost) no Linear layers, so we use statically quantized models.
+        """
+        import torch
+        from torchvision.models import quantization
+        if self.backbone not in QUANTIZED_WEIGHTS:
+            print(f"⚠️ No int8 weights for {self.backbone}, falling back to eager")
+            return None
+        try:
+            engines = torch.backends.quantized.supported_engines
+            torch.backends.quantized.engine = 'fbgemm' if 'fbgemm' in engines else 'qnnpack'
+            weights = getattr(quantization, QUANTIZED_WEIGHTS[self.backbone]).DEFAULT
+            model = getattr(quantization, self.backbone)(weights=weights, quantize=True)
+            # Remove classification layer; the dequant stub still runs after it
+            setattr(model, BACKBONES[self.backbone][1], torch.nn.Identity())
+            model.eval()
+            self.device = torch.device('cpu')
             return model
         except Exception as e:
-            print(f"⚠️ Error loading ResNet model: {e}")
+            print(f"⚠️ int8 backend unavailable, falling back to eager: {e}")
             return None
     
+    def _apply_backend(self, model):
+        """Wrap the eager fp32 model for the configured backend, falling back to eager on failure"""
+        import torch
+        backend = self.inference_backend
+        try:
+            if backend == 'channels_last':
+                self._channels_last = True
+                return model.to(memory_format=torch.channels_last)
+            
+            if backend == 'torchscript':
+                example = torch.zeros(1, 3, 224, 224, device=self.device)
+                with torch.no_grad():
+                    traced = torch.jit.trace(model, example)
+                    traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+                return traced
+            
+            if backend == 'compile':
+                return torch.compile(model)
+            
+            if backend != 'eager':
+                print(f"⚠️ Unknown inference backend '{backend}', using eager")
+        except Exception as e:
+            print(f"⚠️ {backend} backend failed, falling back to eager: {e}")
+            self._channels_last = False
+        
+        self.inference_backend = 'eager'
+        return model
+    
     def _get_transform(self):
+        import torchvision.transforms as transforms
         return transforms.Compose([
             transforms.Resize(256),
             transforms.CenterCrop(224),
@@ -36,53 +226,223 @@ class ImageRecognitionEngine:
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
     
+    def _load_image(self, image_input):
+        """Decode an image stream or path to RGB"""
+        # Ensure stream cursor is at the beginning
+        if hasattr(image_input, 'seek') and hasattr(image_input, 'read'):
+            image_input.seek(0)
+            image = Image.open(image_input)
+        elif isinstance(image_input, str):
+            image = Image.open(image_input)
+        else:
+            return None
+        if self.fast_decode:
+            image = self._downscale_on_decode(image)
+        return image.convert('RGB')
+    
+    @staticmethod
+    def _downscale_on_decode(image, size=DECODE_SIZE):
+        """
+        Shrink a large image as cheaply as possible while keeping its short side >= size.
+        JPEGs are scaled by 1/2, 1/4 or 1/8 inside the decoder (DCT domain), so the
+        full-resolution pixels are never materialised; other formats use a box reduce().
+        Resize(256) then does the final, antialiased step as before.
+        """
+        width, height = image.size
+        short_side = min(width, height)
+        if short_side < 2 * size:
+            return image
+        if image.format == 'JPEG':
+            scale = size / short_side
+            image.draft('RGB', (int(width * scale + 0.5), int(height * scale + 0.5)))
+            return image
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            # Box-filtering palette indices would mix unrelated colours
+            image = image.convert('RGB')
+        return image.reduce(short_side // size)
+    
+    def _prepare_tensor(self, image_input):
+        """Decode and transform one image, or None if it can't be read"""
+        try:
+            image = self._load_image(image_input)
+            if image is None:
+                return None
+            return self.transform(image)
+        except Exception as e:
+            print(f"❌ Error decoding image: {e}")
+            return None
+    
+    def _forward(self, tensors):
+        """Run one batched forward pass and return a (batch, dim) numpy array"""
+        import torch
+        batch = torch.stack(tensors).to(self.device)
+        if self._channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            features = self.model(batch)
+        return features.reshape(features.shape[0], -1).cpu().numpy()
+    
+    def _get_scheduler(self):
+        """The micro-batching scheduler for this process, or None when it's switched off"""
+        if not self.batch_scheduler:
+            return None
+        scheduler = self._scheduler
+        # A scheduler inherited through fork has no thread behind it
+        if scheduler is None or scheduler.pid != os.getpid():
+            with self._scheduler_lock:
+                if self._scheduler is None or self._scheduler.pid != os.getpid():
+                    self._scheduler = InferenceScheduler(self._forward, **self._scheduler_options).start()
+                scheduler = self._scheduler
+        return scheduler
+    
+    def scheduler_stats(self):
+        return self._scheduler.stats() if self._scheduler is not None else None
+    
     def extract_features(self, image_input):
-        """Extract feature embeddings from an image stream or path"""
+        """
+        Extract feature embeddings from an image stream or path.
+        Decoding happens on the calling thread; with AI_BATCH_SCHEDULER on, the
+        forward pass is shared with other concurrent requests.
+        """
         if self.model is None: return None
         
         try:
-            # Ensure stream cursor is at the beginning
-            if hasattr(image_input, 'seek') and hasattr(image_input, 'read'):
-                image_input.seek(0)
-                image = Image.open(image_input).convert('RGB')
-            elif isinstance(image_input, str):
-                image = Image.open(image_input).convert('RGB')
-            else:
+            image_tensor = self._prepare_tensor(image_input)
+            if image_tensor is None:
                 return None
             
-            # Transform and extract
-            image_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            
-            with torch.no_grad():
-                features = self.model(image_tensor)
-                features = features.squeeze().cpu().numpy()
-            
-            return features.flatten()
+            scheduler = self._get_scheduler()
+            if scheduler is not None:
+                return scheduler.submit(image_tensor).result()
+            return self._forward([image_tensor])[0]
             
         except Exception as e:
             print(f"❌ Error extracting features: {e}")
             return None
     
-    def save_image_embedding(self, item_id, features):
+    def extract_features_batch(self, paths_or_streams, batch_size=32, num_workers=None):
         """
-        Save pre-calculated features to database.
-        Note: Accepts 'features' array, separate from the image file object
+        Extract embeddings for many images, yielding one result per input in order
+        (None where an image could not be read). Decoding and transforms run in a
+        thread pool one batch ahead of the forward pass, so decode and inference overlap.
         """
+        def chunks(iterable):
+            iterator = iter(iterable)
+            while True:
+                chunk = list(islice(iterator, batch_size))
+                if not chunk:
+                    return
+                yield chunk
+        
+        def finish(futures):
+            tensors = [future.result() for future in futures]
+            results = [None] * len(tensors)
+            valid = [i for i, tensor in enumerate(tensors) if tensor is not None]
+            if valid and self.model is not None:
+                try:
+                    features = self._forward([tensors[i] for i in valid])
+                    for row, i in enumerate(valid):
+                        results[i] = features[row]
+                except Exception as e:
+                    print(f"❌ Error extracting batch features: {e}")
+            return results
+        
+        self.warm_up()
+        workers = num_workers or min(8, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-decode') as pool:
+            pending = None
+            for chunk in chunks(paths_or_streams):
+                futures = [pool.submit(self._prepare_tensor, image_input) for image_input in chunk]
+                if pending is not None:
+                    yield from finish(pending)
+                pending = futures
+            if pending is not None:
+                yield from finish(pending)
+    
+    def extract_histogram(self, image_input):
+        """Colour histogram + edge density (193-d) for the prefilter; needs OpenCV but not torch"""
+        if not HISTOGRAM_AVAILABLE:
+            return None
+        from ai_processing_light import light_image_engine
         try:
-            if features is not None:
-                features_bytes = features.tobytes()
-                
+            image = self._load_image(image_input)
+        except Exception as e:
+            print(f"❌ Error decoding image: {e}")
+            return None
+        if image is None:
+            return None
+        return light_image_engine.extract_features_from_pil(image)
+    
+    def _get_projection(self):
+        """The PCA projection for compact storage, if EMBEDDING_FORMAT asks for one"""
+        if not self._projection_loaded:
+            if self._setting('EMBEDDING_FORMAT', 'float32') == 'pca_float16':
+                self._projection = PCAProjection.load(self._setting('EMBEDDING_PCA_PATH', None))
+                if self._projection is None:
+                    print("⚠️ EMBEDDING_FORMAT is pca_float16 but no PCA file was found; storing full float16 vectors")
+                elif self._projection.input_dim != self.feature_dim:
+                    print(f"⚠️ PCA file was fitted for another backbone than {self.model_tag}; storing full float16 vectors")
+                    self._projection = None
+            self._projection_loaded = True
+        return self._projection
+    
+    def encode_features(self, features):
+        """Serialize raw model features in the configured storage format"""
+        storage_format = self._setting('EMBEDDING_FORMAT', 'float32')
+        projection = self._get_projection()
+        if projection is not None and features.shape[0] == projection.input_dim:
+            return encode_embedding(projection.transform(features), np.float16,
+                                    projection.projection_id, self.model_tag)
+        dtype = np.float32 if storage_format == 'float32' else np.float16
+        return encode_embedding(features, dtype, 0, self.model_tag)
+    
+    def _to_index_space(self, vector, meta):
+        """
+        Map a stored vector into the space the index searches in: the active PCA
+        space when one is configured, otherwise raw features. Returns None for
+        vectors that can't be compared (another backbone, or a different PCA).
+        """
+        if meta.model != self.model_tag:
+            return None
+        projection = self._get_projection()
+        if meta.projection_id:
+            if projection is not None and meta.projection_id == projection.projection_id:
+                return vector
+            return None
+        if projection is not None:
+            if vector.shape[0] != projection.input_dim:
+                return None
+            return projection.transform(vector)
+        return vector
+    
+    def _query_vector(self, features):
+        """Project raw query features into the index space"""
+        projection = self._get_projection()
+        if projection is not None and features.shape[0] == projection.input_dim:
+            return projection.transform(features)
+        return features
+    
+    def save_image_embedding(self, item_id, features, histogram=None, encoded=None):
+        """
+        Save pre-calculated features (and the colour histogram) to database.
+        Note: Accepts 'features' array, separate from the image file object;
+        encoded (already in the stored format, e.g. from the cache) is saved as is
+        """
+        try:
+            if features is not None or histogram is not None:
                 # Check if embedding already exists
-                existing = ImageEmbedding.query.filter_by(item_id=item_id).first()
-                if existing:
-                    existing.image_embedding_data = features_bytes
-                else:
-                    embedding = ImageEmbedding(
-                        item_id=item_id,
-                        image_embedding_data=features_bytes
-                    )
+                embedding = ImageEmbedding.query.filter_by(item_id=item_id).first()
+                if embedding is None:
+                    embedding = ImageEmbedding(item_id=item_id)
                     db.session.add(embedding)
+                if encoded is not None:
+                    embedding.image_embedding_data = encoded
+                elif features is not None:
+                    embedding.image_embedding_data = self.encode_features(features)
+                if histogram is not None:
+                    embedding.image_embedding_histogram = encode_embedding(histogram, np.float16, 0, HISTOGRAM_MODEL)
                 
+                # The change feed carries the new vectors into every process's index
                 db.session.commit()
                 return True
             return False
@@ -91,75 +451,480 @@ class ImageRecognitionEngine:
             db.session.rollback()
             return False
     
-    def find_similar_items(self, query_features, threshold=0.60, max_results=5, exclude_item_id=None):
-        """Find similar items using Cosine Similarity"""
-        try:
-            # Get all OTHER embeddings (optimize in production)
-            all_embeddings = ImageEmbedding.query.all()
-            similar_items = []
-            
-            # Normalize query vector for cosine similarity
-            query_norm = np.linalg.norm(query_features)
-            if query_norm == 0: return []
-            
-            for embedding in all_embeddings:
-                # Skip if data is corrupted
-                if not embedding.image_embedding_data: continue
-                
-                # Skip the current item itself
-                if exclude_item_id and embedding.item_id == exclude_item_id:
-                    continue
-                
-                stored_features = np.frombuffer(embedding.image_embedding_data, dtype=np.float32)
-                
-                # Calculate Cosine Similarity
-                stored_norm = np.linalg.norm(stored_features)
-                if stored_norm == 0: continue
+    def _create_index(self):
+        """Build an empty partitioned index for the backend selected in config"""
+        config = current_app.config
+        projection = self._get_projection()
+        backend = config.get('VISUAL_INDEX_BACKEND', 'exact')
+        # A saved index is only reusable in the same vector space
+        space_id = projection.projection_id if projection is not None else zlib.crc32(self.model_tag.encode())
+        if backend == 'mmap':
+            return MemmapIndex(os.path.join(config.get('VISUAL_STORE_PATH'), 'embeddings'), PARTITIONS, space_id)
+        options = dict(
+            dim=projection.dims if projection is not None else None,
+            nlist=config.get('VISUAL_INDEX_NLIST', 256),
+            nprobe=config.get('VISUAL_INDEX_NPROBE', 8),
+            space_id=space_id
+        )
+        return PartitionedIndex(lambda: create_index(backend, **options))
+    
+    def _create_histogram_index(self):
+        """Histograms are small (193-d) and always searched exactly"""
+        config = current_app.config
+        if config.get('VISUAL_INDEX_BACKEND', 'exact') == 'mmap':
+            return MemmapIndex(os.path.join(config.get('VISUAL_STORE_PATH'), 'histograms'), PARTITIONS)
+        return PartitionedIndex(lambda: create_index('exact'))
+    
+    def _load_embedding_rows(self, item_ids=None):
+        """Yield (item_id, (item_type, item_status), index-space vector) without loading ORM objects"""
+        query = db.session.query(
+            ImageEmbedding.item_id, Item.item_type, Item.item_status, ImageEmbedding.image_embedding_data
+        ).join(Item, Item.item_id == ImageEmbedding.item_id)
+        if item_ids is not None:
+            query = query.filter(ImageEmbedding.item_id.in_(item_ids))
+        for item_id, item_type, item_status, data in query.yield_per(1000):
+            # Skip if data is corrupted
+            if not data: continue
+            vector = self._to_index_space(*decode_embedding(data))
+            if vector is None: continue
+            yield item_id, (item_type, item_status), vector
+    
+    def _load_histogram_rows(self, item_ids=None):
+        """Yield (item_id, (item_type, item_status), histogram) for the prefilter index"""
+        query = db.session.query(
+            ImageEmbedding.item_id, Item.item_type, Item.item_status, ImageEmbedding.image_embedding_histogram
+        ).join(Item, Item.item_id == ImageEmbedding.item_id).filter(
+            ImageEmbedding.image_embedding_histogram.isnot(None)
+        )
+        if item_ids is not None:
+            query = query.filter(ImageEmbedding.item_id.in_(item_ids))
+        for item_id, item_type, item_status, data in query.yield_per(1000):
+            yield item_id, (item_type, item_status), decode_embedding(data)[0]
+    
+    def _reconcile_index(self, index, column, load_rows):
+        """Bring an index restored from disk in line with the embeddings and items tables"""
+        stored = {
+            item_id: (item_type, item_status) for item_id, item_type, item_status in
+            db.session.query(ImageEmbedding.item_id, Item.item_type, Item.item_status)
+            .join(Item, Item.item_id == ImageEmbedding.item_id).filter(column.isnot(None))
+        }
+        removes, moves = [], []
+        for item_id in index.item_ids:
+            partition = stored.get(item_id)
+            if partition is None:
+                removes.append(item_id)
+            elif partition != index.partition_of(item_id):
+                moves.append((item_id, partition))
+        self._apply_changes(index, removes=removes, moves=moves)
+        missing_ids = list(set(stored) - index.item_ids)
+        for start in range(0, len(missing_ids), 1000):
+            rows = [(item_id, vector, partition) for item_id, partition, vector in load_rows(missing_ids[start:start + 1000])]
+            self._apply_changes(index, upserts=rows)
+    
+    @staticmethod
+    def _apply_changes(index, upserts=(), removes=(), moves=()):
+        """Apply index changes; the shared on-disk store takes each kind in one manifest swap"""
+        if hasattr(index, 'update_many'):
+            index.update_many(removes=removes, moves=moves)
+        else:
+            for item_id in removes:
+                index.remove(item_id)
+            for item_id, partition in moves:
+                index.move(item_id, partition)
+        if not upserts:
+            return
+        if hasattr(index, 'upsert_many'):
+            index.upsert_many(upserts)
+        else:
+            for item_id, vector, partition in upserts:
+                index.upsert(item_id, vector, partition)
+    
+    def _open_or_build(self, index, path, column, load_rows):
+        """Restore a persisted index and catch it up with the DB, or build it from scratch"""
+        if path and index.load(path, PARTITIONS):
+            self._reconcile_index(index, column, load_rows)
+        else:
+            index.build(load_rows())
+            if path and len(index):
+                index.save(path)
+    
+    def _ensure_index(self):
+        """Load all stored embeddings into the resident index once per process"""
+        if self.index is not None and self.index.loaded:
+            return self.index
+        with self._index_lock:
+            if self.index is None or not self.index.loaded:
+                index = self._create_index()
+                self._open_or_build(index, current_app.config.get('VISUAL_INDEX_PATH'),
+                                    ImageEmbedding.image_embedding_data, self._load_embedding_rows)
                 
-                dot_product = np.dot(query_features, stored_features)
-                similarity = dot_product / (query_norm * stored_norm)
+                if HISTOGRAM_AVAILABLE:
+                    # The in-memory histogram index is cheap enough to rebuild every time
+                    histogram_index = self._create_histogram_index()
+                    self._open_or_build(histogram_index, getattr(histogram_index, 'path', None),
+                                        ImageEmbedding.image_embedding_histogram, self._load_histogram_rows)
+                    self.histogram_index = histogram_index
+                    self._unembedded_ids = histogram_index.item_ids - index.item_ids
                 
-                if similarity >= threshold:
-                    similar_items.append({
-                        'item': embedding.item,
-                        'similarity': float(similarity), # Convert numpy float to python float
-                        'embedding_id': embedding.image_embedding_id
-                    })
-            
-            similar_items.sort(key=lambda x: x['similarity'], reverse=True)
-            return similar_items[:max_results]
-            
-        except Exception as e:
-            print(f"❌ Error finding similar items: {e}")
+                self.index = index
+                print(f"📚 Visual index loaded with {len(index)} embeddings in partitions {index.partition_sizes()}")
+        return self.index
+    
+    def _use_prefilter(self, histogram, partitions, allowed_ids=None):
+        """
+        Only take the histogram shortcut when it can't lose items: every searched
+        partition must have a histogram for each embedding, and be bigger than
+        the candidate list (otherwise the exact scan is just as cheap). Histograms
+        of items without an embedding don't count towards that coverage.
+        """
+        if histogram is None or self.histogram_index is None or not self._setting('VISUAL_PREFILTER', True):
+            return False
+        candidates = self._setting('VISUAL_PREFILTER_CANDIDATES', 300)
+        if allowed_ids is not None and len(allowed_ids) <= candidates:
+            return False
+        keys = partitions if partitions is not None else self.index.partition_keys()
+        unembedded = {}
+        for item_id in self._unembedded_ids:
+            key = self.histogram_index.partition_of(item_id)
+            unembedded[key] = unembedded.get(key, 0) + 1
+        sizes = [(self.index.partition_size(key), self.histogram_index.partition_size(key) - unembedded.get(key, 0))
+                 for key in keys]
+        return (all(histograms >= embeddings for embeddings, histograms in sizes)
+                and sum(embeddings for embeddings, _ in sizes) > candidates)
+    
+    def _rerank(self, query, candidate_ids, threshold, k):
+        """Score prefilter candidates against their resident embeddings"""
+        unit = EmbeddingIndex.normalize(query)
+        if unit is None:
             return []
+        ids, vectors = [], []
+        for item_id in candidate_ids:
+            vector = self.index.get_vector(item_id)
+            if vector is not None and vector.shape == unit.shape:
+                ids.append(item_id)
+                vectors.append(vector)
+        if not ids:
+            return []
+        scores = np.stack(vectors) @ unit
+        order = np.argsort(-scores)[:k]
+        return [(ids[i], float(scores[i])) for i in order if threshold is None or scores[i] >= threshold]
     
-    def process_new_item(self, item_id, image_file):
+    def find_similar_items(self, query_features, threshold=0.60, max_results=5, exclude_item_id=None,
+                           item_type=None, item_status='pending', histogram=None, allowed_ids=None):
         """
-        Main entry point: Extracts ONCE, Saves, then Matches.
+        Find similar items using Cosine Similarity.
+        With item_type set, only items of that type and status are searched.
+        With a histogram, the colour prefilter picks candidates for the embedding
+        rerank; without query_features (no model) the histogram alone is used.
+        With allowed_ids (candidates passing the pruning rules) only those are scored.
         """
-        print(f"🖼️ Visual Processing started for Item {item_id}")
         try:
-            # 1. Extract features ONCE
-            features = self.extract_features(image_file)
+            sync_indexes()
+            index = self._ensure_index()
+            exclude_ids = (exclude_item_id,) if exclude_item_id else ()
+            partitions = [(item_type, item_status)] if item_type else None
             
-            if features is None:
-                print("⚠️ Could not extract features from image.")
+            if query_features is not None:
+                query = self._query_vector(query_features)
+                if self._use_prefilter(histogram, partitions, allowed_ids):
+                    candidates = self.histogram_index.search(
+                        histogram, partitions=partitions,
+                        k=self._setting('VISUAL_PREFILTER_CANDIDATES', 300), exclude_ids=exclude_ids,
+                        allowed_ids=allowed_ids
+                    )
+                    hits = self._rerank(query, [item_id for item_id, _ in candidates], threshold, max_results)
+                    self.search_counts['prefiltered'] += 1
+                else:
+                    hits = index.search(query, partitions=partitions, k=max_results, threshold=threshold,
+                                        exclude_ids=exclude_ids, allowed_ids=allowed_ids)
+                    self.search_counts['full_scan'] += 1
+            elif histogram is not None and self.histogram_index is not None:
+                # Degraded mode: no image model, so match on colour and edges alone
+                index = self.histogram_index
+                hits = index.search(histogram, partitions=partitions, k=max_results,
+                                    threshold=self._setting('VISUAL_HISTOGRAM_THRESHOLD', 0.90), exclude_ids=exclude_ids,
+                                    allowed_ids=allowed_ids)
+                self.search_counts['histogram_only'] += 1
+            else:
+                return []
+            if not hits:
                 return []
             
-            # 2. Save using the extracted features
-            saved = self.save_image_embedding(item_id, features)
-            if not saved:
-                print("⚠️ Failed to save embedding.")
-            
-            # 3. Find similar items using the same features (exclude current item)
-            matches = self.find_similar_items(features, exclude_item_id=item_id)
+            # Only the top-k rows are loaded as ORM objects
+            embeddings = ImageEmbedding.query.options(joinedload(ImageEmbedding.item)).filter(
+                ImageEmbedding.item_id.in_([item_id for item_id, _ in hits])
+            ).all()
+            by_item = {embedding.item_id: embedding for embedding in embeddings}
             
-            print(f"✅ Visual Scan Complete. Saved: {saved}, Matches found: {len(matches)}")
-            return matches
+            similar_items = []
+            for item_id, similarity in hits:
+                embedding = by_item.get(item_id)
+                if embedding is None:
+                    # Deleted in another process since the index was loaded
+                    self.remove_item(item_id)
+                    continue
+                partition = (embedding.item.item_type, embedding.item.item_status)
+                if partition != index.partition_of(item_id):
+                    # Status changed in another process; re-home it and drop the hit
+                    self.update_item_partition(item_id, *partition)
+                    if partitions is not None and partition not in partitions:
+                        continue
+                similar_items.append({
+                    'item': embedding.item,
+                    'similarity': similarity,
+                    'embedding_id': embedding.image_embedding_id
+                })
+            return similar_items
             
         except Exception as e:
-            print(f"❌ Error in process_new_item: {e}")
+            print(f"❌ Error finding similar items: {e}")
+            return []
+    
+    def pair_similarities(self, item_id, other_ids):
+        """Cosine similarity between an item's resident embedding and each of other_ids that has one"""
+        index = self._ensure_index()
+        query = EmbeddingIndex.normalize(index.get_vector(item_id))
+        if query is None:
+            return {}
+        scores = {}
+        for other_id in other_ids:
+            vector = EmbeddingIndex.normalize(index.get_vector(other_id))
+            if vector is not None and vector.shape == query.shape:
+                scores[other_id] = float(vector @ query)
+        return scores
+    
+    def _read_bytes(self, image_input):
+        """Read the raw bytes of an image stream or path"""
+        if hasattr(image_input, 'seek') and hasattr(image_input, 'read'):
+            image_input.seek(0)
+            return image_input.read()
+        if isinstance(image_input, str):
+            with open(image_input, 'rb') as f:
+                return f.read()
+        return None
+    
+    def get_cached_features(self, content_hash):
+        """
+        (stored encoding, index-space vector) for identical image bytes run through
+        the same model and inference backend, or None
+        """
+        entry = EmbeddingCacheEntry.query.filter_by(
+            cache_content_hash=content_hash, cache_model=self.model_tag, cache_backend=self.inference_backend
+        ).first()
+        if entry is None:
+            return None
+        vector = self._to_index_space(*decode_embedding(entry.cache_embedding_data))
+        if vector is None:
+            # Encoded under a PCA projection that is no longer active; re-extract and re-cache
+            db.session.delete(entry)
+            db.session.commit()
+            return None
+        db.session.query(EmbeddingCacheEntry).filter_by(cache_id=entry.cache_id).update({
+            'cache_hit_count': EmbeddingCacheEntry.cache_hit_count + 1,
+            'cache_last_hit_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        return entry.cache_embedding_data, vector
+    
+    def cache_features(self, content_hash, encoded):
+        """Remember the stored encoding of these image bytes' features"""
+        try:
+            with db.session.begin_nested():
+                db.session.add(EmbeddingCacheEntry(
+                    cache_content_hash=content_hash,
+                    cache_model=self.model_tag,
+                    cache_backend=self.inference_backend,
+                    cache_embedding_data=encoded,
+                    cache_hit_count=0
+                ))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker cached the same image first
+            db.session.rollback()
+    
+    def extract_features_cached(self, image_input):
+        """
+        extract_features, skipping inference when identical bytes were embedded before.
+        Returns (features, encoded): raw features, or index-space ones on a cache hit
+        (the search accepts both), plus their encoding in the configured storage format.
+        """
+        data = self._read_bytes(image_input)
+        if not data:
+            return None, None
+        content_hash = hashlib.sha256(data).hexdigest()
+        # The backend is only final once the model loaded (int8 may fall back to eager)
+        if not self.warm_up():
+            return None, None
+        
+        try:
+            cached = self.get_cached_features(content_hash)
+        except Exception as e:
+            print(f"⚠️ Embedding cache lookup failed: {e}")
+            db.session.rollback()
+            cached = None
+        
+        if cached is not None:
+            self.cache_hits += 1
+            print(f"♻️ Embedding cache hit ({self.cache_hits} hits / {self.cache_misses} misses)")
+            encoded, features = cached
+            return features, encoded
+        
+        self.cache_misses += 1
+        features = self.extract_features(io.BytesIO(data))
+        if features is None:
+            return None, None
+        encoded = self.encode_features(features)
+        self.cache_features(content_hash, encoded)
+        return features, encoded
+    
+    def cache_stats(self):
+        """Hit/miss counters for this process plus totals from the cache table"""
+        entries, total_hits = db.session.query(
+            db.func.count(EmbeddingCacheEntry.cache_id),
+            db.func.coalesce(db.func.sum(EmbeddingCacheEntry.cache_hit_count), 0)
+        ).one()
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'process_hits': self.cache_hits,
+            'process_misses': self.cache_misses,
+            'process_hit_rate': round(self.cache_hits / lookups, 3) if lookups else None,
+            'cached_images': entries,
+            'total_hits': int(total_hits)
+        }
+    
+    def search_stats(self):
+        return {
+            **self.search_counts,
+            'histograms_indexed': len(self.histogram_index) if self.histogram_index is not None else None
+        }
+    
+    @staticmethod
+    def _refresh_entry(index, item_id, partition, vector):
+        """How to re-file one item: 'upsert', 'move', or None when nothing actually changed"""
+        current = index.partition_of(item_id)
+        if current is not None:
+            stored = index.get_vector(item_id)
+            unit = EmbeddingIndex.normalize(vector)
+            if stored is not None and unit is not None and stored.shape == unit.shape and np.allclose(stored, unit, atol=1e-4):
+                return 'move' if current != partition else None
+        return 'upsert'
+    
+    def refresh_items(self, item_ids):
+        """
+        Apply a batch of item changes from the change feed: re-read their rows
+        and upsert, move or remove just those entries. None drops the indexes
+        so the next search reloads them from the tables.
+        """
+        if item_ids is None:
+            with self._index_lock:
+                self.index = None
+                self.histogram_index = None
+            return
+        item_ids = list(item_ids)
+        for index, load_rows in ((self.index, self._load_embedding_rows),
+                                 (self.histogram_index, self._load_histogram_rows)):
+            if index is None or not index.loaded:
+                continue
+            rows = {item_id: (partition, vector) for item_id, partition, vector in load_rows(item_ids)}
+            upserts, removes, moves = [], [], []
+            for item_id in item_ids:
+                if item_id in rows:
+                    partition, vector = rows[item_id]
+                    action = self._refresh_entry(index, item_id, partition, vector)
+                    if action == 'upsert':
+                        upserts.append((item_id, vector, partition))
+                    elif action == 'move':
+                        moves.append((item_id, partition))
+                elif item_id in index:
+                    removes.append(item_id)
+            self._apply_changes(index, upserts=upserts, removes=removes, moves=moves)
+        if self.index is not None and self.histogram_index is not None:
+            for item_id in item_ids:
+                if item_id in self.histogram_index and item_id not in self.index:
+                    self._unembedded_ids.add(item_id)
+                else:
+                    self._unembedded_ids.discard(item_id)
+    
+    def update_item_partition(self, item_id, item_type, item_status):
+        """Move an item's vectors after its type or status changed"""
+        for index in (self.index, self.histogram_index):
+            if index is not None and index.loaded:
+                index.move(item_id, (item_type, item_status))
+    
+    def remove_item(self, item_id):
+        """Forget an item's vectors after it was deleted"""
+        for index in (self.index, self.histogram_index):
+            if index is not None and index.loaded:
+                index.remove(item_id)
+        self._unembedded_ids.discard(item_id)
+    
+    def embed_image(self, item_id, image_file):
+        """
+        Extract features and the colour histogram for an item's image and store them.
+        Returns (features, histogram, saved); both vectors are None if the image is unreadable.
+        """
+        # Extract features ONCE (or reuse them for a byte-identical upload)
+        features, encoded = self.extract_features_cached(image_file)
+        histogram = self.extract_histogram(image_file)
+        
+        if features is None and histogram is None:
+            print("⚠️ Could not extract features from image.")
+            return None, None, False
+        if features is None:
+            print("⚠️ Image model unavailable, matching on colour histogram only")
+        
+        saved = self.save_image_embedding(item_id, features, histogram, encoded=encoded)
+        if not saved:
+            print("⚠️ Failed to save embedding.")
+        return features, histogram, saved
+    
+    def process_new_item(self, item_id, image_file, allowed_ids=None):
+        """
+        Main entry point: Extracts ONCE, Saves, then Matches.
+        allowed_ids limits the search to candidates passing the pruning rules.
+        Errors propagate so the job queue can retry or fail the job.
+        """
+        print(f"🖼️ Visual Processing started for Item {item_id}")
+        # 1-2. Extract and save
+        features, histogram, saved = self.embed_image(item_id, image_file)
+        if features is None and histogram is None:
             return []
+        
+        # 3. Find similar pending items of the opposite type using the same features
+        item = db.session.get(Item, item_id)
+        matches = self.find_similar_items(
+            features, exclude_item_id=item_id,
+            item_type=OPPOSITE_TYPE.get(item.item_type) if item is not None else None,
+            histogram=histogram, allowed_ids=allowed_ids
+        )
+        
+        print(f"✅ Visual Scan Complete. Saved: {saved}, Matches found: {len(matches)}")
+        return matches
+
+def prune_embedding_cache(max_age_days=30, max_entries=50000):
+    """
+    Drop cache entries unused for max_age_days, then the least recently used
+    beyond max_entries. Returns the number of entries deleted.
+    """
+    last_used = db.func.coalesce(EmbeddingCacheEntry.cache_last_hit_at, EmbeddingCacheEntry.cache_created_at)
+    deleted = db.session.query(EmbeddingCacheEntry).filter(
+        last_used < datetime.utcnow() - timedelta(days=max_age_days)
+    ).delete(synchronize_session=False)
+    excess = db.session.query(EmbeddingCacheEntry).count() - max_entries
+    if excess > 0:
+        oldest = db.session.query(EmbeddingCacheEntry.cache_id).order_by(last_used).limit(excess).subquery()
+        deleted += db.session.query(EmbeddingCacheEntry).filter(
+            EmbeddingCacheEntry.cache_id.in_(db.session.query(oldest.c.cache_id))
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    if deleted:
+        print(f"🧹 Pruned {deleted} embedding cache entries")
+    return deleted
 
 # Global instance
-image_engine = ImageRecognitionEngine()
\ No newline at end of file
+image_engine = ImageRecognitionEngine()
+
+
+@index_listener
+def refresh_visual_index(item_ids):
+    image_engine.refresh_items(item_ids)
\ No newline at end of file
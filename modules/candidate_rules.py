@@ -0,0 +1,216 @@
+import threading
+from datetime import timedelta
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import case
+from models import db, Item
+
+# name -> function(item) returning a SQL predicate on candidate Items, or None when it can't prune
+PRUNING_RULES = {}
+# name -> function(lost, found, lost_rows, found_rows) returning a boolean mask over those pairs,
+# the same rule for the rematch batch (lost/found expose dates, categories, locations arrays)
+PAIR_RULES = {}
+
+
+def pruning_rule(name):
+    """Register a candidate pruning rule under a MATCH_PRUNING_RULES name"""
+    def register(rule):
+        PRUNING_RULES[name] = rule
+        return rule
+    return register
+
+
+def pair_rule(name):
+    """Register the batch (array) form of a pruning rule"""
+    def register(rule):
+        PAIR_RULES[name] = rule
+        return rule
+    return register
+
+
+def _setting(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+
+def catch_all_categories():
+    """Categories a reporter picks when nothing fits (MATCH_CATCH_ALL_CATEGORIES): they can match anything"""
+    return {name.strip() for name in _setting('MATCH_CATCH_ALL_CATEGORIES', 'Others').split(',') if name.strip()}
+
+
+def parse_adjacency(text):
+    """'A=B,C; D=C' -> {'A': {'B', 'C'}, 'B': {'A'}, 'C': {'A', 'D'}, 'D': {'C'}} (symmetric)"""
+    adjacency = {}
+    for entry in (text or '').split(';'):
+        if '=' not in entry:
+            continue
+        name, neighbours = entry.split('=', 1)
+        name = name.strip()
+        for neighbour in (part.strip() for part in neighbours.split(',')):
+            if name and neighbour:
+                adjacency.setdefault(name, set()).add(neighbour)
+                adjacency.setdefault(neighbour, set()).add(name)
+    return adjacency
+
+
+@pruning_rule('date_window')
+def date_window(item):
+    """An item can't be found (much) before it was lost: found date >= lost date - MATCH_DATE_WINDOW_DAYS"""
+    if item.item_date_lost_found is None:
+        return None
+    window = timedelta(days=_setting('MATCH_DATE_WINDOW_DAYS', 2))
+    if item.item_type == 'lost':
+        return Item.item_date_lost_found >= item.item_date_lost_found - window
+    return Item.item_date_lost_found <= item.item_date_lost_found + window
+
+
+@pair_rule('date_window')
+def date_window_pairs(lost, found, lost_rows, found_rows):
+    window = np.timedelta64(int(_setting('MATCH_DATE_WINDOW_DAYS', 2) * 86400), 's')
+    return found.dates[found_rows] >= lost.dates[lost_rows] - window
+
+
+def neighbour_mask(lost_values, found_values, adjacency, wildcards=()):
+    """Pairs whose values are equal, adjacent, or where either side is a wildcard"""
+    values = np.concatenate((lost_values, found_values)).astype(str)
+    names, codes = np.unique(values, return_inverse=True)
+    position = {name: code for code, name in enumerate(names)}
+    allowed = np.eye(len(names), dtype=bool)
+    for name, neighbours in adjacency.items():
+        for neighbour in neighbours:
+            if name in position and neighbour in position:
+                allowed[position[name], position[neighbour]] = True
+    for name in wildcards:
+        if name in position:
+            allowed[position[name], :] = allowed[:, position[name]] = True
+    return allowed[codes[:len(lost_values)], codes[len(lost_values):]]
+
+
+@pruning_rule('category')
+def same_or_adjacent_category(item):
+    catch_all = catch_all_categories()
+    if not item.item_category or item.item_category in catch_all:
+        return None
+    adjacency = parse_adjacency(_setting('MATCH_ADJACENT_CATEGORIES', ''))
+    categories = {item.item_category, *adjacency.get(item.item_category, ()), *catch_all}
+    return Item.item_category.in_(sorted(categories))
+
+
+@pair_rule('category')
+def same_or_adjacent_category_pairs(lost, found, lost_rows, found_rows):
+    return neighbour_mask(lost.categories[lost_rows], found.categories[found_rows],
+                          parse_adjacency(_setting('MATCH_ADJACENT_CATEGORIES', '')), catch_all_categories())
+
+
+@pruning_rule('location')
+def same_or_adjacent_location(item):
+    if not item.item_location:
+        return None
+    adjacency = parse_adjacency(_setting('MATCH_ADJACENT_LOCATIONS', ''))
+    locations = {item.item_location, *adjacency.get(item.item_location, ())}
+    return Item.item_location.in_(sorted(locations))
+
+
+@pair_rule('location')
+def same_or_adjacent_location_pairs(lost, found, lost_rows, found_rows):
+    return neighbour_mask(lost.locations[lost_rows], found.locations[found_rows],
+                          parse_adjacency(_setting('MATCH_ADJACENT_LOCATIONS', '')))
+
+
+def rule_names():
+    """Configured MATCH_PRUNING_RULES, in order"""
+    names = [name.strip() for name in _setting('MATCH_PRUNING_RULES', 'date_window').split(',') if name.strip()]
+    for name in names:
+        if name not in PRUNING_RULES:
+            raise ValueError(f"Unknown candidate pruning rule '{name}'")
+    return names
+
+
+def active_rules(item):
+    """[(name, predicate)] for the configured rules that apply to this item"""
+    rules = []
+    for name in rule_names():
+        predicate = PRUNING_RULES[name](item)
+        if predicate is not None:
+            rules.append((name, predicate))
+    return rules
+
+
+class PruningStats:
+    """Per-process counts of the candidates each rule removed, for /admin/ai-stats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reports = 0
+        self.candidates = 0
+        self.kept = 0
+        self.removed = {}
+
+    def record(self, candidates, kept, removed):
+        with self._lock:
+            self.reports += 1
+            self.candidates += candidates
+            self.kept += kept
+            for name, count in removed.items():
+                self.removed[name] = self.removed.get(name, 0) + count
+
+    def stats(self):
+        with self._lock:
+            return {
+                'reports': self.reports,
+                'candidates': self.candidates,
+                'kept': self.kept,
+                'removed_by_rule': dict(self.removed),
+                'kept_ratio': round(self.kept / self.candidates, 4) if self.candidates else None,
+            }
+
+
+pruning_stats = PruningStats()
+
+
+def allowed_candidates(item, item_type, item_status='pending'):
+    """
+    Ids of the (item_type, item_status) items passing every active rule, or
+    None when no rule applies to this report. The rules run as one indexed
+    query (ix_items_type_status_*) before any scoring; the text and visual
+    searches then only score these ids. With MATCH_PRUNING_STATS the query
+    reads the whole partition instead, so each removal can be charged to the
+    first rule it fails, in MATCH_PRUNING_RULES order.
+    """
+    rules = active_rules(item)
+    if not rules:
+        return None
+    query = db.session.query(Item.item_id).filter(Item.item_type == item_type, Item.item_status == item_status)
+    if not _setting('MATCH_PRUNING_STATS', False):
+        return {item_id for item_id, in query.filter(*[predicate for _, predicate in rules])}
+
+    flags = [case((predicate, 1), else_=0) for _, predicate in rules]
+    allowed = set()
+    removed = {}
+    candidates = 0
+    for item_id, *passed in query.add_columns(*flags):
+        candidates += 1
+        failed = next((name for (name, _), ok in zip(rules, passed) if not ok), None)
+        if failed is None:
+            allowed.add(item_id)
+        else:
+            removed[failed] = removed.get(failed, 0) + 1
+    pruning_stats.record(candidates, len(allowed), removed)
+    return allowed
+
+
+def prune_pairs(lost, found, lost_rows, found_rows):
+    """
+    Mask of the (lost_rows, found_rows) pairs passing every configured rule,
+    the batch counterpart of allowed_candidates, plus removals per rule.
+    """
+    keep = np.ones(len(lost_rows), dtype=bool)
+    removed = {}
+    for name in rule_names():
+        if not len(lost_rows):
+            break
+        passed = PAIR_RULES[name](lost, found, lost_rows, found_rows)
+        removed[name] = int((keep & ~passed).sum())
+        keep &= passed
+    return keep, removed
@@ -0,0 +1,95 @@
+import os
+import struct
+import zlib
+from collections import namedtuple
+import numpy as np
+
+# Blob layout (little endian), followed by the vector data:
+#   magic 'EMB' | version u8 | dtype u8 | pad | dim u16 | projection id u32 | model tag 16s
+HEADER = struct.Struct('<3sBBxHI16s')
+MAGIC = b'EMB'
+FORMAT_VERSION = 1
+
+DTYPES = {0: np.float32, 1: np.float16}
+DTYPE_CODES = {np.dtype(np.float32): 0, np.dtype(np.float16): 1}
+
+# Vectors written before the header existed are raw float32 ResNet50 features
+LEGACY_MODEL = 'resnet50'
+
+EmbeddingMeta = namedtuple('EmbeddingMeta', ['version', 'dtype', 'dim', 'projection_id', 'model'])
+
+
+def encode_embedding(vector, dtype=np.float32, projection_id=0, model=LEGACY_MODEL):
+    """Serialize a vector with a format header"""
+    vector = np.asarray(vector, dtype=dtype).ravel()
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, DTYPE_CODES[np.dtype(dtype)],
+        vector.shape[0], projection_id, model.encode('ascii')[:16]
+    )
+    return header + vector.tobytes()
+
+
+def decode_embedding(blob):
+    """Return (float32 vector, EmbeddingMeta) for both headered and legacy blobs"""
+    if len(blob) >= HEADER.size and blob[:3] == MAGIC:
+        _, version, dtype_code, dim, projection_id, model = HEADER.unpack_from(blob)
+        dtype = DTYPES[dtype_code]
+        vector = np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER.size).astype(np.float32)
+        meta = EmbeddingMeta(version, np.dtype(dtype).name, dim, projection_id,
+                             model.rstrip(b'\0').decode('ascii'))
+        return vector, meta
+
+    vector = np.frombuffer(blob, dtype=np.float32)
+    return vector, EmbeddingMeta(0, 'float32', vector.shape[0], 0, LEGACY_MODEL)
+
+
+class PCAProjection:
+    """
+    Linear projection onto the top principal directions of our own embeddings.
+    Fitted without centering, so dot products (and therefore cosine thresholds)
+    are preserved approximately rather than shifted by the corpus mean.
+    """
+
+    def __init__(self, components):
+        self.components = np.ascontiguousarray(components, dtype=np.float32)  # (dims, input_dim)
+        self.projection_id = zlib.crc32(self.components.tobytes()) or 1
+
+    @property
+    def dims(self):
+        return self.components.shape[0]
+
+    @property
+    def input_dim(self):
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, vectors, dims=256, max_samples=50000, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[0] > max_samples:
+            rows = np.random.default_rng(seed).choice(vectors.shape[0], size=max_samples, replace=False)
+            vectors = vectors[rows]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        unit = vectors / norms
+        # Eigenvectors of the second-moment matrix, largest first
+        eigenvalues, eigenvectors = np.linalg.eigh(unit.T.astype(np.float64) @ unit)
+        order = np.argsort(eigenvalues)[::-1][:dims]
+        return cls(eigenvectors[:, order].T)
+
+    def transform(self, vectors):
+        return np.asarray(vectors, dtype=np.float32) @ self.components.T
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez(tmp_path, components=self.components)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        if not path or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data['components'])
@@ -0,0 +1,437 @@
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from itertools import chain
+import numpy as np
+from modules.visual_index import EmbeddingIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single app process there
+    fcntl = None
+
+MANIFEST = 'CURRENT'
+LOCK_FILE = 'writer.lock'
+SCORE_CHUNK_BYTES = 32 << 20  # contiguous slice of the vectors file scored per block during a search
+DEAD = -1
+
+
+class MemmapIndex:
+    """
+    Embedding index kept on disk and shared by every worker process.
+
+    vectors.<generation>.f32  flat float32 unit vectors, append-only, opened with np.memmap
+    sidecar.<version>.npy     int64 (3, count): item id, partition code, argsort of ids
+    CURRENT                   JSON manifest naming the live files, swapped with os.replace
+
+    Readers map the files read-only, so the OS page cache holds a single copy
+    for all workers and per-process memory does not grow with the dataset.
+    Writes take an exclusive flock, append vectors, write a new sidecar and
+    swap the manifest; readers notice the new manifest on their next call.
+    Replaced or deleted rows are marked dead and dropped when the writer
+    compacts into a new generation.
+    """
+
+    def __init__(self, path, partition_keys, space_id=0, compact_ratio=0.25):
+        self.path = path
+        self.all_partitions = [tuple(key) for key in partition_keys]
+        self._codes = {key: code for code, key in enumerate(self.all_partitions)}
+        self.space_id = space_id
+        self.compact_ratio = compact_ratio
+        self.loaded = False
+        self._manifest = None
+        self._manifest_stamp = None
+        self._vectors = None
+        self._sidecar = None
+        self._lock = threading.RLock()
+
+    # ===== READING =====
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _refresh(self):
+        """Re-open the store if another process swapped in a new manifest"""
+        try:
+            stat = os.stat(self._file(MANIFEST))
+        except FileNotFoundError:
+            self._manifest = self._vectors = self._sidecar = None
+            self._manifest_stamp = None
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._manifest_stamp:
+            return
+        with self._lock:
+            for _ in range(3):
+                try:
+                    with open(self._file(MANIFEST)) as f:
+                        manifest = json.load(f)
+                    count, dim = manifest['count'], manifest['dim']
+                    sidecar = np.load(self._file(manifest['sidecar']), mmap_mode='r') if count else None
+                    vectors = np.memmap(self._file(manifest['vectors']), dtype=np.float32, mode='r',
+                                        shape=(count, dim)) if count else None
+                    break
+                except FileNotFoundError:
+                    # Files were cleaned up between reading the manifest and opening them
+                    continue
+            else:
+                return
+            self._manifest, self._sidecar, self._vectors = manifest, sidecar, vectors
+            self._manifest_stamp = stamp
+
+    @property
+    def _count(self):
+        return self._manifest['count'] if self._manifest else 0
+
+    def _row_of(self, item_id):
+        """Live row of an item via binary search over the sorted id order, or None"""
+        if not self._count:
+            return None
+        ids, order = self._sidecar[0], self._sidecar[2]
+        position = np.searchsorted(ids, item_id, sorter=order)
+        if position < self._count and ids[order[position]] == item_id:
+            return int(order[position])
+        return None
+
+    def __len__(self):
+        self._refresh()
+        return self._manifest['live'] if self._manifest else 0
+
+    def __contains__(self, item_id):
+        self._refresh()
+        return self._row_of(item_id) is not None
+
+    @property
+    def item_ids(self):
+        self._refresh()
+        if not self._count:
+            return set()
+        ids = np.asarray(self._sidecar[0])
+        return set(ids[ids != DEAD].tolist())
+
+    def partition_of(self, item_id):
+        self._refresh()
+        row = self._row_of(item_id)
+        return self.all_partitions[int(self._sidecar[1][row])] if row is not None else None
+
+    def partition_size(self, key):
+        self._refresh()
+        return self._manifest['sizes'].get('/'.join(key), 0) if self._manifest else 0
+
+    def partition_keys(self):
+        self._refresh()
+        return [key for key in self.all_partitions if self.partition_size(key)]
+
+    def partition_sizes(self):
+        self._refresh()
+        return dict(self._manifest['sizes']) if self._manifest else {}
+
+    def get_vector(self, item_id):
+        self._refresh()
+        row = self._row_of(item_id)
+        return np.array(self._vectors[row]) if row is not None else None
+
+    def search(self, query, partitions=None, k=5, threshold=None, exclude_ids=(), allowed_ids=None):
+        """
+        Return up to k (item_id, similarity) pairs from the given partitions, best
+        first. With allowed_ids only those items' rows are read and scored.
+        """
+        self._refresh()
+        # Another thread may swap in a newer manifest mid-search; stay on this one
+        manifest, sidecar, vectors = self._manifest, self._sidecar, self._vectors
+        unit = EmbeddingIndex.normalize(query)
+        count = manifest['count'] if manifest else 0
+        if unit is None or k <= 0 or not count or unit.shape[0] != manifest['dim']:
+            return []
+        keys = self.all_partitions if partitions is None else partitions
+        codes = [self._codes[key] for key in keys if key in self._codes]
+        if not codes:
+            return []
+
+        wanted = k + len(exclude_ids)
+        codes = np.asarray(codes, dtype=np.int64)
+        # Slices of the memmap are views, so scoring one reads its pages without copying
+        # them; only the per-slice scores (4 bytes a row) are allocated
+        chunk_rows = max(1, SCORE_CHUNK_BYTES // (4 * manifest['dim']))
+        best_rows, best_scores = [], []
+        if allowed_ids is not None:
+            # Look the allowed ids up in the sorted id order and score just their rows,
+            # a bounded number at a time so the gathered copy stays within the budget
+            wanted_ids = np.fromiter(allowed_ids, dtype=np.int64, count=len(allowed_ids))
+            ids, order = sidecar[0], sidecar[2]
+            positions = np.minimum(np.searchsorted(ids, wanted_ids, sorter=order), count - 1)
+            rows = np.asarray(order)[positions]
+            rows = np.sort(rows[(ids[rows] == wanted_ids) & np.isin(sidecar[1][rows], codes)])
+            for start in range(0, rows.shape[0], chunk_rows):
+                chunk = rows[start:start + chunk_rows]
+                scores = vectors[chunk] @ unit
+                if scores.shape[0] > wanted:
+                    top = np.argpartition(-scores, wanted - 1)[:wanted]
+                    chunk, scores = chunk[top], scores[top]
+                best_rows.append(chunk)
+                best_scores.append(scores)
+        else:
+            for start in range(0, count, chunk_rows):
+                stop = min(start + chunk_rows, count)
+                wanted_rows = np.isin(sidecar[1][start:stop], codes)
+                if not wanted_rows.any():
+                    continue
+                scores = vectors[start:stop] @ unit
+                rows = np.flatnonzero(wanted_rows)
+                scores = scores[rows]
+                if scores.shape[0] > wanted:
+                    top = np.argpartition(-scores, wanted - 1)[:wanted]
+                    rows, scores = rows[top], scores[top]
+                best_rows.append(rows + start)
+                best_scores.append(scores)
+        if not best_rows:
+            return []
+
+        rows = np.concatenate(best_rows)
+        scores = np.concatenate(best_scores)
+        results = []
+        for i in np.argsort(-scores):
+            if threshold is not None and scores[i] < threshold:
+                break
+            item_id = int(sidecar[0][rows[i]])
+            if item_id in exclude_ids:
+                continue
+            results.append((item_id, float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+    # ===== WRITING =====
+    @contextmanager
+    def _writing(self):
+        """Exclusive writer section across threads and processes"""
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self._file(LOCK_FILE), 'a+') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._manifest_stamp = None  # always re-read under the lock
+                    self._refresh()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _compatible(self, dim=None):
+        manifest = self._manifest
+        return (manifest is not None and manifest['space_id'] == self.space_id
+                and manifest['partitions'] == [list(key) for key in self.all_partitions]
+                and (dim is None or not manifest['count'] or manifest['dim'] == dim))
+
+    def _arrays(self):
+        """Writable copies of the id and partition columns"""
+        if not self._count:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.array(self._sidecar[0]), np.array(self._sidecar[1])
+
+    def _append_vectors(self, filename, vectors):
+        """Append after the published rows, dropping any an interrupted writer left unpublished"""
+        manifest = self._manifest
+        published = manifest['count'] * manifest['dim'] * 4 if manifest else 0
+        with open(self._file(filename), 'ab') as f:
+            # Rows past `count` were never in a manifest; left in place they would
+            # shift every later row out of line with the sidecar
+            f.truncate(published)
+            for vector in vectors:
+                f.write(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _publish(self, generation, vectors_file, ids, parts, dim, order=None):
+        """Write the sidecar for these rows and atomically point the manifest at it (order: reuse when ids are unchanged)"""
+        version = (self._manifest['version'] + 1) if self._manifest else 1
+        sidecar_file = f"sidecar.{version}.npy"
+        if order is None:
+            order = np.argsort(ids, kind='stable')
+        sidecar = np.stack([ids, parts, order]).astype(np.int64)
+        tmp_path = self._file(f"{sidecar_file}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, sidecar)
+        os.replace(tmp_path, self._file(sidecar_file))
+
+        live = parts != DEAD
+        sizes = {}
+        for code, key in enumerate(self.all_partitions):
+            size = int(np.count_nonzero(parts == code))
+            if size:
+                sizes['/'.join(key)] = size
+        manifest = {
+            'generation': generation,
+            'version': version,
+            'vectors': vectors_file,
+            'sidecar': sidecar_file,
+            'count': int(ids.shape[0]),
+            'live': int(np.count_nonzero(live)),
+            'dim': int(dim),
+            'space_id': self.space_id,
+            'partitions': [list(key) for key in self.all_partitions],
+            'sizes': sizes,
+        }
+        tmp_path = self._file(f"{MANIFEST}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._file(MANIFEST))
+        self._refresh()
+        self._cleanup(generation, version)
+
+    def _cleanup(self, generation, version):
+        """Delete files two swaps old; readers that just read the previous manifest can still open theirs"""
+        for name in os.listdir(self.path):
+            parts = name.split('.')
+            if len(parts) != 3 or not parts[1].isdigit():
+                continue
+            if (parts[0] == 'sidecar' and int(parts[1]) < version - 1) or \
+               (parts[0] == 'vectors' and int(parts[1]) < generation - 1):
+                try:
+                    os.remove(self._file(name))
+                except OSError:
+                    pass
+
+    def _new_generation(self, rows, dim):
+        """Write rows of (item_id, partition code, unit vector) as a fresh vectors file"""
+        generation = (self._manifest['generation'] + 1) if self._manifest else 1
+        vectors_file = f"vectors.{generation}.f32"
+        ids, parts = [], []
+        with open(self._file(vectors_file), 'wb') as f:
+            for item_id, code, vector in rows:
+                f.write(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+                ids.append(item_id)
+                parts.append(code)
+            f.flush()
+            os.fsync(f.fileno())
+        self._publish(generation, vectors_file, np.array(ids, dtype=np.int64), np.array(parts, dtype=np.int64), dim)
+
+    def _maybe_compact(self):
+        manifest = self._manifest
+        if not manifest or manifest['count'] < 1000:
+            return
+        dead = manifest['count'] - manifest['live']
+        if dead / manifest['count'] <= self.compact_ratio:
+            return
+        live_rows = np.flatnonzero(self._sidecar[1] != DEAD)
+        rows = ((int(self._sidecar[0][row]), int(self._sidecar[1][row]), self._vectors[row]) for row in live_rows)
+        self._new_generation(rows, manifest['dim'])
+
+    def build(self, rows):
+        """
+        Create the store from (item_id, partition_key, vector) rows. If another
+        process built a compatible store while we waited for the lock, keep it.
+        """
+        with self._writing():
+            if not self._compatible():
+                def unit_rows():
+                    for item_id, key, vector in rows:
+                        unit = EmbeddingIndex.normalize(vector)
+                        if unit is not None and key in self._codes:
+                            yield item_id, self._codes[key], unit
+                unit_rows = unit_rows()
+                first = next(unit_rows, None)
+                dim = first[2].shape[0] if first is not None else 0
+                self._new_generation(chain([first], unit_rows) if first is not None else [], dim)
+            self.loaded = True
+
+    def upsert(self, item_id, vector, key):
+        return self.upsert_many([(item_id, vector, key)]) == 1
+
+    def upsert_many(self, rows):
+        """Add or replace (item_id, vector, partition_key) rows with a single manifest swap"""
+        units = []
+        for item_id, vector, key in rows:
+            unit = EmbeddingIndex.normalize(vector)
+            if unit is not None and key in self._codes:
+                units.append((item_id, unit, self._codes[key]))
+        if not units:
+            return 0
+        dim = units[0][1].shape[0]
+        units = [row for row in units if row[1].shape[0] == dim]
+        with self._writing():
+            if not self._compatible(dim):
+                return 0
+            ids, parts = self._arrays()
+            for item_id, _, _ in units:
+                row = self._row_of(item_id)
+                if row is not None:
+                    ids[row], parts[row] = DEAD, DEAD
+            manifest = self._manifest
+            self._append_vectors(manifest['vectors'], [unit for _, unit, _ in units])
+            # A repeated id within the batch: only its last row stays live
+            new_ids = np.array([item_id for item_id, _, _ in units], dtype=np.int64)
+            new_parts = np.array([code for _, _, code in units], dtype=np.int64)
+            _, last = np.unique(new_ids[::-1], return_index=True)
+            keep = np.zeros(len(units), dtype=bool)
+            keep[len(units) - 1 - last] = True
+            new_ids[~keep], new_parts[~keep] = DEAD, DEAD
+            ids = np.concatenate([ids, new_ids])
+            parts = np.concatenate([parts, new_parts])
+            self._publish(manifest['generation'], manifest['vectors'], ids, parts, dim)
+            self._maybe_compact()
+            return int(keep.sum())
+
+    def move(self, item_id, key):
+        """Change an item's partition; only the sidecar is rewritten"""
+        return self.update_many(moves=[(item_id, key)]) == 1
+
+    def remove(self, item_id):
+        return self.update_many(removes=[item_id]) == 1
+
+    def update_many(self, removes=(), moves=()):
+        """
+        Remove items and move (item_id, partition_key) pairs with a single
+        sidecar rewrite and manifest swap. Returns the number of rows changed.
+        """
+        moves = [(item_id, self._codes[key]) for item_id, key in moves if key in self._codes]
+        removes = list(removes)
+        if not removes and not moves:
+            return 0
+        with self._writing():
+            if not self._count:
+                return 0
+            ids, parts = self._arrays()
+            changed = 0
+            for item_id, code in moves:
+                row = self._row_of(item_id)
+                if row is not None and parts[row] != code:
+                    parts[row] = code
+                    changed += 1
+            removed = 0
+            for item_id in removes:
+                row = self._row_of(item_id)
+                if row is not None and ids[row] != DEAD:
+                    ids[row], parts[row] = DEAD, DEAD
+                    removed += 1
+            if not changed and not removed:
+                return 0
+            manifest = self._manifest
+            # Moves keep every id in place, so the sorted order can be reused
+            order = None if removed else np.array(self._sidecar[2])
+            self._publish(manifest['generation'], manifest['vectors'], ids, parts, manifest['dim'], order)
+            if removed:
+                self._maybe_compact()
+            return changed + removed
+
+    # Same persistence hooks as PartitionedIndex; the store is always on disk
+    def save(self, path=None):
+        pass
+
+    def load(self, path=None, keys=None):
+        """Open an existing compatible store; False means it has to be built"""
+        self._refresh()
+        self.loaded = self._compatible()
+        return self.loaded
+
+    @staticmethod
+    def delete_saved(path):
+        """Remove a store directory so the next load rebuilds it"""
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            return 1
+        return 0
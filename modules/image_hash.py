@@ -0,0 +1,207 @@
+import threading
+import numpy as np
+from PIL import Image
+from models import db, Item
+from modules.index_sync import index_listener, sync_indexes
+
+HASH_SIZE = 8          # 8x8 low frequencies -> 64-bit hash
+HASH_IMAGE_SIZE = 32   # DCT input size
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so the 2-D DCT is two small matrix products"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_DCT = _dct_matrix(HASH_IMAGE_SIZE)
+
+
+def compute_phash(image_input):
+    """
+    64-bit perceptual hash (pHash) of an image path or stream, or None if unreadable.
+    Robust to re-encoding, rescaling and mild crops, so a re-upload or a
+    screenshot of the same photo lands within a few bits.
+    """
+    try:
+        if hasattr(image_input, 'seek'):
+            image_input.seek(0)
+        with Image.open(image_input) as image:
+            # Only 32x32 pixels are needed; let the JPEG decoder skip the rest
+            image.draft('L', (HASH_IMAGE_SIZE * 4, HASH_IMAGE_SIZE * 4))
+            pixels = np.asarray(
+                image.convert('L').resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.LANCZOS),
+                dtype=np.float64
+            )
+    except Exception as e:
+        print(f"⚠️ Could not hash image: {e}")
+        return None
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:])  # the DC term would skew the median
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def hash_to_hex(value):
+    return f"{value:016x}"
+
+
+def hex_to_hash(text):
+    return int(text, 16)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance.
+    A radius-k query only descends into children whose edge distance is
+    within k of the query's distance to the node (triangle inequality), so it
+    touches a small fraction of the nodes for small k.
+    """
+
+    def __init__(self):
+        self._root = None  # node: [hash, item_ids, {distance: child}]
+        self._hash_of = {}  # item_id -> hash, for removal
+
+    def __len__(self):
+        return len(self._hash_of)
+
+    def __contains__(self, item_id):
+        return item_id in self._hash_of
+
+    def add(self, value, item_id):
+        if item_id in self._hash_of:
+            if self._hash_of[item_id] == value:
+                return
+            self.remove(item_id)
+        self._hash_of[item_id] = value
+        if self._root is None:
+            self._root = [value, [item_id], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item_id], {}]
+                return
+            node = child
+
+    def remove(self, item_id):
+        """Drop an item; its node stays in place as a routing point"""
+        value = self._hash_of.pop(item_id, None)
+        if value is None:
+            return False
+        node = self._root
+        while node is not None:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].remove(item_id)
+                return True
+            node = node[2].get(distance)
+        return False
+
+    def search(self, value, max_distance):
+        """All (item_id, distance) within max_distance, closest first"""
+        results = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.extend((item_id, distance) for item_id in node[1])
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda hit: hit[1])
+        return results
+
+
+class DuplicateIndex:
+    """
+    Process-wide BK-tree over stored item image hashes.
+    Loaded from the items table on first use, then kept current by the
+    index change feed (edits and deletes in any process).
+    """
+
+    def __init__(self):
+        self.tree = BKTree()
+        self._max_item_id = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Load hashes of items newer than the last one seen"""
+        rows = db.session.query(Item.item_id, Item.item_image_hash).filter(
+            Item.item_id > self._max_item_id,
+            Item.item_image_hash.isnot(None)
+        ).order_by(Item.item_id).yield_per(5000)
+        for item_id, image_hash in rows:
+            self.tree.add(hex_to_hash(image_hash), item_id)
+            self._max_item_id = max(self._max_item_id, item_id)
+
+    def refresh_items(self, item_ids):
+        """Re-read the hashes of changed items; None starts over from the table"""
+        with self._lock:
+            if item_ids is None:
+                self.tree = BKTree()
+                self._max_item_id = 0
+                return
+            hashes = dict(db.session.query(Item.item_id, Item.item_image_hash).filter(Item.item_id.in_(list(item_ids))))
+            for item_id in item_ids:
+                image_hash = hashes.get(item_id)
+                if image_hash is None:
+                    self.tree.remove(item_id)
+                elif item_id <= self._max_item_id:
+                    # Newer items are loaded by _refresh
+                    self.tree.add(hex_to_hash(image_hash), item_id)
+
+    def add(self, item_id, value):
+        with self._lock:
+            self.tree.add(value, item_id)
+
+    def remove(self, item_id):
+        with self._lock:
+            self.tree.remove(item_id)
+
+    def find_items(self, value, max_distance=6, exclude_item_id=None):
+        """Items whose image hash is within max_distance bits: [(Item, distance)], closest first"""
+        sync_indexes()
+        with self._lock:
+            self._refresh()
+            hits = [(item_id, distance) for item_id, distance in self.tree.search(value, max_distance)
+                    if item_id != exclude_item_id]
+        if not hits:
+            return []
+        items = {item.item_id: item for item in Item.query.filter(Item.item_id.in_([item_id for item_id, _ in hits]))}
+        results = []
+        for item_id, distance in hits:
+            item = items.get(item_id)
+            if item is None or item.item_image_hash is None:
+                # Deleted, or image removed, in the meantime
+                self.remove(item_id)
+                continue
+            stored = hex_to_hash(item.item_image_hash)
+            if hamming(stored, value) != distance:
+                # Image replaced in another process: re-file it under the new hash
+                self.add(item_id, stored)
+                distance = hamming(stored, value)
+                if distance > max_distance:
+                    continue
+            results.append((item, distance))
+        return results
+
+
+# Global instance
+duplicate_index = DuplicateIndex()
+
+
+@index_listener
+def refresh_duplicate_index(item_ids):
+    duplicate_index.refresh_items(item_ids)
@@ -0,0 +1,159 @@
+import threading
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from models import db, Item, ImageEmbedding, IndexChange
+
+# callables(item_ids) that bring an in-memory index up to date for those items;
+# item_ids is None when the whole index has to be rebuilt
+INDEX_LISTENERS = []
+
+# Item columns that feed the visual, duplicate or text indexes
+WATCHED_ITEM_FIELDS = (
+    'item_type', 'item_status', 'item_title', 'item_description',
+    'item_category', 'item_location', 'item_image_path', 'item_image_hash',
+)
+
+
+def index_listener(func):
+    """Register a function to be told which items changed since the last sync"""
+    INDEX_LISTENERS.append(func)
+    return func
+
+
+def _record_change(connection, item_id, kind):
+    """Append to the feed inside the flush, so it commits or rolls back with the change"""
+    if item_id is None:
+        return
+    connection.execute(IndexChange.__table__.insert().values(
+        change_item_id=item_id,
+        change_kind=kind,
+        change_created_at=datetime.utcnow()
+    ))
+
+
+@event.listens_for(Item, 'after_insert')
+def _item_inserted(mapper, connection, target):
+    _record_change(connection, target.item_id, 'item_insert')
+
+
+@event.listens_for(Item, 'after_update')
+def _item_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in WATCHED_ITEM_FIELDS):
+        _record_change(connection, target.item_id, 'item_update')
+
+
+@event.listens_for(Item, 'after_delete')
+def _item_deleted(mapper, connection, target):
+    _record_change(connection, target.item_id, 'item_delete')
+
+
+@event.listens_for(ImageEmbedding, 'after_insert')
+def _embedding_inserted(mapper, connection, target):
+    _record_change(connection, target.item_id, 'embedding_insert')
+
+
+@event.listens_for(ImageEmbedding, 'after_update')
+def _embedding_updated(mapper, connection, target):
+    _record_change(connection, target.item_id, 'embedding_update')
+
+
+@event.listens_for(ImageEmbedding, 'after_delete')
+def _embedding_deleted(mapper, connection, target):
+    _record_change(connection, target.item_id, 'embedding_delete')
+
+
+class ChangeFeed:
+    """
+    Per-process cursor over index_changes.
+    Every process replays the feed, including its own writes, so all the
+    resident indexes converge whichever worker made the change. IDs can commit
+    out of order, so each poll re-reads a short window behind the cursor and
+    skips the changes it already applied.
+    """
+
+    def __init__(self, lookback=200):
+        self.lookback = lookback
+        self._last_id = None
+        self._last_poll = None
+        self._seen = set()
+        self._lock = threading.Lock()
+        self.changes_applied = 0
+        self.full_resyncs = 0
+
+    def _notify(self, item_ids):
+        for listener in INDEX_LISTENERS:
+            try:
+                listener(item_ids)
+            except Exception as e:
+                print(f"⚠️ Index listener {listener.__name__} failed: {e}")
+
+    def poll(self, retention_hours=24):
+        """Apply changes committed since the last poll; returns how many items were refreshed"""
+        with self._lock:
+            now = datetime.utcnow()
+            if self._last_id is None or now - self._last_poll > timedelta(hours=retention_hours):
+                # First poll (indexes load straight from the tables), or the feed
+                # may have been pruned past our cursor: start over from here
+                if self._last_id is not None:
+                    self.full_resyncs += 1
+                    self._notify(None)
+                self._last_id = db.session.query(db.func.max(IndexChange.change_id)).scalar() or 0
+                self._last_poll = now
+                self._seen = set()
+                return 0
+
+            floor = max(0, self._last_id - self.lookback)
+            rows = db.session.query(IndexChange.change_id, IndexChange.change_item_id).filter(
+                IndexChange.change_id > floor
+            ).order_by(IndexChange.change_id).all()
+            self._last_poll = now
+
+            item_ids = set()
+            for change_id, item_id in rows:
+                if change_id not in self._seen:
+                    self._seen.add(change_id)
+                    item_ids.add(item_id)
+                self._last_id = max(self._last_id, change_id)
+            self._seen = {change_id for change_id in self._seen if change_id > self._last_id - self.lookback}
+
+            if item_ids:
+                self._notify(item_ids)
+                self.changes_applied += len(item_ids)
+            return len(item_ids)
+
+    def stats(self):
+        return {
+            'cursor': self._last_id,
+            'items_refreshed': self.changes_applied,
+            'full_resyncs': self.full_resyncs,
+        }
+
+
+# Global instance
+change_feed = ChangeFeed()
+
+
+def sync_indexes():
+    """Catch the resident indexes up with the change feed before a lookup"""
+    if not has_app_context():
+        return 0
+    try:
+        return change_feed.poll(current_app.config.get('INDEX_CHANGE_RETENTION_HOURS', 24))
+    except Exception as e:
+        print(f"⚠️ Index sync failed: {e}")
+        db.session.rollback()
+        return 0
+
+
+def prune_index_changes(retention_hours=24):
+    """Delete feed entries every process has had time to apply"""
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    count = db.session.query(IndexChange).filter(
+        IndexChange.change_created_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    if count:
+        print(f"🧹 Pruned {count} index change(s)")
+    return count
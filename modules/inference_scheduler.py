@@ -0,0 +1,107 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Sentinel that tells the scheduler thread to exit
+_STOP = object()
+
+
+class InferenceScheduler:
+    """
+    Micro-batching front end for an engine's forward pass.
+    Request threads submit one preprocessed tensor each and wait on a Future;
+    a single inference thread collects requests for up to max_wait_ms (or until
+    max_batch_size are waiting) and runs them as one batch. Only that thread
+    calls into torch, so its intra-op thread budget is fixed instead of every
+    request competing for the same cores.
+    """
+
+    def __init__(self, forward, max_batch_size=16, max_wait_ms=5, threads=0):
+        self._forward = forward  # callable(list of tensors) -> (batch, dim) array
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self.threads = threads
+        self.pid = os.getpid()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Counters for the admin stats endpoint
+        self.batches = 0
+        self.images = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        if self.running:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def submit(self, tensor):
+        """Queue one image tensor; the Future resolves to its feature vector"""
+        future = Future()
+        self._queue.put((tensor, future))
+        if not self.running:
+            self.start()
+        return future
+
+    def _collect(self, first):
+        """Gather requests until the batch is full or the wait window closes"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            # Skip requests whose caller already gave up
+            batch = [(tensor, future) for tensor, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                features = self._forward([tensor for tensor, _ in batch])
+                for row, (_, future) in enumerate(batch):
+                    future.set_result(features[row])
+                self.batches += 1
+                self.images += len(batch)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'images': self.images,
+            'mean_batch_size': round(self.images / self.batches, 2) if self.batches else 0,
+            'queued': self._queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'threads': self.threads,
+        }
@@ -0,0 +1,345 @@
+import json
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from models import db, Job, JobWorker
+from modules.index_sync import prune_index_changes
+
+# job_type -> callable(job, payload) returning a JSON-serialisable result
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type):
+    """Register a function as the handler for a job type"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+def enqueue_job(job_type, item_id=None, payload=None):
+    """Add a job to the queue. The caller commits it together with its own changes."""
+    job = Job(
+        job_type=job_type,
+        job_status='queued',
+        job_payload=json.dumps(payload or {}),
+        job_attempts=0,
+        item_id=item_id
+    )
+    db.session.add(job)
+    return job
+
+
+def set_job_stage(job, stage):
+    """Record handler progress so the UI can poll it"""
+    if job is None or job.job_id is None:
+        return
+    db.session.query(Job).filter_by(job_id=job.job_id).update({'job_stage': stage, 'job_heartbeat_at': datetime.utcnow()})
+    db.session.commit()
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to 'running'.
+    Uses SKIP LOCKED where the database supports it, and a conditional UPDATE
+    so two workers can never claim the same row.
+    """
+    candidates = db.session.query(Job.job_id).filter(
+        Job.job_status == 'queued'
+    ).order_by(Job.job_id).with_for_update(skip_locked=True).limit(5).all()
+
+    for (job_id,) in candidates:
+        claimed = db.session.query(Job).filter(
+            Job.job_id == job_id, Job.job_status == 'queued'
+        ).update({
+            'job_status': 'running',
+            'job_started_at': datetime.utcnow(),
+            'job_heartbeat_at': datetime.utcnow(),
+            'job_attempts': Job.job_attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+
+    db.session.commit()
+    return None
+
+
+def run_job(job, max_attempts=3):
+    """Execute a claimed job and record its outcome"""
+    handler = JOB_HANDLERS.get(job.job_type)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for job type '{job.job_type}'")
+        payload = json.loads(job.job_payload or '{}')
+        result = handler(job, payload)
+
+        job.job_status = 'done'
+        job.job_stage = None
+        job.job_result = json.dumps(result or {})
+        job.job_error = None
+        job.job_finished_at = datetime.utcnow()
+        db.session.commit()
+        return True
+
+    except Exception as e:
+        print(f"❌ Job {job.job_id} ({job.job_type}) failed: {e}")
+        traceback.print_exc()
+        db.session.rollback()
+
+        job = db.session.get(Job, job.job_id)
+        if job is None:
+            return False
+        job.job_error = str(e)[:1000]
+        if (job.job_attempts or 0) < max_attempts:
+            job.job_status = 'queued'
+        else:
+            job.job_status = 'failed'
+            job.job_finished_at = datetime.utcnow()
+        db.session.commit()
+        return False
+
+
+def touch_jobs(job_ids):
+    """Renew the lease of jobs this process is still running"""
+    if not job_ids:
+        return 0
+    count = db.session.query(Job).filter(
+        Job.job_id.in_(list(job_ids)), Job.job_status == 'running'
+    ).update({'job_heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def expire_stale_jobs(lease_seconds, max_attempts=3):
+    """
+    Recover jobs whose worker died mid-run: a running job whose heartbeat is
+    older than the lease goes back to the queue, or to 'failed' once it has
+    used max_attempts (the claim already counted the lost attempt), so a job
+    that kills its worker can't loop forever.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    error = 'Worker stopped while running the job (lease expired)'
+    stale = db.session.query(Job).filter(
+        Job.job_status == 'running',
+        db.func.coalesce(Job.job_heartbeat_at, Job.job_started_at) < cutoff
+    )
+    failed = stale.filter(Job.job_attempts >= max_attempts).update({
+        'job_status': 'failed',
+        'job_error': error,
+        'job_finished_at': datetime.utcnow()
+    }, synchronize_session=False)
+    requeued = stale.filter(Job.job_attempts < max_attempts).update({
+        'job_status': 'queued',
+        'job_error': error
+    }, synchronize_session=False)
+    db.session.commit()
+    if requeued or failed:
+        print(f"♻️ Expired stale job leases: {requeued} re-queued, {failed} failed")
+    return requeued, failed
+
+
+def record_worker_heartbeat(worker_id):
+    """Mark a worker pool as alive now"""
+    now = datetime.utcnow()
+    updated = db.session.query(JobWorker).filter_by(worker_id=worker_id).update(
+        {'worker_heartbeat_at': now}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(JobWorker(worker_id=worker_id, worker_started_at=now, worker_heartbeat_at=now))
+    db.session.commit()
+
+
+def remove_worker(worker_id):
+    db.session.query(JobWorker).filter_by(worker_id=worker_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def workers_alive(timeout_seconds=90):
+    """True if some worker pool, in any process, checked in within timeout_seconds"""
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout_seconds)
+    return db.session.query(JobWorker.worker_id).filter(JobWorker.worker_heartbeat_at >= cutoff).first() is not None
+
+
+_last_fallback_warning = None
+
+
+def use_background_processing(config, repeat_seconds=300):
+    """
+    Queue jobs only when BACKGROUND_PROCESSING is on and a worker is alive
+    (in-process pool or run_worker.py). Otherwise the caller processes inline,
+    so reports are still matched under servers that start no workers.
+    """
+    global _last_fallback_warning
+    if not config.get('BACKGROUND_PROCESSING', True):
+        return False
+    if workers_alive(config.get('JOB_WORKER_TIMEOUT_SECONDS', 90)):
+        return True
+    now = datetime.utcnow()
+    if _last_fallback_warning is None or now - _last_fallback_warning >= timedelta(seconds=repeat_seconds):
+        _last_fallback_warning = now
+        print("⚠️ No job worker is running; processing reports inline. "
+              "Start `python run_worker.py` next to the web server to move matching off the request.")
+    return False
+
+
+_last_stall_warning = None
+
+
+def warn_if_queue_stalled(stall_seconds=120, repeat_seconds=300):
+    """
+    Print a warning when the oldest queued job has waited longer than
+    stall_seconds: jobs queued while a worker was alive are left waiting if
+    every worker has since stopped. Repeats at most every repeat_seconds per process.
+    Returns the oldest job's wait in seconds when stalled, else None.
+    """
+    global _last_stall_warning
+    now = datetime.utcnow()
+    if _last_stall_warning is not None and now - _last_stall_warning < timedelta(seconds=repeat_seconds):
+        return None
+    oldest = db.session.query(db.func.min(Job.job_created_at)).filter(Job.job_status == 'queued').scalar()
+    if oldest is None or now - oldest < timedelta(seconds=stall_seconds):
+        return None
+    _last_stall_warning = now
+    waited = (now - oldest).total_seconds()
+    print(f"⚠️ Jobs have been queued for {waited:.0f}s without a worker picking them up. "
+          f"Start `python run_worker.py` next to the web server, or set BACKGROUND_PROCESSING=false.")
+    return waited
+
+
+class JobWorkerPool:
+    """Background threads that poll the jobs table and run handlers"""
+
+    def __init__(self, app, workers=2, poll_interval=1.0, max_attempts=3, lease_seconds=600, worker_timeout=90):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.worker_timeout = worker_timeout
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"[-128:]
+        self._stop = threading.Event()
+        self._threads = []
+        self._maintenance_lock = threading.Lock()
+        self._last_maintenance = None
+        self._last_lease_check = None
+        self._running = set()  # job ids being run by this pool
+        self._running_lock = threading.Lock()
+
+    def maintain(self, interval_seconds=3600):
+        """Housekeeping run by whichever idle worker gets here first"""
+        if not self._maintenance_lock.acquire(blocking=False):
+            return
+        try:
+            now = datetime.utcnow()
+            with self.app.app_context():
+                # Checked a few times per lease, so a dead worker's job waits at most ~1.25 leases
+                if self._last_lease_check is None or now - self._last_lease_check >= timedelta(seconds=self.lease_seconds / 4):
+                    self._last_lease_check = now
+                    expire_stale_jobs(self.lease_seconds, self.max_attempts)
+                if self._last_maintenance is None or now - self._last_maintenance >= timedelta(seconds=interval_seconds):
+                    self._last_maintenance = now
+                    prune_index_changes(self.app.config.get('INDEX_CHANGE_RETENTION_HOURS', 24))
+                    # Pools killed without stop() leave their row behind
+                    db.session.query(JobWorker).filter(
+                        JobWorker.worker_heartbeat_at < now - timedelta(days=1)
+                    ).delete(synchronize_session=False)
+                    db.session.commit()
+                    try:
+                        from modules.ai_processing import prune_embedding_cache
+                        prune_embedding_cache(self.app.config.get('EMBEDDING_CACHE_MAX_AGE_DAYS', 30),
+                                              self.app.config.get('EMBEDDING_CACHE_MAX_ENTRIES', 50000))
+                    except ImportError:
+                        pass
+        finally:
+            self._maintenance_lock.release()
+
+    def _heartbeat(self):
+        """
+        Keep this pool's worker row and the leases of its running jobs fresh,
+        so web processes keep queueing and no process expires the jobs
+        """
+        while not self._stop.wait(min(self.lease_seconds / 4, self.worker_timeout / 3)):
+            with self._running_lock:
+                running = set(self._running)
+            try:
+                with self.app.app_context():
+                    record_worker_heartbeat(self.worker_id)
+                    if running:
+                        touch_jobs(running)
+            except Exception as e:
+                print(f"⚠️ Job heartbeat error: {e}")
+
+    def start(self):
+        with self.app.app_context():
+            record_worker_heartbeat(self.worker_id)
+        self.maintain()
+
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        print(f"⚙️ Job worker pool started with {self.workers} worker(s)")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        try:
+            with self.app.app_context():
+                remove_worker(self.worker_id)
+        except Exception as e:
+            print(f"⚠️ Could not deregister job worker: {e}")
+
+    def run_once(self):
+        """Claim and run a single job; returns False when the queue is empty"""
+        with self.app.app_context():
+            job = claim_next_job()
+            if job is None:
+                return False
+            job_id = job.job_id
+            with self._running_lock:
+                self._running.add(job_id)
+            try:
+                run_job(job, self.max_attempts)
+            finally:
+                with self._running_lock:
+                    self._running.discard(job_id)
+            return True
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                if not self.run_once():
+                    self.maintain()
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                print(f"⚠️ Job worker error: {e}")
+                self._stop.wait(self.poll_interval)
+
+
+_worker_pool = None
+
+
+def start_job_workers(app):
+    """Start the in-process worker pool once, if JOB_WORKERS > 0"""
+    global _worker_pool
+    workers = app.config.get('JOB_WORKERS', 0)
+    if _worker_pool is not None or workers <= 0:
+        return _worker_pool
+
+    _worker_pool = JobWorkerPool(
+        app,
+        workers=workers,
+        poll_interval=app.config.get('JOB_POLL_INTERVAL', 1.0),
+        max_attempts=app.config.get('JOB_MAX_ATTEMPTS', 3),
+        lease_seconds=app.config.get('JOB_LEASE_SECONDS', 600),
+        worker_timeout=app.config.get('JOB_WORKER_TIMEOUT_SECONDS', 90)
+    )
+    _worker_pool.start()
+    return _worker_pool
@@ -0,0 +1,181 @@
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Item, Match
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {
+    'postgresql': postgresql_insert,
+    'sqlite': sqlite_insert,
+}
+UPSERT_BATCH_SIZE = 1000
+
+
+def _setting(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+
+def fuse_scores(text_score, visual_score):
+    """Weighted mean of the text and visual scores; a missing score leaves the other one as is"""
+    if visual_score is None:
+        return text_score or 0.0
+    if text_score is None:
+        return visual_score
+    text_weight = _setting('MATCH_TEXT_WEIGHT', 0.5)
+    return text_weight * text_score + (1.0 - text_weight) * visual_score
+
+
+def match_summary(text_score, visual_score, fused_score):
+    """'Match: 74% (text 58%, visual 90%)', leaving out a score that wasn't computed"""
+    parts = []
+    if text_score is not None:
+        parts.append(f"text {text_score:.0%}")
+    if visual_score is not None:
+        parts.append(f"visual {visual_score:.0%}")
+    return f"Match: {fused_score:.0%} ({', '.join(parts)})"
+
+
+def add_match_notifications(writer, lost, found, text_score, visual_score, now=None):
+    """
+    Queue both parties' notifications for one scored pair on a NotificationWriter.
+    lost and found are (owner_id, item_id, title). Pairs whose visual score
+    outweighs the text score are filed as 'visual_match', the rest as
+    'potential_match'; the message carries the fused and per-signal scores.
+    Used by the report pipeline and the rematch batch alike.
+    """
+    lost_owner_id, lost_item_id, lost_title = lost
+    found_owner_id, found_item_id, found_title = found
+    if visual_score is not None and visual_score > (text_score or 0.0):
+        icon, notification_type = '📸', 'visual_match'
+    else:
+        icon, notification_type = '🔍', 'potential_match'
+    summary = match_summary(text_score, visual_score, fuse_scores(text_score, visual_score))
+
+    # Lost item owner, pointing at the found item
+    writer.add(
+        lost_owner_id, found_item_id, notification_type,
+        f"{icon} Match Found! A found '{found_title}' matches your lost '{lost_title}'. {summary}", now
+    )
+    # Found item reporter, pointing at the lost report
+    writer.add(
+        found_owner_id, lost_item_id, notification_type,
+        f"{icon} Match Found! Your found '{found_title}' matches a lost report. {summary}", now
+    )
+
+
+def match_pair(item, other_id):
+    """(lost_item_id, found_item_id) for an item and an item of the opposite type"""
+    return (item.item_id, other_id) if item.item_type == 'lost' else (other_id, item.item_id)
+
+
+def record_matches(item, scores, prune=True):
+    """
+    Upsert one Match row per pair for an item.
+    scores maps opposite-type item_id -> (text_score, visual_score). With
+    prune, pending rows for this item that are no longer scored are dropped,
+    so an edited report stops showing as a match. The caller commits.
+    Returns the number of rows written.
+    """
+    now = datetime.utcnow()
+    rows = [match_row(*match_pair(item, other_id), text_score, visual_score, now)
+            for other_id, (text_score, visual_score) in scores.items()]
+
+    if prune:
+        own_column = Match.lost_item_id if item.item_type == 'lost' else Match.found_item_id
+        other_column = Match.found_item_id if item.item_type == 'lost' else Match.lost_item_id
+        stale = Match.query.filter(own_column == item.item_id, Match.match_status == 'pending')
+        if scores:
+            stale = stale.filter(other_column.notin_(list(scores)))
+        stale.delete(synchronize_session=False)
+
+    return upsert_match_rows(rows)
+
+
+def match_row(lost_item_id, found_item_id, text_score, visual_score, now=None):
+    """Column values for one scored pair, as written by upsert_match_rows"""
+    now = now or datetime.utcnow()
+    return {
+        'lost_item_id': lost_item_id,
+        'found_item_id': found_item_id,
+        'match_similarity_score': fuse_scores(text_score, visual_score),
+        'match_text_score': text_score,
+        'match_visual_score': visual_score,
+        'match_status': 'pending',
+        'match_created_at': now,
+        'match_updated_at': now,
+    }
+
+
+def upsert_match_rows(rows):
+    """Insert match rows, or refresh the scores of pairs that already have one. The caller commits."""
+    if not rows:
+        return 0
+    now = rows[0]['match_updated_at']
+
+    insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if insert is not None:
+        # Batched to stay under the databases' bound-parameter limits
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            statement = insert(Match.__table__).values(rows[start:start + UPSERT_BATCH_SIZE])
+            # Re-scoring keeps the row's status and creation time
+            statement = statement.on_conflict_do_update(
+                index_elements=['lost_item_id', 'found_item_id'],
+                set_={
+                    'match_similarity_score': statement.excluded.match_similarity_score,
+                    'match_text_score': statement.excluded.match_text_score,
+                    'match_visual_score': statement.excluded.match_visual_score,
+                    'match_updated_at': statement.excluded.match_updated_at,
+                }
+            )
+            db.session.execute(statement)
+        return len(rows)
+
+    # Other databases: one lookup for the existing pairs, then update or add
+    pairs = [(row['lost_item_id'], row['found_item_id']) for row in rows]
+    existing = {
+        (match.lost_item_id, match.found_item_id): match for match in Match.query.filter(
+            or_(*[and_(Match.lost_item_id == lost_id, Match.found_item_id == found_id) for lost_id, found_id in pairs])
+        )
+    }
+    for row in rows:
+        match = existing.get((row['lost_item_id'], row['found_item_id']))
+        if match is None:
+            db.session.add(Match(**row))
+        else:
+            match.match_similarity_score = row['match_similarity_score']
+            match.match_text_score = row['match_text_score']
+            match.match_visual_score = row['match_visual_score']
+            match.match_updated_at = now
+    return len(rows)
+
+
+def matches_for_item(item_id, status='pending'):
+    """Stored matches involving an item, best first"""
+    query = Match.query.filter(or_(Match.lost_item_id == item_id, Match.found_item_id == item_id))
+    if status is not None:
+        query = query.filter(Match.match_status == status)
+    return query.order_by(Match.match_similarity_score.desc()).all()
+
+
+def is_match_for_user(item, user_id):
+    """Whether a stored match pairs this item with one of the user's own items"""
+    if item.item_type == 'lost':
+        own_column, other_column = Match.lost_item_id, Match.found_item_id
+    else:
+        own_column, other_column = Match.found_item_id, Match.lost_item_id
+    return db.session.query(Match.match_id).join(Item, Item.item_id == other_column).filter(
+        own_column == item.item_id,
+        Match.match_status != 'rejected',
+        Item.owner_id == user_id
+    ).first() is not None
+
+
+def delete_matches_for_item(item_id):
+    """Drop every match row referencing an item (before the item itself is deleted)"""
+    return Match.query.filter(
+        or_(Match.lost_item_id == item_id, Match.found_item_id == item_id)
+    ).delete(synchronize_session=False)
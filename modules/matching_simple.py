@@ -1,108 +1,183 @@
-from models import db, Item, Notification
-from datetime import datetime
+import os
+import threading
+from flask import current_app, has_app_context
+from models import db, Item
+from modules.text_index import TokenIndex, MinHashIndex, TfidfIndex, item_tokens, jaccard
+from modules.index_sync import index_listener, sync_indexes
+from modules.candidate_rules import allowed_candidates
+
+OPPOSITE_TYPE = {'lost': 'found', 'found': 'lost'}
 
 class SimpleMatchingEngine:
-    def __init__(self, similarity_threshold=0.3):
+    similarity_measure = 'jaccard'  # what similarity_threshold is compared with
+    
+    def __init__(self, similarity_threshold=0.3, index_backend=None):
         self.similarity_threshold = similarity_threshold
+        self.index_backend = index_backend  # None = read TEXT_INDEX_BACKEND from config on load
+        self.max_results = None  # cap on matches per report (None = every item above the threshold)
+        self.index = None
+        self._index_lock = threading.Lock()
     
-    def find_potential_matches(self, new_item):
-        """Find potential matches for a new item and create notifications"""
-        print(f"🔍 Text Matching: Scanning for '{new_item.item_title}'...")
-        
-        try:
-            # 1. Get candidates
-            if new_item.item_type == 'lost':
-                candidate_items = Item.query.filter_by(item_type='found', item_status='pending').all()
+    def _setting(self, name, default):
+        """Read a config value when running inside the app, else use the default"""
+        if has_app_context():
+            return current_app.config.get(name, default)
+        return default
+    
+    INDEX_CLASSES = {'token': TokenIndex, 'minhash': MinHashIndex, 'tfidf': TfidfIndex}
+    
+    def check_index_backend(self, backend=None):
+        """Return the index backend name, rejecting one that scores a different measure than the threshold"""
+        backend = self.index_backend or backend or self._setting('TEXT_INDEX_BACKEND', 'token')
+        if backend not in self.INDEX_CLASSES:
+            raise ValueError(f"Unknown text index backend '{backend}'")
+        measure = self.INDEX_CLASSES[backend].similarity_measure
+        if measure != self.similarity_measure:
+            raise ValueError(
+                f"Text index backend '{backend}' scores {measure} but {type(self).__name__} "
+                f"thresholds {self.similarity_measure}; use TEXT_MATCHING_ENGINE={backend} instead"
+            )
+        return backend
+    
+    def _create_index(self):
+        """Empty candidate index: 'token' (inverted index, exact), 'minhash' (LSH, approximate) or 'tfidf'"""
+        backend = self.check_index_backend()
+        if backend == 'minhash':
+            return MinHashIndex(threshold=self.similarity_threshold,
+                                num_perm=self._setting('TEXT_MINHASH_PERMUTATIONS', 256))
+        if backend == 'tfidf':
+            return TfidfIndex(refresh_ratio=self._setting('TEXT_TFIDF_REFRESH_RATIO', 0.2))
+        return TokenIndex()
+    
+    @staticmethod
+    def _load_token_rows(item_ids=None):
+        """Yield (item_id, (item_type, item_status), tokens) from the text columns only"""
+        query = db.session.query(
+            Item.item_id, Item.item_type, Item.item_status,
+            Item.item_title, Item.item_description, Item.item_category, Item.item_location
+        )
+        if item_ids is not None:
+            query = query.filter(Item.item_id.in_(item_ids))
+        for item_id, item_type, item_status, title, description, category, location in query.yield_per(5000):
+            yield item_id, (item_type, item_status), item_tokens(title, description, category, location)
+    
+    def _ensure_index(self):
+        """Build the candidate index once per process from a column-only scan of items"""
+        if self.index is not None and self.index.loaded:
+            return self.index
+        with self._index_lock:
+            if self.index is None or not self.index.loaded:
+                index = self._create_index()
+                index.build(self._load_token_rows())
+                self.index = index
+                print(f"📚 Text index loaded with {len(index)} items in partitions {index.partition_sizes()}")
+        return self.index
+    
+    def refresh_items(self, item_ids):
+        """Re-tokenize changed items from the change feed; None reloads on the next search"""
+        if item_ids is None:
+            with self._index_lock:
+                self.index = None
+            return
+        index = self.index
+        if index is None or not index.loaded:
+            return
+        item_ids = list(item_ids)
+        rows = {item_id: (key, tokens) for item_id, key, tokens in self._load_token_rows(item_ids)}
+        for item_id in item_ids:
+            if item_id in rows:
+                key, tokens = rows[item_id]
+                index.upsert(item_id, tokens, key)
             else:
-                candidate_items = Item.query.filter_by(item_type='lost', item_status='pending').all()
-            
-            matches_found = 0
-            
-            for candidate in candidate_items:
-                # Use candidate item ID
-                if candidate.item_id == new_item.item_id:
-                    continue
-                
-                # Calculate score
-                similarity_score = self.calculate_similarity(new_item, candidate)
-                
-                # Only print if there's some similarity, to reduce noise
-                if similarity_score > 0.1:
-                    print(f"   -> Comparing with '{candidate.item_title}': Score {similarity_score:.2f}")
-                
-                if similarity_score >= self.similarity_threshold:
-                    self.create_match_notification(new_item, candidate, similarity_score)
-                    matches_found += 1
-            
-            return matches_found
-            
-        except Exception as e:
-            # This is where your error log was coming from
-            print(f"❌ Error finding matches: {e}")
-            import traceback
-            traceback.print_exc()
-            return 0
+                index.remove(item_id)
+    
+    def find_candidates(self, new_item, allowed_ids=None):
+        """
+        (Item, score) pairs of pending opposite-type items at or above the threshold, best first.
+        Only items passing the pruning rules (MATCH_PRUNING_RULES) are scored: allowed_ids
+        when the caller already looked them up, else they are looked up here.
+        """
+        sync_indexes()
+        index = self._ensure_index()
+        tokens = self.tokens_of(new_item)
+        partition = (OPPOSITE_TYPE.get(new_item.item_type), 'pending')
+        if allowed_ids is None:
+            allowed_ids = allowed_candidates(new_item, *partition)
+        hits = index.search(tokens, partitions=[partition], threshold=self.similarity_threshold,
+                            exclude_ids=(new_item.item_id,), k=self.max_results, allowed_ids=allowed_ids)
+        if not hits:
+            return []
+        
+        # Only the scored hits are loaded as ORM objects
+        items = {item.item_id: item for item in Item.query.filter(Item.item_id.in_([item_id for item_id, _ in hits]))}
+        candidates = []
+        for item_id, score in hits:
+            item = items.get(item_id)
+            if item is None:
+                # Deleted in another process since the index was loaded
+                index.remove(item_id)
+                continue
+            if (item.item_type, item.item_status) != partition:
+                # Changed in another process; re-file it and drop the hit
+                index.upsert(item_id, self.tokens_of(item), (item.item_type, item.item_status))
+                continue
+            candidates.append((item, score))
+        return candidates
+    
+    @staticmethod
+    def tokens_of(item):
+        return item_tokens(item.item_title, item.item_description, item.item_category, item.item_location)
     
     def calculate_similarity(self, item1, item2):
         try:
-            def clean(s): return str(s).lower() if s else ""
-            
-            # Combine fields
-            text1 = f"{clean(item1.item_title)} {clean(item1.item_description)} {clean(item1.item_category)} {clean(item1.item_location)}"
-            text2 = f"{clean(item2.item_title)} {clean(item2.item_description)} {clean(item2.item_category)} {clean(item2.item_location)}"
-            
-            words1 = set(text1.split())
-            words2 = set(text2.split())
-            
-            if not words1 and not words2: return 0.0
-            
-            intersection = len(words1.intersection(words2))
-            union = len(words1.union(words2))
-            
-            return intersection / union if union > 0 else 0.0
+            return jaccard(self.tokens_of(item1), self.tokens_of(item2))
         except:
             return 0.0
-    
-    def create_match_notification(self, item1, item2, similarity_score):
+
+
+class MinHashMatchingEngine(SimpleMatchingEngine):
+    """
+    Text matcher whose candidates come from MinHash LSH buckets instead of
+    token postings: lookups stay near-constant as the item count grows, at
+    the cost of a small recall loss just above the threshold. Candidates are
+    still verified with exact Jaccard.
+    """
+
+    def __init__(self, similarity_threshold=0.3):
+        super().__init__(similarity_threshold, index_backend='minhash')
+
+
+class TfidfMatchingEngine(SimpleMatchingEngine):
+    """
+    Text matcher scoring cosine similarity of TF-IDF vectors instead of raw
+    word overlap, so shared rare words ("airpods", a serial number) outweigh
+    shared common ones ("black", "library"). Each report is scored against
+    all pending opposite-type items with one sparse matrix-vector product.
+    The threshold is a cosine, not a Jaccard score.
+    """
+    similarity_measure = 'cosine'
+
+    def __init__(self, similarity_threshold=0.35, max_results=20):
+        super().__init__(similarity_threshold, index_backend='tfidf')
+        self.max_results = max_results
+
+    def calculate_similarity(self, item1, item2):
         try:
-            if item1.item_type == 'lost':
-                lost_item, found_item = item1, item2
-            else:
-                lost_item, found_item = item2, item1
-            
-            # Use owner_id column from database
-            # Do NOT use .owner.user_id (Relationship) to avoid loading errors
-            lost_owner_id = lost_item.owner_id
-            found_owner_id = found_item.owner_id
-            
-            # Prevent self-notification
-            if lost_owner_id == found_owner_id:
-                return
+            return self._ensure_index().similarity(self.tokens_of(item1), self.tokens_of(item2))
+        except Exception:
+            return 0.0
+
+
+MATCHING_ENGINES = {
+    'simple': SimpleMatchingEngine,
+    'minhash': MinHashMatchingEngine,
+    'tfidf': TfidfMatchingEngine,
+}
+
+# Initialize (picked before the app config exists, so read from the environment like config.py does)
+matching_engine = MATCHING_ENGINES[os.environ.get('TEXT_MATCHING_ENGINE', 'simple')]()
 
-            # Notification for Lost Item Owner
-            n1 = Notification(
-                notification_message=f"🔍 Match Found! A found '{found_item.item_title}' matches your lost report. (Similarity: {similarity_score:.0%})",
-                notification_type='potential_match',
-                user_id=lost_item.owner_id,      # Recipient (Lost item owner)
-                item_id=found_item.item_id       # Related found item
-            )
-            
-            # Notification for Found Item Reporter
-            n2 = Notification(
-                notification_message=f"🔍 Match Found! Your found '{found_item.item_title}' matches a lost report. (Similarity: {similarity_score:.0%})",
-                notification_type='potential_match',
-                user_id=found_item.owner_id,     # Recipient (Found item finder)
-                item_id=lost_item.item_id        # Related lost item
-            )
-            
-            db.session.add(n1)
-            db.session.add(n2)
-            # We don't commit here because reporting.py does the commit
-            
-            print(f"✅ Notifications created for User {lost_owner_id} and User {found_owner_id}")
-            
-        except Exception as e:
-            print(f"❌ Error creating notification: {e}")
 
-# Initialize
-matching_engine = SimpleMatchingEngine()
\ No newline at end of file
+@index_listener
+def refresh_text_index(item_ids):
+    matching_engine.refresh_items(item_ids)
@@ -0,0 +1,79 @@
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Notification, MATCH_NOTIFICATION_TYPES, MATCH_NOTIFICATION_WHERE
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING against the uq_notification_match index
+CONFLICT_INSERTS = {
+    'postgresql': postgresql_insert,
+    'sqlite': sqlite_insert,
+}
+INSERT_BATCH_SIZE = 1000
+UNIQUE_KEY = ('user_id', 'item_id', 'notification_type')
+
+
+class NotificationWriter:
+    """
+    Collects notifications keyed by (user_id, item_id, notification_type) and
+    writes them with one multi-row INSERT per flush. A key already queued is
+    ignored, and for match notifications a key already stored is skipped by
+    the database (ON CONFLICT DO NOTHING), so re-reporting or re-matching a
+    pair never notifies it twice. The caller commits.
+    """
+
+    def __init__(self):
+        self._pending = {}  # key -> row
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id, item_id, notification_type, notification_message,
+            notification_created_at=None, notification_sender_id=None):
+        """Queue a notification; False if the same key is already queued"""
+        key = (user_id, item_id, notification_type)
+        if key in self._pending:
+            return False
+        self._pending[key] = {
+            'user_id': user_id,
+            'item_id': item_id,
+            'notification_type': notification_type,
+            'notification_message': notification_message,
+            'notification_is_seen': False,
+            'notification_created_at': notification_created_at or datetime.utcnow(),
+            'notification_sender_id': notification_sender_id,
+        }
+        return True
+
+    def flush(self):
+        """Insert the queued notifications. Returns how many rows were sent to the database."""
+        rows = list(self._pending.values())
+        self._pending = {}
+        if not rows:
+            return 0
+
+        insert = CONFLICT_INSERTS.get(db.engine.dialect.name)
+        if insert is not None:
+            # Batched to stay under the databases' bound-parameter limits
+            for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                statement = insert(Notification.__table__).values(rows[start:start + INSERT_BATCH_SIZE])
+                statement = statement.on_conflict_do_nothing(
+                    index_elements=list(UNIQUE_KEY),
+                    index_where=text(MATCH_NOTIFICATION_WHERE)
+                )
+                db.session.execute(statement)
+            return len(rows)
+
+        # Other databases: one lookup for the stored match keys, then a plain bulk insert
+        match_rows = [row for row in rows if row['notification_type'] in MATCH_NOTIFICATION_TYPES]
+        existing = set()
+        if match_rows:
+            existing = set(db.session.query(Notification.user_id, Notification.item_id, Notification.notification_type).filter(
+                Notification.user_id.in_({row['user_id'] for row in match_rows}),
+                Notification.item_id.in_({row['item_id'] for row in match_rows}),
+                Notification.notification_type.in_(MATCH_NOTIFICATION_TYPES)
+            ))
+        rows = [row for row in rows if tuple(row[column] for column in UNIQUE_KEY) not in existing]
+        if rows:
+            db.session.execute(Notification.__table__.insert(), rows)
+        return len(rows)
@@ -0,0 +1,173 @@
+import os
+import threading
+from flask import current_app
+from models import db, Item
+from modules.matching_simple import matching_engine, OPPOSITE_TYPE
+from modules.candidate_rules import allowed_candidates
+from modules.match_store import add_match_notifications, fuse_scores, match_summary, record_matches
+from modules.notification_writer import NotificationWriter
+from modules.jobs import job_handler, set_job_stage
+
+# Import conditionally based on AI_ENABLED (the model itself loads lazily)
+try:
+    from modules.ai_processing import image_engine, TORCH_AVAILABLE, HISTOGRAM_AVAILABLE
+    # Without torch the engine still matches on colour histograms
+    AI_AVAILABLE = TORCH_AVAILABLE or HISTOGRAM_AVAILABLE
+except ImportError:
+    AI_AVAILABLE = False
+if not AI_AVAILABLE:
+    print("⚠️ Visual module not available. Image matching disabled.")
+
+
+def ai_enabled():
+    """Check if Visual Processing is enabled in config and the module loaded"""
+    return current_app.config.get('AI_ENABLED', False) and AI_AVAILABLE
+
+
+def warm_up_visual_engine(app, background=True):
+    """
+    Optional start-up hook: load the model before the first upload needs it.
+    Does nothing unless AI_ENABLED and AI_WARMUP_ON_STARTUP are set.
+    """
+    if not (app.config.get('AI_ENABLED', False) and app.config.get('AI_WARMUP_ON_STARTUP', False) and AI_AVAILABLE):
+        return None
+    def warm_up():
+        # The engine reads its backend settings from the app config
+        with app.app_context():
+            return image_engine.warm_up()
+    
+    if not background:
+        return warm_up()
+    thread = threading.Thread(target=warm_up, name='visual-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def rank_matches(scores):
+    """[(other_item_id, text_score, visual_score, fused_score)] from score_pairs output, best first"""
+    ranked = [(item_id, text_score, visual_score, fuse_scores(text_score, visual_score))
+              for item_id, (text_score, visual_score) in scores.items()]
+    ranked.sort(key=lambda match: match[3], reverse=True)
+    return ranked
+
+
+def create_match_notifications(new_item, others, ranked):
+    """
+    One notification per party for each ranked pair, whichever pass found it,
+    written in a single multi-row insert. Returns the number of pairs.
+    """
+    writer = NotificationWriter()
+    for item_id, text_score, visual_score, _ in ranked:
+        other = others[item_id]
+        lost_item, found_item = (new_item, other) if new_item.item_type == 'lost' else (other, new_item)
+        add_match_notifications(
+            writer,
+            (lost_item.owner_id, lost_item.item_id, lost_item.item_title),
+            (found_item.owner_id, found_item.item_id, found_item.item_title),
+            text_score, visual_score
+        )
+    writer.flush()
+    return len(ranked)
+
+
+def process_item(item_id, job=None):
+    """
+    Run visual processing, candidate search and match notifications for a saved item.
+    Called from the job worker, or inline when BACKGROUND_PROCESSING is off or no worker is running.
+    Errors propagate, so the worker records them and retries the job; every
+    step is idempotent (upserted matches, deduplicated notifications).
+    """
+    item = db.session.get(Item, item_id)
+    if item is None:
+        print(f"⚠️ Item {item_id} no longer exists, skipping processing")
+        return {'text_matches': 0, 'visual_matches': 0, 'matches': 0}
+
+    # Candidates passing the pruning rules, from one indexed query; both passes score only these
+    allowed_ids = allowed_candidates(item, OPPOSITE_TYPE.get(item.item_type))
+
+    # ===== VISUAL PROCESSING =====
+    image_matches = []
+    if item.item_image_path and ai_enabled():
+        set_job_stage(job, 'visual')
+        print(f"🖼️ Starting visual processing for item {item.item_id}")
+        upload_dir = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
+        filepath = os.path.join(upload_dir, item.item_image_path)
+        with open(filepath, 'rb') as f_stream:
+            image_matches = image_engine.process_new_item(item.item_id, f_stream, allowed_ids=allowed_ids)
+        print(f"✅ Visual system processed image. Found {len(image_matches)} visual matches")
+        for match in image_matches:
+            print(f"   - Match: Item #{match['item'].item_id}, Similarity: {match['similarity']:.2%}")
+
+    # ===== TEXT CANDIDATES =====
+    set_job_stage(job, 'text_matching')
+    text_matches = matching_engine.find_candidates(item, allowed_ids=allowed_ids)
+    print(f"✅ Text matching found {len(text_matches)} candidates")
+
+    # ===== FUSE, RANK, STORE AND NOTIFY =====
+    # Both passes feed one candidate set: each pair is scored on text and
+    # visuals, ranked on the fused score, stored once and notified once
+    set_job_stage(job, 'notifying')
+    others = {candidate.item_id: candidate for candidate, _ in text_matches}
+    others.update((match['item'].item_id, match['item']) for match in image_matches)
+    ranked = rank_matches(score_pairs(item, text_matches, image_matches))
+    for item_id, text_score, visual_score, fused_score in ranked:
+        print(f"   -> '{others[item_id].item_title}': {match_summary(text_score, visual_score, fused_score)}")
+    record_matches(item, {item_id: (text_score, visual_score) for item_id, text_score, visual_score, _ in ranked})
+    matched = create_match_notifications(item, others, ranked)
+    db.session.commit()
+
+    return {'text_matches': len(text_matches), 'visual_matches': len(image_matches), 'matches': matched}
+
+
+def score_pairs(item, text_matches, image_matches):
+    """
+    {other_item_id: (text_score, visual_score)} for every pair either pass found,
+    filling in the score the other pass didn't compute. Own items are skipped.
+    """
+    others = {}
+    text_scores = {}
+    visual_scores = {}
+    for candidate, score in text_matches:
+        others[candidate.item_id] = candidate
+        text_scores[candidate.item_id] = score
+    for match in image_matches:
+        others[match['item'].item_id] = match['item']
+        visual_scores[match['item'].item_id] = match['similarity']
+    others = {item_id: other for item_id, other in others.items() if other.owner_id != item.owner_id}
+
+    for item_id, other in others.items():
+        if item_id not in text_scores:
+            text_scores[item_id] = matching_engine.calculate_similarity(item, other)
+    missing_visual = [item_id for item_id in others if item_id not in visual_scores]
+    if missing_visual and item.item_image_path and ai_enabled():
+        try:
+            visual_scores.update(image_engine.pair_similarities(item.item_id, missing_visual))
+        except Exception as e:
+            print(f"⚠️ Could not score visual similarity: {e}")
+
+    return {item_id: (text_scores.get(item_id), visual_scores.get(item_id)) for item_id in others}
+
+
+@job_handler('process_item')
+def process_item_job(job, payload):
+    return process_item(job.item_id, job=job)
+
+
+def embed_item(item_id, job=None):
+    """
+    Re-embed an item whose image was replaced. No match notifications are sent;
+    the new vectors reach every process's index through the change feed.
+    """
+    item = db.session.get(Item, item_id)
+    if item is None or not item.item_image_path or not ai_enabled():
+        return {'embedded': False}
+    set_job_stage(job, 'visual')
+    upload_dir = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
+    with open(os.path.join(upload_dir, item.item_image_path), 'rb') as f_stream:
+        _, _, saved = image_engine.embed_image(item_id, f_stream)
+    return {'embedded': saved}
+
+
+@job_handler('embed_item')
+def embed_item_job(job, payload):
+    return embed_item(job.item_id, job=job)
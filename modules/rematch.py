@@ -0,0 +1,266 @@
+import time
+from datetime import datetime
+import numpy as np
+from scipy import sparse
+from models import db, Item, Match
+from modules.candidate_rules import prune_pairs
+from modules.match_store import add_match_notifications, match_row, upsert_match_rows
+from modules.notification_writer import NotificationWriter
+from modules.text_index import item_tokens
+
+
+class PendingSide:
+    """Column data of every pending item of one type, in a fixed row order"""
+
+    def __init__(self, item_type):
+        self.item_type = item_type
+        rows = db.session.query(
+            Item.item_id, Item.owner_id, Item.item_title, Item.item_description,
+            Item.item_category, Item.item_location, Item.item_date_lost_found
+        ).filter(Item.item_type == item_type, Item.item_status == 'pending').order_by(Item.item_id).yield_per(10000)
+        ids, owners, titles, tokens, categories, locations, dates = [], [], [], [], [], [], []
+        for item_id, owner_id, title, description, category, location, date in rows:
+            ids.append(item_id)
+            owners.append(owner_id)
+            titles.append(title)
+            tokens.append(item_tokens(title, description, category, location))
+            categories.append(category or '')
+            locations.append(location or '')
+            dates.append(date)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.owners = np.asarray(owners, dtype=np.int64)
+        self.titles = titles
+        self.tokens = tokens
+        # Columns the pruning rules look at (modules/candidate_rules.py)
+        self.categories = np.asarray(categories, dtype=object)
+        self.locations = np.asarray(locations, dtype=object)
+        self.dates = np.asarray(dates, dtype='datetime64[s]')
+        self.row_of = {item_id: row for row, item_id in enumerate(ids)}
+        self.text = None  # sparse rows, filled by build_text_matrices
+        self.sizes = None  # token-set sizes (Jaccard only)
+        self.vectors = None  # unit embeddings for the rows in vector_rows
+        self.vector_rows = np.empty(0, dtype=np.int64)
+        self.vector_of = np.full(len(ids), -1, dtype=np.int64)  # row -> row in vectors, or -1
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def build_text_matrices(lost, found, measure):
+    """
+    Token-presence CSR matrices over one shared vocabulary. For 'jaccard' the
+    entries are 1 (a product counts shared tokens); for 'cosine' they are
+    L2-normalized TF-IDF weights with IDF taken over both sides.
+    """
+    columns = {}
+    for side in (lost, found):
+        indices, indptr = [], [0]
+        for tokens in side.tokens:
+            indices.extend(columns.setdefault(token, len(columns)) for token in tokens)
+            indptr.append(len(indices))
+        side.text = (np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64))
+    for side in (lost, found):
+        indices, indptr = side.text
+        side.text = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                                      shape=(len(side), len(columns)))
+        side.sizes = np.diff(indptr).astype(np.float32)
+
+    if measure == 'cosine':
+        df = np.asarray(lost.text.sum(axis=0)).ravel() + np.asarray(found.text.sum(axis=0)).ravel()
+        # Same smoothing as TfidfIndex
+        idf = (np.log((1.0 + len(lost) + len(found)) / (1.0 + df)) + 1.0).astype(np.float32)
+        for side in (lost, found):
+            weighted = side.text @ sparse.diags(idf)
+            norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+            norms[norms == 0] = 1.0
+            side.text = sparse.csr_matrix(sparse.diags(1.0 / norms) @ weighted, dtype=np.float32)
+
+
+def attach_vectors(side, rows):
+    """Keep the unit embeddings of (item_id, vector) rows that belong to this side"""
+    positions, vectors = [], []
+    for item_id, vector in rows:
+        row = side.row_of.get(item_id)
+        norm = np.linalg.norm(vector)
+        if row is None or norm == 0 or not np.isfinite(norm):
+            continue
+        positions.append(row)
+        vectors.append((vector / norm).astype(np.float32))
+    if not vectors:
+        return
+    side.vectors = np.vstack(vectors)
+    side.vector_rows = np.asarray(positions, dtype=np.int64)
+    side.vector_of[side.vector_rows] = np.arange(len(positions))
+
+
+def text_pairs(lost, found, found_text_t, start, stop, measure, threshold):
+    """(lost_rows, found_rows, scores) for text scores >= threshold among lost rows [start, stop)"""
+    product = (lost.text[start:stop] @ found_text_t).tocoo()
+    rows, cols, values = product.row + start, product.col, product.data
+    if measure == 'jaccard':
+        values = values / (lost.sizes[rows] + found.sizes[cols] - values)
+    # float32 ratios like 3/10 can land a hair under the threshold
+    keep = values >= threshold - 1e-6
+    return rows[keep], cols[keep], values[keep]
+
+
+def visual_pairs(lost, found, start, stop, threshold, top_k):
+    """(lost_rows, found_rows, scores) for the top_k embeddings >= threshold of each lost row in [start, stop)"""
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+    if lost.vectors is None or found.vectors is None:
+        return empty
+    rows = np.flatnonzero(lost.vector_of[start:stop] >= 0) + start
+    if not len(rows):
+        return empty
+    scores = lost.vectors[lost.vector_of[rows]] @ found.vectors.T
+    passing = scores >= threshold
+    k = min(top_k, scores.shape[1])
+    if passing.sum(axis=1).max() <= k:
+        # Nothing to rank: every passing score is in its row's top k
+        chunk_rows, columns = np.nonzero(passing)
+        return rows[chunk_rows], found.vector_rows[columns], scores[chunk_rows, columns]
+    top = np.argpartition(scores, scores.shape[1] - k, axis=1)[:, -k:]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    keep = top_scores >= threshold
+    lost_rows = np.repeat(rows, k).reshape(len(rows), k)[keep]
+    return lost_rows, found.vector_rows[top[keep]], top_scores[keep]
+
+
+def fill_text_scores(lost, found, lost_rows, found_rows, measure):
+    """Text score of arbitrary pairs: row-wise products of the text matrices"""
+    if not len(lost_rows):
+        return np.empty(0, dtype=np.float32)
+    shared = np.asarray(lost.text[lost_rows].multiply(found.text[found_rows]).sum(axis=1)).ravel()
+    if measure == 'cosine':
+        return shared
+    union = lost.sizes[lost_rows] + found.sizes[found_rows] - shared
+    return np.where(union > 0, shared / np.maximum(union, 1), 0.0)
+
+
+def fill_visual_scores(lost, found, lost_rows, found_rows):
+    """Cosine of the pairs' embeddings; NaN where either side has none"""
+    scores = np.full(len(lost_rows), np.nan, dtype=np.float32)
+    if lost.vectors is None or found.vectors is None:
+        return scores
+    a = lost.vector_of[lost_rows]
+    b = found.vector_of[found_rows]
+    both = (a >= 0) & (b >= 0)
+    scores[both] = np.einsum('ij,ij->i', lost.vectors[a[both]], found.vectors[b[both]])
+    return scores
+
+
+def write_chunk(lost, found, chunk_lost_ids, pairs, stats, notify=True, dry_run=False):
+    """
+    Diff one chunk's scored pairs against the stored Match rows: upsert scores,
+    drop pending rows between pending items that no longer score, and insert
+    notifications for pairs seen for the first time, all in bulk.
+    """
+    lost_rows, found_rows, text_scores, visual_scores = pairs
+    now = datetime.utcnow()
+
+    scored = {}
+    for lost_row, found_row, text_score, visual_score in zip(lost_rows, found_rows, text_scores, visual_scores):
+        scored[(int(lost.ids[lost_row]), int(found.ids[found_row]))] = (
+            lost_row, found_row,
+            float(text_score),
+            None if np.isnan(visual_score) else float(visual_score)
+        )
+
+    existing = {
+        (lost_id, found_id): (match_id, status) for match_id, lost_id, found_id, status in
+        db.session.query(Match.match_id, Match.lost_item_id, Match.found_item_id, Match.match_status).filter(
+            Match.lost_item_id.in_(chunk_lost_ids)
+        )
+    }
+    stale = [match_id for pair, (match_id, status) in existing.items()
+             if status == 'pending' and pair not in scored and pair[1] in found.row_of]
+    new_pairs = [pair for pair in scored if pair not in existing]
+
+    notifications = NotificationWriter()
+    if notify:
+        # Worded, typed and deduplicated exactly like the report pipeline's notifications
+        for pair in new_pairs:
+            lost_row, found_row, text_score, visual_score = scored[pair]
+            add_match_notifications(
+                notifications,
+                (int(lost.owners[lost_row]), pair[0], lost.titles[lost_row]),
+                (int(found.owners[found_row]), pair[1], found.titles[found_row]),
+                text_score, visual_score, now
+            )
+
+    stats['pairs'] += len(scored)
+    stats['new_pairs'] += len(new_pairs)
+    stats['stale_removed'] += len(stale)
+    stats['notifications'] += len(notifications)
+    if dry_run:
+        return
+
+    upsert_match_rows([match_row(lost_id, found_id, text_score, visual_score, now)
+                       for (lost_id, found_id), (_, _, text_score, visual_score) in scored.items()])
+    if stale:
+        Match.query.filter(Match.match_id.in_(stale)).delete(synchronize_session=False)
+    notifications.flush()
+    db.session.commit()
+
+
+def rematch_all(text_measure='jaccard', text_threshold=0.3, text_top_k=None, embedding_rows=None,
+                visual_threshold=0.60, visual_top_k=5, chunk_size=512, notify=True, dry_run=False, progress=None):
+    """
+    Score every pending lost item against every pending found item.
+    Lost items are processed chunk_size rows at a time, so memory stays
+    bounded by one chunk of sparse text products and one chunk x found dense
+    similarity block. embedding_rows yields (item_id, vector) in the visual
+    index space; without it only text is scored. Returns run statistics.
+    """
+    started = time.perf_counter()
+    lost = PendingSide('lost')
+    found = PendingSide('found')
+    stats = {'lost': len(lost), 'found': len(found), 'pairs': 0, 'new_pairs': 0,
+             'stale_removed': 0, 'notifications': 0, 'pruned': {}}
+    if not len(lost) or not len(found):
+        return stats
+
+    build_text_matrices(lost, found, text_measure)
+    found_text_t = found.text.T.tocsr()
+    if embedding_rows is not None:
+        rows = list(embedding_rows)
+        attach_vectors(lost, rows)
+        attach_vectors(found, rows)
+        del rows
+    stats['lost_with_embeddings'] = len(lost.vector_rows)
+    stats['found_with_embeddings'] = len(found.vector_rows)
+
+    for start in range(0, len(lost), chunk_size):
+        stop = min(start + chunk_size, len(lost))
+        t_lost, t_found, t_scores = text_pairs(lost, found, found_text_t, start, stop, text_measure, text_threshold)
+        if text_top_k is not None and len(t_lost):
+            # Keep the best text_top_k per lost item, like the live engine's max_results
+            order = np.lexsort((-t_scores, t_lost))
+            t_lost, t_found, t_scores = t_lost[order], t_found[order], t_scores[order]
+            rank = np.arange(len(t_lost)) - np.searchsorted(t_lost, t_lost)
+            keep = rank < text_top_k
+            t_lost, t_found, t_scores = t_lost[keep], t_found[keep], t_scores[keep]
+        v_lost, v_found, v_scores = visual_pairs(lost, found, start, stop, visual_threshold, visual_top_k)
+
+        # Union of both passes, each pair scored by both
+        lost_rows = np.concatenate((t_lost, v_lost)).astype(np.int64)
+        found_rows = np.concatenate((t_found, v_found)).astype(np.int64)
+        pair_keys = np.unique(lost_rows * len(found) + found_rows)
+        lost_rows, found_rows = pair_keys // len(found), pair_keys % len(found)
+        different_owner = lost.owners[lost_rows] != found.owners[found_rows]
+        lost_rows, found_rows = lost_rows[different_owner], found_rows[different_owner]
+        # Same pruning rules as the live pipeline, so both paths keep the same pairs
+        keep, removed = prune_pairs(lost, found, lost_rows, found_rows)
+        lost_rows, found_rows = lost_rows[keep], found_rows[keep]
+        for name, count in removed.items():
+            stats['pruned'][name] = stats['pruned'].get(name, 0) + count
+
+        text_scores = fill_text_scores(lost, found, lost_rows, found_rows, text_measure)
+        visual_scores = fill_visual_scores(lost, found, lost_rows, found_rows)
+        write_chunk(lost, found, lost.ids[start:stop].tolist(), (lost_rows, found_rows, text_scores, visual_scores),
+                    stats, notify=notify, dry_run=dry_run)
+        if progress is not None:
+            progress(stop, len(lost), stats)
+
+    stats['seconds'] = round(time.perf_counter() - started, 1)
+    return stats
@@ -1,20 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, make_response
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, make_response, jsonify
 from flask_login import login_required, current_user
-from models import db, Item, Notification, Category, CampusLocation
+from models import db, Item, Notification, Category, CampusLocation, Job, Flag
 from datetime import datetime
+import json
 import os
 from werkzeug.utils import secure_filename
-from modules.matching_simple import matching_engine
+from modules.jobs import enqueue_job, use_background_processing, warn_if_queue_stalled
+from modules.pipeline import process_item
+from modules.image_hash import compute_phash, hash_to_hex, duplicate_index
 from fpdf import FPDF
 
-# Import conditionally based on AI_ENABLED
-try:
-    from modules.ai_processing import image_engine
-    AI_AVAILABLE = True
-except ImportError:
-    AI_AVAILABLE = False
-    print("⚠️ Visual module not available. Image matching disabled.")
-
 reporting_bp = Blueprint('reporting', __name__)
 
 # Allowed file extensions
@@ -56,6 +51,29 @@ def validate_form_data(data):
         errors.append("Invalid date format. Use YYYY-MM-DD")
     
     return errors
+
+def flag_duplicate_reports(new_item, image_hash):
+    """
+    Flag same-type items whose photo is a near copy of the new upload (perceptual
+    hash within DUPLICATE_HASH_DISTANCE bits). Runs before any model inference.
+    Returns the duplicate items.
+    """
+    max_distance = current_app.config.get('DUPLICATE_HASH_DISTANCE', 6)
+    duplicates = [
+        (item, distance) for item, distance in
+        duplicate_index.find_items(image_hash, max_distance, exclude_item_id=new_item.item_id)
+        if item.item_type == new_item.item_type
+    ]
+    for item, distance in duplicates:
+        db.session.add(Flag(
+            flag_type='item',
+            flag_reason=f"Possible duplicate report: photo matches item #{item.item_id} "
+                        f"'{item.item_title}' ({distance}/64 bits differ)",
+            item_id=new_item.item_id,
+            flag_creator_id=new_item.owner_id
+        ))
+    return [item for item, _ in duplicates]
+
 @reporting_bp.route('/report', methods=['GET', 'POST'])
 @login_required
 def report_item():
@@ -85,9 +103,6 @@ def report_item():
             # Parse date
             date_obj = datetime.strptime(form_data['date_lost_found'], '%Y-%m-%d')
             
-            # Check if Visual Processing is enabled in config
-            ai_enabled = current_app.config.get('AI_ENABLED', False) and AI_AVAILABLE
-            
             # Start database transaction
             new_item = Item(
                 item_type=form_data['type'],
@@ -106,7 +121,7 @@ def report_item():
             # Process image if provided
             image_file = request.files.get('image')
             image_processed = False
-            image_matches = []
+            duplicate_items = []
 
             if image_file and image_file.filename:
                 # Validate file
@@ -138,115 +153,48 @@ def report_item():
                     new_item.item_image_path = filename
                     image_processed = True
                     
-                    # Process with Visual Engine if enabled
-                    print(f"🔍 AI_ENABLED in config: {current_app.config.get('AI_ENABLED', False)}")
-                    print(f"🔍 AI_AVAILABLE (module loaded): {AI_AVAILABLE}")
-                    print(f"🔍 ai_enabled (both true): {ai_enabled}")
-                    
-                    if ai_enabled:
-                        try:
-                            print(f"🖼️ Starting visual processing for item {new_item.item_id}")
-                            # Open the newly saved image file
-                            # We use 'rb' (read binary)
-                            with open(filepath, 'rb') as f_stream:
-                                # We pass the item_id and the file stream
-                                image_matches = image_engine.process_new_item(new_item.item_id, f_stream)
-                                print(f"✅ Visual system processed image. Found {len(image_matches)} visual matches")
-                                if len(image_matches) > 0:
-                                    for match in image_matches:
-                                        print(f"   - Match: Item #{match['item'].item_id}, Similarity: {match['similarity']:.2%}")
-                        except Exception as ai_error:
-                            print(f"⚠️ Visual processing error: {ai_error}")
-                            import traceback
-                            traceback.print_exc()
-                    else:
-                        print(f"⚠️ Visual processing skipped (ai_enabled={ai_enabled})")
+                    # Perceptual hash: spots re-uploads of the same photo without running the model
+                    image_hash = compute_phash(filepath)
+                    if image_hash is not None:
+                        new_item.item_image_hash = hash_to_hex(image_hash)
+                        duplicate_items = flag_duplicate_reports(new_item, image_hash)
                     
                 except Exception as e:
                     print(f"❌ Image save error: {e}")
                     flash('Item saved, but image upload failed', 'warning')
             
+            if duplicate_items:
+                titles = ', '.join(f"'{item.item_title}' (#{item.item_id})" for item in duplicate_items[:3])
+                flash(f'⚠️ This photo looks almost identical to {titles}. If it is the same item, please don\'t report it twice.', 'warning')
+            
+            # ===== MATCHING =====
+            # Visual processing, text matching and notifications run in the job
+            # worker so the request returns as soon as the item and image are saved
+            if use_background_processing(current_app.config):
+                enqueue_job('process_item', item_id=new_item.item_id)
+                
+                # Commit the item and its job in one transaction
+                db.session.commit()
+                warn_if_queue_stalled(current_app.config.get('JOB_STALL_WARNING_SECONDS', 120))
+                flash('✅ Item reported! We are checking for matches and will notify you.', 'success')
+                return redirect(url_for('reporting.my_items'))
+            
             # Commit the item to database
             db.session.commit()
             
-            # ===== TEXT-BASED MATCHING =====
-            text_matches_count = 0
+            # Inline there is no retry: a matching failure must not lose the saved report
             try:
-                text_matches_count = matching_engine.find_potential_matches(new_item)
-                if text_matches_count > 0:
-                    db.session.commit()
-                print(f"✅ Text matching found {text_matches_count} matches")
-            except Exception as e:
-                print(f"⚠️ Text matching error: {e}")
-            
-            # ===== PROCESS IMAGE MATCHES (if any) =====
-            image_notifications = 0
-            if image_matches and ai_enabled:
-                for match in image_matches:
-                    matched_item = match['item']
-                    similarity = match['similarity']
-                    
-                    if matched_item.owner_id == current_user.user_id:
-                        continue
-                    
-                    # Determine notification details - SEND TO BOTH PARTIES
-                    if new_item.item_type == 'lost' and matched_item.item_type == 'found':
-                        # Notify the person who lost the item (current user)
-                        notification_to_loser = Notification(
-                            user_id=current_user.user_id,
-                            item_id=matched_item.item_id,
-                            notification_message=f"📸 Visual match found! We found an item that looks like your lost '{new_item.item_title}'. Similarity: {similarity:.1%}",
-                            notification_type='visual_match',
-                            notification_is_seen=False
-                        )
-                        db.session.add(notification_to_loser)
-                        
-                        # Notify the finder (owner of found item)
-                        notification_to_finder = Notification(
-                            user_id=matched_item.owner_id,
-                            item_id=new_item.item_id,
-                            notification_message=f"📸 Visual match found! Someone reported a lost item that looks like your found '{matched_item.item_title}'. Similarity: {similarity:.1%}",
-                            notification_type='visual_match',
-                            notification_is_seen=False
-                        )
-                        db.session.add(notification_to_finder)
-                        image_notifications += 1
-                    
-                    elif new_item.item_type == 'found' and matched_item.item_type == 'lost':
-                        # Notify the person who lost the item (owner of matched item)
-                        notification_to_loser = Notification(
-                            user_id=matched_item.owner_id,
-                            item_id=new_item.item_id,
-                            notification_message=f"📸 Visual match found! Someone found an item that looks like your lost '{matched_item.item_title}'. Similarity: {similarity:.1%}",
-                            notification_type='visual_match',
-                            notification_is_seen=False
-                        )
-                        db.session.add(notification_to_loser)
-                        
-                        # Notify the finder (current user)
-                        notification_to_finder = Notification(
-                            user_id=current_user.user_id,
-                            item_id=matched_item.item_id,
-                            notification_message=f"📸 Visual match found! Your found item '{new_item.item_title}' matches a lost report. Similarity: {similarity:.1%}",
-                            notification_type='visual_match',
-                            notification_is_seen=False
-                        )
-                        db.session.add(notification_to_finder)
-                        image_notifications += 1
-                        
-                    else:
-                        continue
-                
-                if image_notifications > 0:
-                    db.session.commit()
+                matches_count = process_item(new_item.item_id)['matches']
+            except Exception as processing_error:
+                db.session.rollback()
+                print(f"⚠️ Matching failed for item {new_item.item_id}: {processing_error}")
+                import traceback
+                traceback.print_exc()
+                matches_count = 0
             
             # ===== FINAL FEEDBACK =====
-            if text_matches_count > 0 and image_notifications > 0:
-                flash(f'✅ Item reported! Found {text_matches_count} text matches and {image_notifications} visual matches!', 'success')
-            elif text_matches_count > 0:
-                flash(f'✅ Item reported! Found {text_matches_count} potential matches.', 'success')
-            elif image_notifications > 0:
-                flash(f'✅ Item reported! Found {image_notifications} visual matches.', 'success')
+            if matches_count > 0:
+                flash(f'✅ Item reported! Found {matches_count} potential matches.', 'success')
             elif image_processed:
                 flash('✅ Item reported with image!', 'success')
             else:
@@ -263,6 +211,30 @@ def report_item():
     return render_template('reporting/report.html', categories=categories, locations=locations)
 
 
+@reporting_bp.route('/item/<int:item_id>/processing-status')
+@login_required
+def processing_status(item_id):
+    """Report progress of the latest background job for an item (polled by the UI)"""
+    item = Item.query.get_or_404(item_id)
+    
+    if item.owner_id != current_user.user_id and current_user.user_role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    job = Job.query.filter_by(item_id=item_id).order_by(Job.job_id.desc()).first()
+    if job is None:
+        return jsonify({'item_id': item_id, 'status': 'none'})
+    
+    return jsonify({
+        'item_id': item_id,
+        'job_id': job.job_id,
+        'status': job.job_status,
+        'stage': job.job_stage,
+        'attempts': job.job_attempts,
+        'result': json.loads(job.job_result) if job.job_result else None,
+        'error': job.job_error if job.job_status == 'failed' else None
+    })
+
+
 @reporting_bp.route('/my-items')
 @login_required
 def my_items():
@@ -353,6 +325,7 @@ def edit_item(item_id):
     
     if request.method == 'POST':
         try:
+            matched_fields = (item.item_title, item.item_description, item.item_location, item.item_category)
             # Update fields with prefixed names
             item.item_title = request.form.get('title', item.item_title).strip()  # Use item_title
             item.item_description = request.form.get('description', item.item_description).strip()  # Use item_description
@@ -361,6 +334,7 @@ def edit_item(item_id):
             
             # Handle new image
             image_file = request.files.get('image')
+            image_replaced = False
             if image_file and image_file.filename and allowed_file(image_file.filename):
                 # Delete old image if exists
                 if item.item_image_path:  # ✅ Use item_image_path
@@ -377,8 +351,31 @@ def edit_item(item_id):
                 
                 image_file.save(filepath)
                 item.item_image_path = filename  # ✅ Use item_image_path
+                image_hash = compute_phash(filepath)
+                item.item_image_hash = hash_to_hex(image_hash) if image_hash is not None else None
+                
+                # The old vectors describe the old photo; drop them until it is re-embedded
+                if item.embedding:
+                    db.session.delete(item.embedding)
+                image_replaced = True
             
+            # Text or photo changes alter the item's matches: re-embed and re-score it
+            # (stale Match rows are dropped; only newly matched pairs are notified)
+            rescore = image_replaced or matched_fields != (item.item_title, item.item_description,
+                                                           item.item_location, item.item_category)
+            background = use_background_processing(current_app.config)
+            if rescore and background:
+                enqueue_job('process_item', item_id=item.item_id)
             db.session.commit()
+            if rescore and not background:
+                # The edit is saved; a matching failure only leaves the old matches in place
+                try:
+                    process_item(item.item_id)
+                except Exception as processing_error:
+                    db.session.rollback()
+                    print(f"⚠️ Re-matching failed for edited item {item.item_id}: {processing_error}")
+                    import traceback
+                    traceback.print_exc()
             flash('Item updated successfully!', 'success')
             return redirect(url_for('reporting.my_items'))
             
@@ -0,0 +1,687 @@
+import hashlib
+import math
+import threading
+from functools import lru_cache
+import numpy as np
+from scipy import sparse
+
+
+def item_tokens(title, description, category, location):
+    """Lower-cased word set of an item's text fields, as compared by the text matcher"""
+    def clean(s): return str(s).lower() if s else ""
+    return frozenset(f"{clean(title)} {clean(description)} {clean(category)} {clean(location)}".split())
+
+
+def jaccard(tokens1, tokens2):
+    if not tokens1 and not tokens2:
+        return 0.0
+    intersection = len(tokens1 & tokens2)
+    union = len(tokens1) + len(tokens2) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class TokenIndex:
+    """
+    Inverted index (token -> posting set of item_ids) per (item_type, item_status).
+    A query only looks at items sharing a token with it, and with a threshold
+    only at the postings of its rarest tokens (prefix filter): J(A, B) >= t
+    needs |A & B| >= t|A|, so B must contain one of A's |A| - ceil(t|A|) + 1
+    rarest tokens. Surviving candidates are scored with exact Jaccard.
+    """
+    similarity_measure = 'jaccard'  # what search() scores are
+
+    def __init__(self):
+        self.loaded = False
+        self._postings = {}  # key -> {token: set(item_ids)}
+        self._tokens = {}  # item_id -> frozenset of tokens
+        self._partition_of = {}  # item_id -> key
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __contains__(self, item_id):
+        return item_id in self._tokens
+
+    @property
+    def item_ids(self):
+        return set(self._tokens)
+
+    def partition_of(self, item_id):
+        return self._partition_of.get(item_id)
+
+    def partition_sizes(self):
+        with self._lock:
+            sizes = {}
+            for key in self._partition_of.values():
+                sizes[key] = sizes.get(key, 0) + 1
+            return {f"{item_type}/{item_status}": size for (item_type, item_status), size in sizes.items()}
+
+    def get_tokens(self, item_id):
+        return self._tokens.get(item_id)
+
+    def build(self, rows):
+        """Index (item_id, key, tokens) rows, replacing the current contents"""
+        with self._lock:
+            self._postings = {}
+            self._tokens = {}
+            self._partition_of = {}
+            for item_id, key, tokens in rows:
+                self._add(item_id, tokens, key)
+            self.loaded = True
+
+    def _add(self, item_id, tokens, key):
+        postings = self._postings.setdefault(key, {})
+        for token in tokens:
+            postings.setdefault(token, set()).add(item_id)
+        self._tokens[item_id] = tokens
+        self._partition_of[item_id] = key
+
+    def upsert(self, item_id, tokens, key):
+        """Add or replace an item; a no-op when nothing changed"""
+        tokens = frozenset(tokens)
+        with self._lock:
+            if self._tokens.get(item_id) == tokens and self._partition_of.get(item_id) == key:
+                return False
+            self.remove(item_id)
+            self._add(item_id, tokens, key)
+            return True
+
+    def remove(self, item_id):
+        with self._lock:
+            tokens = self._tokens.pop(item_id, None)
+            if tokens is None:
+                return False
+            key = self._partition_of.pop(item_id)
+            postings = self._postings[key]
+            for token in tokens:
+                posting = postings.get(token)
+                if posting is not None:
+                    posting.discard(item_id)
+                    if not posting:
+                        del postings[token]
+            return True
+
+    def search(self, tokens, partitions=None, threshold=0.0, exclude_ids=(), k=None, allowed_ids=None):
+        """
+        All (item_id, jaccard) with jaccard >= threshold in the given partitions, best first.
+        With allowed_ids (a set) only those items are scored.
+        """
+        tokens = frozenset(tokens)
+        results = []
+        if not tokens:
+            return results
+        with self._lock:
+            keys = list(self._postings) if partitions is None else [key for key in partitions if key in self._postings]
+            for key in keys:
+                postings = self._postings[key]
+                if threshold > 0:
+                    # Rarest tokens first; tokens absent from the partition have empty postings
+                    ordered = sorted(tokens, key=lambda token: len(postings.get(token, ())))
+                    # (the epsilon keeps e.g. 0.3 * 10 from rounding up to 4 shared tokens)
+                    needed = math.ceil(threshold * len(tokens) - 1e-9)
+                    probe = ordered[:len(tokens) - needed + 1]
+                    min_size, max_size = needed, len(tokens) / threshold + 1e-9
+                else:
+                    # Everything scores >= 0: fall back to the whole partition
+                    probe = None
+                    min_size, max_size = 0, math.inf
+
+                if probe is None and allowed_ids is not None:
+                    candidates = {item_id for item_id in allowed_ids if self._partition_of.get(item_id) == key}
+                elif probe is None:
+                    candidates = {item_id for posting in postings.values() for item_id in posting}
+                else:
+                    candidates = set()
+                    for token in probe:
+                        candidates.update(postings.get(token, ()))
+                    if allowed_ids is not None:
+                        candidates &= allowed_ids
+
+                for item_id in candidates:
+                    if item_id in exclude_ids:
+                        continue
+                    other = self._tokens[item_id]
+                    if not min_size <= len(other) <= max_size:
+                        continue
+                    score = jaccard(tokens, other)
+                    if score >= threshold:
+                        results.append((item_id, score))
+        results.sort(key=lambda hit: hit[1], reverse=True)
+        return results if k is None else results[:k]
+
+
+# Universal hashing modulo the Mersenne prime 2^61 - 1, as in the usual MinHash construction
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Mixes the rows of a band into one bucket key
+_BAND_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+@lru_cache(maxsize=1 << 20)
+def token_hash(token):
+    """Stable 64-bit token hash (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def optimal_bands(threshold, num_perm, false_positive_weight=0.3, false_negative_weight=0.7):
+    """
+    Pick (bands, rows) with bands * rows <= num_perm minimising the weighted
+    probability mass of false positives below the threshold and false
+    negatives above it. A pair with Jaccard s becomes a candidate with
+    probability 1 - (1 - s^rows)^bands.
+    """
+    below = np.linspace(0.0, threshold, 200)
+    above = np.linspace(threshold, 1.0, 200)
+    best, best_error = (1, num_perm), np.inf
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        false_positive = np.mean(1 - (1 - below ** rows) ** bands) * threshold
+        false_negative = np.mean((1 - above ** rows) ** bands) * (1.0 - threshold)
+        error = false_positive_weight * false_positive + false_negative_weight * false_negative
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashIndex:
+    """
+    MinHash signatures with LSH banding, tuned to one Jaccard threshold.
+    Each item's signature is cut into `bands` bands of `rows` values; items
+    sharing any band bucket with the query are candidates, which are then
+    verified with exact Jaccard on their stored token hashes. Lookups cost
+    one bucket probe per band whatever the number of items, at the price of
+    missing a few pairs just above the threshold (see benchmark_text_matching.py).
+
+    Buckets live in per-band sorted key arrays plus a small dict of rows added
+    since the last merge; removed rows are tombstoned and compacted later.
+    """
+    similarity_measure = 'jaccard'  # what search() scores are
+
+    def __init__(self, threshold=0.3, num_perm=256, seed=1, merge_ratio=0.1, initial_capacity=1024):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self.merge_ratio = merge_ratio
+        self.loaded = False
+        self._initial_capacity = initial_capacity
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._keys = np.empty((0, self.bands), dtype=np.uint32)  # band bucket keys per row
+        self._item_ids = np.empty(0, dtype=np.int64)
+        self._codes = np.empty(0, dtype=np.int16)  # partition code per row, -1 once removed
+        self._hashes = []  # row -> sorted uint64 token hashes
+        self._size = 0
+        self._dead = 0
+        self._rows_of = {}  # item_id -> row
+        self._partition_codes = {}  # (item_type, item_status) -> code
+        self._partition_keys = []
+        self._base_size = 0
+        self._base_keys = [np.empty(0, dtype=np.uint32)] * self.bands
+        self._base_rows = [np.empty(0, dtype=np.int32)] * self.bands
+        self._delta = [{} for _ in range(self.bands)]
+
+    def __len__(self):
+        return len(self._rows_of)
+
+    def __contains__(self, item_id):
+        return item_id in self._rows_of
+
+    @property
+    def item_ids(self):
+        return set(self._rows_of)
+
+    def partition_of(self, item_id):
+        row = self._rows_of.get(item_id)
+        return None if row is None else self._partition_keys[self._codes[row]]
+
+    def partition_sizes(self):
+        with self._lock:
+            counts = np.bincount(self._codes[:self._size][self._codes[:self._size] >= 0],
+                                 minlength=len(self._partition_keys))
+            return {f"{item_type}/{item_status}": int(count)
+                    for (item_type, item_status), count in zip(self._partition_keys, counts) if count}
+
+    def get_tokens(self, item_id):
+        return None  # only token hashes are kept
+
+    def _code(self, key):
+        code = self._partition_codes.get(key)
+        if code is None:
+            code = self._partition_codes[key] = len(self._partition_keys)
+            self._partition_keys.append(key)
+        return code
+
+    @staticmethod
+    def token_hashes(tokens):
+        return np.unique(np.fromiter((token_hash(token) for token in tokens), dtype=np.uint64, count=len(tokens)))
+
+    def signatures(self, hash_lists):
+        """MinHash signatures (n, num_perm) for a list of non-empty token hash arrays"""
+        lengths = np.fromiter((len(hashes) for hashes in hash_lists), dtype=np.int64, count=len(hash_lists))
+        values = np.concatenate(hash_lists) & _MAX_HASH
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # (a * x + b) mod p on 32-bit inputs; overflow past 2^64 wraps, which only perturbs the hash
+        permuted = ((values[:, None] * self._a + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return np.minimum.reduceat(permuted, starts, axis=0)
+
+    def band_keys(self, signatures):
+        """
+        Fold each band's rows into one uint32 bucket key: (n, bands). A 32-bit
+        key keeps the bucket arrays small; the odd extra candidate from a key
+        collision is dropped by the exact check.
+        """
+        banded = signatures[:, :self.bands * self.rows].reshape(len(signatures), self.bands, self.rows)
+        keys = banded[:, :, 0].copy()
+        for j in range(1, self.rows):
+            keys = keys * _BAND_MIX ^ banded[:, :, j]
+        return ((keys * _BAND_MIX) >> np.uint64(32)).astype(np.uint32)
+
+    def _reserve(self, needed):
+        capacity = self._keys.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, self._initial_capacity)
+        keys = np.empty((new_capacity, self.bands), dtype=np.uint32)
+        item_ids = np.empty(new_capacity, dtype=np.int64)
+        codes = np.full(new_capacity, -1, dtype=np.int16)
+        keys[:self._size] = self._keys[:self._size]
+        item_ids[:self._size] = self._item_ids[:self._size]
+        codes[:self._size] = self._codes[:self._size]
+        self._keys, self._item_ids, self._codes = keys, item_ids, codes
+
+    def _append(self, item_ids, keys, hash_lists, codes):
+        start = self._size
+        count = len(item_ids)
+        self._reserve(start + count)
+        self._keys[start:start + count] = keys
+        self._item_ids[start:start + count] = item_ids
+        self._codes[start:start + count] = codes
+        self._hashes.extend(hash_lists)
+        for offset, item_id in enumerate(item_ids):
+            self._rows_of[item_id] = start + offset
+        self._size += count
+        return start
+
+    def _merge(self):
+        """Fold the delta buckets into the sorted arrays, dropping tombstoned rows"""
+        live = np.flatnonzero(self._codes[:self._size] >= 0)
+        for band in range(self.bands):
+            keys = self._keys[live, band]
+            order = np.argsort(keys, kind='stable')
+            self._base_keys[band] = keys[order]
+            self._base_rows[band] = live[order].astype(np.int32)
+        self._base_size = self._size
+        self._delta = [{} for _ in range(self.bands)]
+
+    def _compact(self):
+        """Re-pack the rows once a quarter of them are tombstones"""
+        live = np.flatnonzero(self._codes[:self._size] >= 0)
+        self._keys = self._keys[live]
+        self._item_ids = self._item_ids[live]
+        self._codes = self._codes[live]
+        self._hashes = [self._hashes[row] for row in live]
+        self._size = len(live)
+        self._dead = 0
+        self._rows_of = {int(item_id): row for row, item_id in enumerate(self._item_ids)}
+        self._merge()
+
+    def build(self, rows, chunk_size=2000):
+        """Index (item_id, key, tokens) rows, replacing the current contents"""
+        with self._lock:
+            self._reset()
+            batch = []
+            for item_id, key, tokens in rows:
+                if tokens:
+                    batch.append((item_id, self._code(key), self.token_hashes(tokens)))
+                if len(batch) == chunk_size:
+                    self._add_batch(batch)
+                    batch = []
+            if batch:
+                self._add_batch(batch)
+            self._merge()
+            self.loaded = True
+
+    def _add_batch(self, batch):
+        item_ids = [item_id for item_id, _, _ in batch]
+        hash_lists = [hashes for _, _, hashes in batch]
+        keys = self.band_keys(self.signatures(hash_lists))
+        for item_id in item_ids:
+            self._tombstone(item_id)
+        return self._append(item_ids, keys, hash_lists, [code for _, code, _ in batch])
+
+    def _tombstone(self, item_id):
+        row = self._rows_of.pop(item_id, None)
+        if row is None:
+            return False
+        self._codes[row] = -1
+        self._hashes[row] = None
+        self._dead += 1
+        return True
+
+    def upsert(self, item_id, tokens, key):
+        """Add or replace an item; a no-op when nothing changed"""
+        with self._lock:
+            if not tokens:
+                return self.remove(item_id)
+            hashes = self.token_hashes(tokens)
+            row = self._rows_of.get(item_id)
+            if (row is not None and self._partition_keys[self._codes[row]] == key
+                    and np.array_equal(self._hashes[row], hashes)):
+                return False
+            start = self._add_batch([(item_id, self._code(key), hashes)])
+            for band in range(self.bands):
+                self._delta[band].setdefault(int(self._keys[start, band]), []).append(start)
+            self._maintain()
+            return True
+
+    def remove(self, item_id):
+        with self._lock:
+            if not self._tombstone(item_id):
+                return False
+            self._maintain()
+            return True
+
+    def _maintain(self):
+        if self._dead > max(1000, self._size // 4):
+            self._compact()
+        elif self._size - self._base_size > max(1000, self._base_size * self.merge_ratio):
+            self._merge()
+
+    def candidates(self, tokens):
+        """Rows sharing at least one band bucket with the tokens"""
+        hashes = self.token_hashes(frozenset(tokens))
+        if not len(hashes):
+            return hashes, np.empty(0, dtype=np.int64)
+        keys = self.band_keys(self.signatures([hashes]))[0]
+        found = []
+        for band, key in enumerate(keys):
+            base_keys = self._base_keys[band]
+            lo = np.searchsorted(base_keys, key, side='left')
+            hi = np.searchsorted(base_keys, key, side='right')
+            if hi > lo:
+                found.append(self._base_rows[band][lo:hi])
+            delta = self._delta[band].get(int(key))
+            if delta:
+                found.append(np.asarray(delta, dtype=np.int64))
+        if not found:
+            return hashes, np.empty(0, dtype=np.int64)
+        return hashes, np.unique(np.concatenate(found))
+
+    def search(self, tokens, partitions=None, threshold=0.0, exclude_ids=(), k=None, allowed_ids=None):
+        """
+        LSH candidates with exact jaccard >= threshold in the given partitions, best first.
+        With allowed_ids only those items are verified.
+        """
+        results = []
+        with self._lock:
+            hashes, rows = self.candidates(tokens)
+            if not len(rows):
+                return results
+            codes = self._codes[rows]
+            if partitions is None:
+                rows = rows[codes >= 0]
+            else:
+                wanted = [self._partition_codes[key] for key in partitions if key in self._partition_codes]
+                rows = rows[np.isin(codes, wanted)]
+            if allowed_ids is not None:
+                allowed = np.fromiter(allowed_ids, dtype=np.int64, count=len(allowed_ids))
+                rows = rows[np.isin(self._item_ids[rows], allowed)]
+            query = set(hashes.tolist())
+            for row in rows:
+                item_id = int(self._item_ids[row])
+                if item_id in exclude_ids:
+                    continue
+                other = self._hashes[row]
+                intersection = len(query.intersection(other.tolist()))
+                score = intersection / (len(query) + len(other) - intersection)
+                if score >= threshold:
+                    results.append((item_id, score))
+        results.sort(key=lambda hit: hit[1], reverse=True)
+        return results if k is None else results[:k]
+
+
+class TfidfIndex:
+    """
+    Sparse TF-IDF vectors (binary term presence x smoothed IDF, L2-normalized)
+    with one CSR matrix per (item_type, item_status). Scoring a query against
+    a partition is one sparse matrix-vector product giving cosine similarity
+    for every row at once.
+
+    New tokens get a column as they appear and new items are appended with
+    the current IDF. Document frequencies are kept exact. Once the corpus has
+    changed by `refresh_ratio` since the last weighting, every matrix is
+    re-weighted with fresh IDF values.
+    """
+    similarity_measure = 'cosine'  # what search() scores are
+
+    def __init__(self, refresh_ratio=0.2):
+        self.refresh_ratio = refresh_ratio
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._columns = {}  # token -> column
+        self._df = np.zeros(0, dtype=np.int64)  # live items containing each column
+        self._idf = np.zeros(0, dtype=np.float64)  # weights the stored rows were built with
+        self._terms = {}  # item_id -> column array
+        self._location = {}  # item_id -> (key, row)
+        self._partitions = {}  # key -> partition state
+        self._changes = 0  # inserts and removals since the last re-weighting
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __contains__(self, item_id):
+        return item_id in self._terms
+
+    @property
+    def item_ids(self):
+        return set(self._terms)
+
+    def partition_of(self, item_id):
+        location = self._location.get(item_id)
+        return None if location is None else location[0]
+
+    def partition_sizes(self):
+        with self._lock:
+            return {f"{item_type}/{item_status}": len(partition['ids']) - partition['dead']
+                    for (item_type, item_status), partition in self._partitions.items()}
+
+    def get_tokens(self, item_id):
+        return None  # only column ids are kept
+
+    def _smoothed_idf(self, df):
+        # Same smoothing as sklearn's TfidfVectorizer(smooth_idf=True)
+        return np.log((1.0 + len(self._terms)) / (1.0 + df)) + 1.0
+
+    def _columns_for(self, tokens, grow):
+        columns = []
+        for token in tokens:
+            column = self._columns.get(token)
+            if column is None and grow:
+                column = self._columns[token] = len(self._columns)
+            if column is not None:
+                columns.append(column)
+        if grow and len(self._columns) > len(self._df):
+            grown = len(self._columns) - len(self._df)
+            self._df = np.concatenate((self._df, np.zeros(grown, dtype=np.int64)))
+            # Unseen tokens start at the rarest weight until the next re-weighting
+            self._idf = np.concatenate((self._idf, np.full(grown, self._smoothed_idf(0))))
+        return np.unique(np.asarray(columns, dtype=np.int64))
+
+    def _weighted_rows(self, column_lists):
+        """CSR matrix of L2-normalized idf-weighted rows for the given column arrays"""
+        lengths = [len(columns) for columns in column_lists]
+        indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        indices = np.concatenate(column_lists) if column_lists else np.empty(0, dtype=np.int64)
+        data = self._idf[indices]
+        norms = np.sqrt(np.add.reduceat(data ** 2, indptr[:-1])) if len(data) else np.empty(0)
+        if len(data):
+            data = data / np.repeat(norms, lengths)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(column_lists), len(self._columns)))
+
+    def _new_partition(self):
+        return {
+            'matrix': sparse.csr_matrix((0, len(self._columns))),
+            'ids': [],
+            'live': np.zeros(0, dtype=bool),
+            'pending': [],  # rows appended since the matrix was last stacked
+            'dead': 0,
+        }
+
+    def _rebuild_partition(self, key, item_ids):
+        partition = self._new_partition()
+        partition['ids'] = list(item_ids)
+        partition['live'] = np.ones(len(item_ids), dtype=bool)
+        partition['matrix'] = self._weighted_rows([self._terms[item_id] for item_id in item_ids])
+        for row, item_id in enumerate(item_ids):
+            self._location[item_id] = (key, row)
+        self._partitions[key] = partition
+
+    def refresh(self):
+        """Re-weight every stored row with IDF values from the current document frequencies"""
+        with self._lock:
+            self._idf = self._smoothed_idf(self._df)
+            for key, partition in list(self._partitions.items()):
+                self._rebuild_partition(key, self._live_ids(partition))
+            self._changes = 0
+
+    def build(self, rows):
+        """Index (item_id, key, tokens) rows, replacing the current contents"""
+        with self._lock:
+            self._reset()
+            grouped = {}
+            for item_id, key, tokens in rows:
+                if not tokens:
+                    continue
+                self._terms[item_id] = self._columns_for(tokens, grow=True)
+                grouped.setdefault(key, []).append(item_id)
+            if self._terms:
+                self._df = np.bincount(np.concatenate(list(self._terms.values())), minlength=len(self._columns))
+            self._idf = self._smoothed_idf(self._df)
+            for key, item_ids in grouped.items():
+                self._rebuild_partition(key, item_ids)
+            self.loaded = True
+
+    def upsert(self, item_id, tokens, key):
+        """Add or replace an item; a no-op when nothing changed"""
+        with self._lock:
+            if not tokens:
+                return self.remove(item_id)
+            columns = self._columns_for(tokens, grow=True)
+            location = self._location.get(item_id)
+            if location is not None and location[0] == key and np.array_equal(self._terms[item_id], columns):
+                return False
+            self.remove(item_id)
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = self._new_partition()
+            self._terms[item_id] = columns
+            self._df[columns] += 1
+            row = len(partition['ids'])
+            partition['ids'].append(item_id)
+            partition['pending'].append(columns)
+            self._location[item_id] = (key, row)
+            self._changes += 1
+            self._maintain()
+            return True
+
+    def remove(self, item_id):
+        with self._lock:
+            location = self._location.pop(item_id, None)
+            if location is None:
+                return False
+            key, row = location
+            columns = self._terms.pop(item_id)
+            self._df[columns] -= 1
+            partition = self._partitions[key]
+            self._stack(partition)
+            partition['live'][row] = False
+            partition['dead'] += 1
+            self._changes += 1
+            self._maintain()
+            return True
+
+    def _maintain(self):
+        if self._changes > max(100, len(self._terms) * self.refresh_ratio):
+            self.refresh()
+        else:
+            for key, partition in list(self._partitions.items()):
+                if partition['dead'] > max(100, len(partition['ids']) // 4):
+                    self._rebuild_partition(key, self._live_ids(partition))
+
+    def _stack(self, partition):
+        """Append pending rows to the partition matrix, widening it for new columns"""
+        if not partition['pending']:
+            return
+        matrix = partition['matrix']
+        matrix.resize((matrix.shape[0], len(self._columns)))
+        partition['matrix'] = sparse.vstack((matrix, self._weighted_rows(partition['pending'])), format='csr')
+        partition['live'] = np.concatenate((partition['live'], np.ones(len(partition['pending']), dtype=bool)))
+        partition['pending'] = []
+
+    def _live_ids(self, partition):
+        self._stack(partition)
+        return [item_id for row, item_id in enumerate(partition['ids']) if partition['live'][row]]
+
+    def query_vector(self, tokens):
+        """Dense L2-normalized query over the known vocabulary, or None if no token is known"""
+        columns = self._columns_for(tokens, grow=False)
+        if not len(columns):
+            return None
+        query = np.zeros(len(self._columns), dtype=np.float64)
+        query[columns] = self._idf[columns]
+        return query / np.linalg.norm(query)
+
+    def similarity(self, tokens1, tokens2):
+        """Cosine similarity of two token sets under the current IDF weights"""
+        with self._lock:
+            query1 = self.query_vector(tokens1)
+            query2 = self.query_vector(tokens2)
+            if query1 is None or query2 is None:
+                return 0.0
+            return float(query1 @ query2)
+
+    def search(self, tokens, partitions=None, threshold=0.0, exclude_ids=(), k=None, allowed_ids=None):
+        """
+        (item_id, cosine) pairs with cosine >= threshold in the given partitions, best first.
+        With allowed_ids only those items' rows are multiplied.
+        """
+        results = []
+        with self._lock:
+            query = self.query_vector(frozenset(tokens))
+            if query is None:
+                return results
+            keys = list(self._partitions) if partitions is None else [key for key in partitions if key in self._partitions]
+            for key in keys:
+                partition = self._partitions[key]
+                self._stack(partition)
+                matrix = partition['matrix']
+                if matrix.shape[0] == 0:
+                    continue
+                if allowed_ids is None:
+                    row_ids = np.arange(matrix.shape[0])
+                    scores = matrix @ query[:matrix.shape[1]]
+                    scores[~partition['live']] = -np.inf
+                else:
+                    # Only live rows of this partition are located, so no mask is needed
+                    located = (self._location.get(item_id) for item_id in allowed_ids)
+                    row_ids = np.fromiter((location[1] for location in located if location is not None and location[0] == key),
+                                          dtype=np.int64)
+                    scores = matrix[row_ids] @ query[:matrix.shape[1]]
+                rows = np.flatnonzero((scores >= threshold) & (scores > 0))
+                if k is not None and len(rows) > k + len(exclude_ids):
+                    rows = rows[np.argpartition(-scores[rows], k + len(exclude_ids) - 1)[:k + len(exclude_ids)]]
+                for row in rows:
+                    item_id = partition['ids'][row_ids[row]]
+                    if item_id not in exclude_ids:
+                        results.append((item_id, float(scores[row])))
+        results.sort(key=lambda hit: hit[1], reverse=True)
+        return results if k is None else results[:k]
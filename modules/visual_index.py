@@ -0,0 +1,523 @@
+import os
+import threading
+import numpy as np
+
+
+class EmbeddingIndex:
+    """
+    Resident cosine-similarity index over image embeddings.
+    Vectors are stored L2-normalized in one contiguous float32 matrix with a
+    parallel item_id array, so a query is a single matrix-vector product.
+    """
+
+    def __init__(self, dim=None, initial_capacity=1024):
+        self.dim = dim
+        self.loaded = False
+        self._initial_capacity = initial_capacity
+        self._vectors = None
+        self._item_ids = np.empty(0, dtype=np.int64)
+        self._positions = {}  # item_id -> row in self._vectors
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, item_id):
+        return item_id in self._positions
+
+    @staticmethod
+    def normalize(vector):
+        """Return a float32 unit vector, or None for empty/zero vectors"""
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if vector.size == 0 or norm == 0 or not np.isfinite(norm):
+            return None
+        return vector / norm
+
+    def _reserve(self, needed):
+        """Grow the backing arrays geometrically so appends stay amortized O(1)"""
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, self._initial_capacity)
+        vectors = np.empty((new_capacity, self.dim), dtype=np.float32)
+        item_ids = np.empty(new_capacity, dtype=np.int64)
+        if self._size:
+            vectors[:self._size] = self._vectors[:self._size]
+            item_ids[:self._size] = self._item_ids[:self._size]
+        self._vectors = vectors
+        self._item_ids = item_ids
+
+    def build(self, item_ids, vectors):
+        """Replace the index contents with the given ids and raw vectors"""
+        with self._lock:
+            self._vectors = None
+            self._item_ids = np.empty(0, dtype=np.int64)
+            self._positions = {}
+            self._size = 0
+
+            rows = []
+            ids = []
+            for item_id, vector in zip(item_ids, vectors):
+                unit = self.normalize(vector)
+                if unit is None:
+                    continue
+                if self.dim is None:
+                    self.dim = unit.shape[0]
+                if unit.shape[0] != self.dim:
+                    continue
+                if item_id in self._positions:
+                    rows[self._positions[item_id]] = unit
+                    continue
+                self._positions[item_id] = len(rows)
+                rows.append(unit)
+                ids.append(item_id)
+
+            if rows:
+                self._reserve(len(rows))
+                self._vectors[:len(rows)] = np.vstack(rows)
+                self._item_ids[:len(rows)] = ids
+                self._size = len(rows)
+            self.loaded = True
+
+    def upsert(self, item_id, vector):
+        """Insert or replace the vector for an item"""
+        unit = self.normalize(vector)
+        if unit is None:
+            return False
+        with self._lock:
+            if self.dim is None:
+                self.dim = unit.shape[0]
+            if unit.shape[0] != self.dim:
+                return False
+            row = self._positions.get(item_id)
+            if row is None:
+                self._reserve(self._size + 1)
+                row = self._size
+                self._item_ids[row] = item_id
+                self._positions[item_id] = row
+                self._size += 1
+            self._vectors[row] = unit
+            return True
+
+    def get_vector(self, item_id):
+        """Copy of the stored unit vector for an item, or None"""
+        with self._lock:
+            row = self._positions.get(item_id)
+            if row is None:
+                return None
+            return self._vectors[row].copy()
+
+    def remove(self, item_id):
+        """Drop an item by moving the last row into its slot"""
+        with self._lock:
+            row = self._positions.pop(item_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if row != last:
+                moved_id = int(self._item_ids[last])
+                self._vectors[row] = self._vectors[last]
+                self._item_ids[row] = moved_id
+                self._positions[moved_id] = row
+            self._size -= 1
+            return True
+
+    def search(self, query, k=5, threshold=None, exclude_ids=(), allowed_ids=None):
+        """Return up to k (item_id, similarity) pairs, best first; with allowed_ids only those rows are scored"""
+        unit = self.normalize(query)
+        if unit is None or k <= 0:
+            return []
+        with self._lock:
+            if self._size == 0 or unit.shape[0] != self.dim:
+                return []
+            if allowed_ids is None:
+                scores = self._vectors[:self._size] @ unit
+                item_ids = self._item_ids[:self._size].copy()
+            else:
+                rows = np.fromiter((self._positions[item_id] for item_id in allowed_ids if item_id in self._positions),
+                                   dtype=np.int64)
+                scores = self._vectors[rows] @ unit
+                item_ids = self._item_ids[rows]
+
+        # Excluded ids are dropped after the cut, so keep enough rows to still return k
+        excluded = set(exclude_ids)
+        wanted = k + len(excluded)
+        if wanted < scores.shape[0]:
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        results = []
+        for row in top:
+            item_id = int(item_ids[row])
+            if item_id in excluded:
+                continue
+            score = float(scores[row])
+            if threshold is not None and score < threshold:
+                break
+            results.append((item_id, score))
+            if len(results) == k:
+                break
+        return results
+
+
+class IVFIndex(EmbeddingIndex):
+    """
+    Approximate index using an inverted file with a k-means coarse quantizer.
+    Vectors are bucketed by their nearest centroid; a query only scores the
+    rows in its `nprobe` closest buckets. Raise nprobe for recall, lower it
+    for latency. Until the quantizer is trained it behaves like EmbeddingIndex.
+    """
+
+    def __init__(self, dim=None, nlist=256, nprobe=8, niter=20, train_size=None,
+                 min_train_size=None, seed=0, space_id=0, initial_capacity=1024):
+        super().__init__(dim=dim, initial_capacity=initial_capacity)
+        self.space_id = space_id  # identifies the vector space (e.g. PCA projection) of a saved file
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.niter = niter
+        self.train_size = train_size or nlist * 64
+        self.min_train_size = min_train_size or nlist * 8
+        self.seed = seed
+        self.centroids = None
+        self._assign = np.empty(0, dtype=np.int32)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def _reserve(self, needed):
+        super()._reserve(needed)
+        capacity = self._vectors.shape[0]
+        if self._assign.shape[0] < capacity:
+            assign = np.full(capacity, -1, dtype=np.int32)
+            assign[:self._size] = self._assign[:self._size]
+            self._assign = assign
+
+    def _nearest_lists(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def train(self):
+        """Fit the coarse quantizer with spherical k-means on a sample of rows"""
+        with self._lock:
+            n = self._size
+            if n < max(self.min_train_size, self.nlist):
+                return False
+            rng = np.random.default_rng(self.seed)
+            sample_rows = rng.choice(n, size=min(n, self.train_size), replace=False)
+            sample = self._vectors[sample_rows]
+
+            centroids = sample[rng.choice(sample.shape[0], size=self.nlist, replace=False)].copy()
+            for _ in range(self.niter):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                counts = np.bincount(labels, minlength=self.nlist)
+                empty = counts == 0
+                if empty.any():
+                    # Re-seed empty buckets from random sample points
+                    sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                centroids = (sums / norms).astype(np.float32)
+
+            self.centroids = centroids
+            self._assign[:n] = self._nearest_lists(self._vectors[:n])
+            return True
+
+    def build(self, item_ids, vectors):
+        with self._lock:
+            super().build(item_ids, vectors)
+            self.centroids = None
+            if self._vectors is not None:
+                self._assign = np.full(self._vectors.shape[0], -1, dtype=np.int32)
+            self.train()
+
+    def upsert(self, item_id, vector):
+        with self._lock:
+            if not super().upsert(item_id, vector):
+                return False
+            row = self._positions[item_id]
+            if self.trained:
+                self._assign[row] = self._nearest_lists(self._vectors[row:row + 1])[0]
+            elif self._size >= max(self.min_train_size, self.nlist):
+                # Built below min_train_size: train once enough items have arrived
+                self.train()
+            return True
+
+    def remove(self, item_id):
+        with self._lock:
+            row = self._positions.get(item_id)
+            last = self._size - 1
+            if not super().remove(item_id):
+                return False
+            if row != last:
+                self._assign[row] = self._assign[last]
+            return True
+
+    def search(self, query, k=5, threshold=None, exclude_ids=(), allowed_ids=None):
+        if not self.trained or allowed_ids is not None:
+            # A pruned candidate set is scored exactly: no recall lost to the probe
+            return super().search(query, k=k, threshold=threshold, exclude_ids=exclude_ids, allowed_ids=allowed_ids)
+        unit = self.normalize(query)
+        if unit is None or k <= 0:
+            return []
+        with self._lock:
+            if self._size == 0 or unit.shape[0] != self.dim:
+                return []
+            probe = np.zeros(self.nlist, dtype=bool)
+            nprobe = min(self.nprobe, self.nlist)
+            probe[np.argpartition(-(self.centroids @ unit), nprobe - 1)[:nprobe]] = True
+            rows = np.flatnonzero(probe[self._assign[:self._size]])
+            scores = self._vectors[rows] @ unit
+            item_ids = self._item_ids[rows]
+
+        excluded = set(exclude_ids)
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, min(k + len(excluded), scores.shape[0]) - 1)
+            top = top[:min(k + len(excluded), scores.shape[0])]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        results = []
+        for pos in top:
+            item_id = int(item_ids[pos])
+            if item_id in excluded:
+                continue
+            score = float(scores[pos])
+            if threshold is not None and score < threshold:
+                break
+            results.append((item_id, score))
+            if len(results) == k:
+                break
+        return results
+
+    def save(self, path):
+        """Write vectors, ids and the trained quantizer to an .npz file atomically"""
+        with self._lock:
+            n = self._size
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+            np.savez(
+                tmp_path,
+                vectors=self._vectors[:n] if n else np.empty((0, self.dim or 0), dtype=np.float32),
+                item_ids=self._item_ids[:n],
+                assign=self._assign[:n],
+                centroids=self.centroids if self.trained else np.empty((0, self.dim or 0), dtype=np.float32),
+                params=np.array([self.nlist, self.nprobe, self.space_id], dtype=np.int64)
+            )
+            os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Restore a saved index; returns False if the file is missing or unusable"""
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            vectors = data['vectors']
+            item_ids = data['item_ids']
+            assign = data['assign']
+            centroids = data['centroids']
+            saved_nlist = int(data['params'][0])
+            saved_space = int(data['params'][2]) if data['params'].shape[0] > 2 else 0
+        if vectors.shape[0] == 0 or saved_space != self.space_id:
+            return False
+        with self._lock:
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                return False
+            self.dim = vectors.shape[1]
+            self._vectors = None
+            self._size = 0
+            n = vectors.shape[0]
+            self._reserve(n)
+            self._vectors[:n] = vectors
+            self._item_ids[:n] = item_ids
+            self._positions = {int(item_id): row for row, item_id in enumerate(item_ids)}
+            self._size = n
+            if centroids.shape[0] == self.nlist == saved_nlist:
+                self.centroids = centroids.astype(np.float32)
+                self._assign[:n] = assign
+            else:
+                self.centroids = None
+                self.train()
+            self.loaded = True
+            return True
+
+
+class PartitionedIndex:
+    """
+    One sub-index per (item_type, item_status) partition, so a lost item is only
+    compared with pending found items and vice versa. Status changes move a
+    vector between partitions instead of rebuilding anything.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory  # callable returning an empty sub-index
+        self._partitions = {}
+        self._partition_of = {}  # item_id -> partition key
+        self.loaded = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return sum(len(index) for index in self._partitions.values())
+
+    def __contains__(self, item_id):
+        return item_id in self._partition_of
+
+    @property
+    def item_ids(self):
+        return set(self._partition_of)
+
+    def partition_of(self, item_id):
+        return self._partition_of.get(item_id)
+
+    def partition_size(self, key):
+        index = self._partitions.get(key)
+        return len(index) if index is not None else 0
+
+    def partition_keys(self):
+        return list(self._partitions)
+
+    def partition_sizes(self):
+        return {f"{item_type}/{item_status}": len(index)
+                for (item_type, item_status), index in self._partitions.items()}
+
+    def _partition(self, key):
+        index = self._partitions.get(key)
+        if index is None:
+            index = self._factory()
+            index.loaded = True
+            self._partitions[key] = index
+        return index
+
+    def build(self, rows):
+        """Replace the contents from (item_id, partition_key, vector) rows"""
+        grouped = {}
+        for item_id, key, vector in rows:
+            ids, vectors = grouped.setdefault(key, ([], []))
+            ids.append(item_id)
+            vectors.append(vector)
+        with self._lock:
+            self._partitions = {}
+            self._partition_of = {}
+            for key, (ids, vectors) in grouped.items():
+                index = self._factory()
+                index.build(ids, vectors)
+                self._partitions[key] = index
+                for item_id in ids:
+                    if item_id in index:
+                        self._partition_of[item_id] = key
+            self.loaded = True
+
+    def upsert(self, item_id, vector, key):
+        with self._lock:
+            current = self._partition_of.get(item_id)
+            if current is not None and current != key:
+                self._partitions[current].remove(item_id)
+                del self._partition_of[item_id]
+            if not self._partition(key).upsert(item_id, vector):
+                return False
+            self._partition_of[item_id] = key
+            return True
+
+    def move(self, item_id, key):
+        """Re-home an item after its type or status changed"""
+        with self._lock:
+            current = self._partition_of.get(item_id)
+            if current is None or current == key:
+                return False
+            vector = self._partitions[current].get_vector(item_id)
+            self._partitions[current].remove(item_id)
+            del self._partition_of[item_id]
+            if vector is not None and self._partition(key).upsert(item_id, vector):
+                self._partition_of[item_id] = key
+            return True
+
+    def remove(self, item_id):
+        with self._lock:
+            key = self._partition_of.pop(item_id, None)
+            if key is None:
+                return False
+            return self._partitions[key].remove(item_id)
+
+    def get_vector(self, item_id):
+        key = self._partition_of.get(item_id)
+        if key is None:
+            return None
+        return self._partitions[key].get_vector(item_id)
+
+    def search(self, query, partitions=None, k=5, threshold=None, exclude_ids=(), allowed_ids=None):
+        """Search the given partition keys (all partitions when None) and merge the results"""
+        with self._lock:
+            keys = list(self._partitions) if partitions is None else [key for key in partitions if key in self._partitions]
+            indexes = [self._partitions[key] for key in keys]
+        results = []
+        for index in indexes:
+            results.extend(index.search(query, k=k, threshold=threshold, exclude_ids=exclude_ids, allowed_ids=allowed_ids))
+        results.sort(key=lambda hit: hit[1], reverse=True)
+        return results[:k]
+
+    @staticmethod
+    def partition_path(path, key):
+        root, ext = os.path.splitext(path)
+        return f"{root}.{key[0]}.{key[1]}{ext}"
+
+    @staticmethod
+    def delete_saved(path):
+        """Remove every saved partition file for this index path"""
+        directory, name = os.path.split(path)
+        directory = directory or '.'
+        root, ext = os.path.splitext(name)
+        if not os.path.isdir(directory):
+            return 0
+        removed = 0
+        for filename in os.listdir(directory):
+            if filename.startswith(f"{root}.") and filename.endswith(ext):
+                os.remove(os.path.join(directory, filename))
+                removed += 1
+        return removed
+
+    def save(self, path):
+        """Persist every partition whose backend supports it"""
+        with self._lock:
+            for key, index in self._partitions.items():
+                if hasattr(index, 'save') and len(index):
+                    index.save(self.partition_path(path, key))
+
+    def load(self, path, keys):
+        """Restore saved partitions; returns True if any partition was loaded"""
+        with self._lock:
+            loaded_any = False
+            for key in keys:
+                index = self._factory()
+                if hasattr(index, 'load') and index.load(self.partition_path(path, key)):
+                    self._partitions[key] = index
+                    for item_id in index._positions:
+                        self._partition_of[item_id] = key
+                    loaded_any = True
+            self.loaded = loaded_any
+            return loaded_any
+
+
+INDEX_BACKENDS = {
+    'exact': EmbeddingIndex,
+    'ivf': IVFIndex,
+}
+
+
+def create_index(backend='exact', **options):
+    """Build an empty index for the configured backend name"""
+    try:
+        index_class = INDEX_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown visual index backend '{backend}'")
+    if index_class is EmbeddingIndex:
+        options = {key: value for key, value in options.items() if key in ('dim', 'initial_capacity')}
+    return index_class(**options)
@@ -0,0 +1,47 @@
+import argparse
+from app import app
+from modules.matching_simple import matching_engine
+from modules.pipeline import ai_enabled
+from modules.rematch import rematch_all
+
+def pending_embedding_rows():
+    """(item_id, vector) for pending items' embeddings, in the visual index's vector space"""
+    from modules.ai_processing import image_engine
+    for item_id, (item_type, item_status), vector in image_engine._load_embedding_rows():
+        if item_status == 'pending':
+            yield item_id, vector
+
+def rematch(args):
+    with app.app_context():
+        use_visual = not args.text_only and ai_enabled()
+        print(f"🔁 Re-matching pending items: text={matching_engine.similarity_measure} >= {matching_engine.similarity_threshold}"
+              f", visual={'>= ' + str(args.visual_threshold) if use_visual else 'off'}{' (dry run)' if args.dry_run else ''}")
+
+        def progress(done, total, stats):
+            print(f"   {done}/{total} lost items, {stats['pairs']} pairs, {stats['new_pairs']} new")
+
+        stats = rematch_all(
+            text_measure=matching_engine.similarity_measure,
+            text_threshold=matching_engine.similarity_threshold,
+            text_top_k=matching_engine.max_results,
+            embedding_rows=pending_embedding_rows() if use_visual else None,
+            visual_threshold=args.visual_threshold,
+            visual_top_k=args.visual_top_k,
+            chunk_size=args.chunk_size,
+            notify=not args.no_notify,
+            dry_run=args.dry_run,
+            progress=progress
+        )
+        print(f"✅ {stats}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Score every pending lost item against every pending found item and store new matches '
+                    '(run after changing the text threshold or engine, or enabling AI)')
+    parser.add_argument('--chunk-size', type=int, default=512, help='Lost items scored and committed per chunk')
+    parser.add_argument('--visual-threshold', type=float, default=0.60)
+    parser.add_argument('--visual-top-k', type=int, default=5, help='Visual matches kept per lost item')
+    parser.add_argument('--text-only', action='store_true', help='Skip image similarity')
+    parser.add_argument('--no-notify', action='store_true', help='Store matches without notifying anyone')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+    rematch(parser.parse_args())
@@ -0,0 +1,28 @@
+import time
+from app import app
+from modules.jobs import JobWorkerPool
+from modules.pipeline import warm_up_visual_engine
+
+def run_worker():
+    """Standalone job worker for deployments where the web server runs no worker threads"""
+    pool = JobWorkerPool(
+        app,
+        workers=max(app.config.get('JOB_WORKERS', 2), 1),
+        poll_interval=app.config.get('JOB_POLL_INTERVAL', 1.0),
+        max_attempts=app.config.get('JOB_MAX_ATTEMPTS', 3),
+        lease_seconds=app.config.get('JOB_LEASE_SECONDS', 600),
+        worker_timeout=app.config.get('JOB_WORKER_TIMEOUT_SECONDS', 90)
+    )
+    warm_up_visual_engine(app, background=False)
+    pool.start()
+    print("👷 Worker running. Press Ctrl+C to stop.")
+    
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("🛑 Stopping workers...")
+        pool.stop(timeout=30)
+
+if __name__ == '__main__':
+    run_worker()